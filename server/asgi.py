@@ -0,0 +1,7 @@
+"""The API for an ASGI server, e.g. `uvicorn asgi:application` (see hanabi/asgi.py)"""
+import os
+
+from hanabi import create_app
+from hanabi.asgi import AsyncApp
+
+application = AsyncApp(create_app(os.getenv('FLASK_CONFIG') or 'default'))
@@ -0,0 +1,103 @@
+"""Games/sec of the numpy batch engine against one GameState at a time, on one core.
+
+Both play the same kind of game: mostly hints and discards, with plays that are usually of a playable card, and
+invalid moves simply retried. Only the engines are timed: dealing and picking the moves are left out of both. Each
+side is run a few times and the best kept, since one core shared with anything else is noisy. Run from the server
+directory with
+
+    python -m benchmarks.batch_engine [games per batch]
+"""
+import random
+import sys
+import time
+
+import numpy as np
+
+from hanabi.batch import BatchGames
+from hanabi.exceptions import InvalidMove
+from hanabi.models import Card, GameState, Move, MoveType
+
+COLOURS = ['blue', 'green', 'red', 'white', 'yellow']
+NUM_PLAYERS = 3
+RUNS = 3
+
+
+def scalar_move(state):
+    hand = state.hands[state.turn]
+    roll = random.random()
+    if roll < 0.2:
+        playable = [i for i, card in enumerate(map(Card, hand)) if state.in_play[card.colour] + 1 == card.rank]
+        if playable and random.random() < 0.9:
+            return {'type': 'play', 'cardIndex': random.choice(playable)}
+        return {'type': 'play', 'cardIndex': random.randrange(max(len(hand), 1))}
+    if roll < 0.6:
+        return {'type': 'discard', 'cardIndex': random.randrange(max(len(hand), 1))}
+    if random.random() < 0.5:
+        return {'type': 'hint', 'rank': random.randint(1, 5), 'playerIndex': random.randint(1, NUM_PLAYERS - 1)}
+    return {'type': 'hint', 'colour': random.choice(COLOURS), 'playerIndex': random.randint(1, NUM_PLAYERS - 1)}
+
+
+def run_scalar(games):
+    """Games/sec of GameState.make_move, leaving out dealing and picking the moves"""
+    elapsed = 0
+    for seed in range(games):
+        random.seed(seed)
+        state = GameState(num_players=NUM_PLAYERS)
+        state.start()
+        while state.final_score is None:
+            move = Move(scalar_move(state), state.turn, NUM_PLAYERS)
+            start = time.perf_counter()
+            try:
+                state.make_move(move)
+            except (InvalidMove, IndexError):
+                pass
+            elapsed += time.perf_counter() - start
+    return games / elapsed
+
+
+def batch_moves(batch, rng):
+    """Moves for the slots in play, in the arrays BatchGames.step takes"""
+    live = batch.live
+    slots = np.arange(live)
+    turn = batch.turn[:live]
+    moving = turn == np.arange(NUM_PLAYERS)[:, None]
+    card = (batch.hands[:, :, :live] * moving[:, None]).sum(axis=0)
+    hand_size = np.count_nonzero(card, axis=0)
+    roll = rng.random((4, live))
+
+    kind = np.where(roll[0] < 0.2, MoveType.PLAY, np.where(roll[0] < 0.6, MoveType.DISCARD, MoveType.HINT))
+
+    # Plays are of a playable card nine times out of ten, when there is one
+    next_rank = batch.in_play[card // 10, slots] + 1
+    playable = (card != 0) & (next_rank == card % 10)
+    use_playable = (kind == MoveType.PLAY) & playable.any(axis=0) & (roll[1] < 0.9)
+    index = np.where(use_playable, np.argmax(playable, axis=0), (roll[1] * np.maximum(hand_size, 1)).astype(np.intp))
+
+    # Hints are of a random colour or rank to a random other player
+    by_colour = roll[2] < 0.5
+    value = (roll[2] * 10).astype(np.int8) % 5
+    hinted_player = (turn + 1 + (roll[3] * (NUM_PLAYERS - 1)).astype(np.int8)) % NUM_PLAYERS
+    return (kind.astype(np.int8), index.astype(np.int8), hinted_player.astype(np.int8),
+            np.where(by_colour, value, -1).astype(np.int8), np.where(by_colour, 0, value + 1).astype(np.int8))
+
+
+def run_batch(games):
+    """Games/sec of BatchGames.step, leaving out dealing and picking the moves"""
+    rng = np.random.default_rng(0)
+    batch = BatchGames.new(games, NUM_PLAYERS, rng=rng)
+    elapsed = 0
+    while batch.live:
+        moves = batch_moves(batch, rng)
+        start = time.perf_counter()
+        batch.step(*moves)
+        elapsed += time.perf_counter() - start
+    return games / elapsed
+
+
+if __name__ == '__main__':
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    scalar = max(run_scalar(max(games // 20, 100)) for _ in range(RUNS))
+    batch = max(run_batch(games) for _ in range(RUNS))
+    print('GameState:   %10.0f games/sec' % scalar)
+    print('BatchGames:  %10.0f games/sec (%d games per batch)' % (batch, games))
+    print('Speedup:     %10.1fx' % (batch / scalar))
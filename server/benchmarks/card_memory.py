@@ -0,0 +1,75 @@
+"""Memory and pickled size of hands as Card objects (as they were) against arrays of packed cards.
+
+Run from the server directory with
+
+    python -m benchmarks.card_memory
+"""
+import pickle
+import random
+import sys
+
+from hanabi.models import Colour, GameState
+from hanabi.models import card as card_module
+
+
+class OldCard:
+    """Card as it was before packing"""
+
+    def __init__(self, int_representation):
+        self.colour = Colour(int_representation // 10)
+        self.rank = int_representation % 10
+        self.known_colour = None
+        self.known_rank = False
+
+
+OldCard.__module__ = card_module.__name__
+OldCard.__qualname__ = 'Card'
+
+
+def deep_size(obj, seen=None):
+    """Bytes used by obj and everything it refers to, not counting shared objects like enum members and small ints"""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen or isinstance(obj, (Colour, int, type(None))):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__) + sum(deep_size(value, seen) for value in vars(obj).values())
+    return size
+
+
+def old_hands(state):
+    hands = []
+    for hand in state.hands:
+        hands.append([])
+        for packed in hand:
+            card = OldCard(packed & card_module.CARD_BITS)
+            card.known_colour = card.colour if random.random() < 0.3 else None
+            card.known_rank = random.random() < 0.3
+            hands[-1].append(card)
+    return hands
+
+
+def pickled_size(hands):
+    # Old hands have to be pickled as hanabi.models.card.Card, like the rows in the database
+    packed_card_class = card_module.Card
+    card_module.Card = OldCard
+    try:
+        return len(pickle.dumps(hands, pickle.HIGHEST_PROTOCOL))
+    finally:
+        card_module.Card = packed_card_class
+
+
+if __name__ == '__main__':
+    print('players  old memory  new memory  old pickle  new pickle')
+    for num_players in range(2, 6):
+        random.seed(num_players)
+        state = GameState(num_players=num_players)
+        state.start()
+        old = old_hands(state)
+
+        print('%7d  %9dB  %9dB  %9dB  %9dB' % (num_players, deep_size(old), deep_size(state.hands),
+                                               pickled_size(old), pickled_size(state.hands)))
@@ -0,0 +1,149 @@
+"""Idle event streams held by one worker, as threads under WSGI against coroutines under hanabi.asgi: the memory each
+costs, and how long a move takes to reach all of them. Run from the server directory with
+
+    python -m benchmarks.connections [sync streams] [async streams]
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault('TEST_DATABASE_URL', 'sqlite://')
+
+from hanabi import create_app, db
+from hanabi.asgi import AsyncApp
+from hanabi.models import Card, Game
+
+HINT = json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1})
+
+
+def rss():
+    """This process's resident memory in bytes"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+
+
+def make_app():
+    app = create_app('testing')
+    app.config.update(SERVER_NAME='localhost', GAME_CACHE_SIZE=1024, GAME_EVENTS_POLL=600)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Game(players=['id1', 'id2'], started=True, deck=[5, 4, 3] * 10,
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        db.session.remove()
+    return app
+
+
+def sync_streams(count):
+    """Each stream is a thread reading get_game_events, as a threaded WSGI server would run it"""
+    app = make_app()
+    client = app.test_client()
+    opened = threading.Semaphore(0)
+    received = threading.Semaphore(0)
+
+    def hold():
+        stream = iter(client.get('/api/v1/games/1/events', headers={'id': 'id1'}).response)
+        next(stream)
+        opened.release()
+        for chunk in stream:
+            if chunk.startswith(b'id'):
+                received.release()
+
+    # Small stacks, or ten thousand threads would need 80GB of address space
+    threading.stack_size(256 * 1024)
+    before = rss()
+    start = time.perf_counter()
+    for _ in range(count):
+        threading.Thread(target=hold, daemon=True).start()
+    for _ in range(count):
+        opened.acquire()
+    open_seconds = time.perf_counter() - start
+    memory = rss() - before
+
+    start = time.perf_counter()
+    client.put('/api/v1/games/1/action', headers={'Content-Type': 'application/json', 'id': 'id1'}, data=HINT)
+    for _ in range(count):
+        received.acquire()
+    return memory / count, open_seconds, time.perf_counter() - start
+
+
+def async_streams(count):
+    """Each stream is a coroutine in hanabi.asgi, talking to a client that never reads ahead"""
+    asgi = AsyncApp(make_app())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    disconnected = asyncio.Event()
+    received = []
+
+    def scope(method, path, headers):
+        return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'server': ('localhost', 80),
+                'headers': [(b'host', b'localhost')] + headers}
+
+    async def hold(opened):
+        requested = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b''}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message.get('body', b'').startswith(b'id'):
+                received.append(message)
+                if not opened.done():
+                    opened.set_result(None)
+
+        await asgi(scope('GET', '/api/v1/games/1/events', [(b'id', b'id1')]), receive, send)
+
+    async def move():
+        async def receive():
+            return {'type': 'http.request', 'body': HINT.encode('utf-8')}
+
+        async def send(message):
+            pass
+
+        await asgi(scope('PUT', '/api/v1/games/1/action', [(b'id', b'id1'), (b'content-type', b'application/json')]),
+                   receive, send)
+
+    async def run():
+        before = rss()
+        start = time.perf_counter()
+        opened = [loop.create_future() for _ in range(count)]
+        tasks = [asyncio.ensure_future(hold(future)) for future in opened]
+        await asyncio.gather(*opened)
+        open_seconds = time.perf_counter() - start
+        memory = rss() - before
+
+        del received[:]
+        start = time.perf_counter()
+        await move()
+        while len(received) < count:
+            await asyncio.sleep(0.001)
+        fan_out_seconds = time.perf_counter() - start
+
+        disconnected.set()
+        await asyncio.gather(*tasks)
+        return memory / count, open_seconds, fan_out_seconds
+
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        asgi.executor.shutdown()
+        loop.close()
+
+
+if __name__ == '__main__':
+    sync_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    async_count = int(sys.argv[2]) if len(sys.argv) > 2 else sync_count
+
+    print('%-6s %8s %14s %10s %12s' % ('mode', 'streams', 'KiB/stream', 'open (s)', 'fan-out (ms)'))
+    for mode, count, measure in [('async', async_count, async_streams), ('sync', sync_count, sync_streams)]:
+        memory, open_seconds, fan_out_seconds = measure(count)
+        print('%-6s %8d %14.1f %10.2f %12.1f' % (mode, count, memory / 1024, open_seconds, fan_out_seconds * 1000))
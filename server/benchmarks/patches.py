@@ -0,0 +1,59 @@
+"""Size of the response to a client one move behind, as the whole game against a patch from the revision it has (see
+hanabi.patches), over every move of 5 player bot games. Run from the server directory with
+
+    python -m benchmarks.patches [games]
+"""
+import json
+import random
+import sys
+from uuid import uuid4
+
+from hanabi import create_app
+from hanabi.models import Game, GameState, Move
+from hanabi.patches import diff
+from hanabi.serializers import compact_dumps, game_json
+from hanabi.simulation import CautiousPolicy
+
+STATE_COLUMNS = ['started', 'deck', 'hands', 'discard', 'in_play', 'hints', 'misfires', 'score', 'final_score',
+                 'last_turn', 'last_player', 'turn']
+
+
+def as_game(state, players):
+    game = Game(id=1, players=players, hard_mode=False, perfect_mode=False, chameleon_mode=False, public=True)
+    for column, value in game.state_values(state, STATE_COLUMNS).items():
+        setattr(game, column, value)
+    # Not from the database, so there's nothing to replay
+    game._replayed = True
+    return game
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    random.seed(0)
+    app = create_app('testing')
+    app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] = False
+
+    full = patched = moves = 0
+    with app.test_request_context(base_url='http://localhost/'):
+        for _ in range(count):
+            players = [uuid4().hex for _ in range(5)]
+            state = GameState(num_players=5)
+            state.start()
+            bot = CautiousPolicy(random.Random())
+            old = [json.loads(game_json(as_game(state, players), seat)) for seat in range(5)]
+            while True:
+                move = bot.choose_move(state)
+                if state.final_score is not None or move is None:
+                    break
+                state.make_move(Move(move, state.turn, 5))
+                game = as_game(state, players)
+                for seat in range(5):
+                    text = game_json(game, seat)
+                    new = json.loads(text)
+                    full += len(text)
+                    patched += len(compact_dumps(diff(old[seat], new)))
+                    old[seat] = new
+                moves += 5
+
+    print('%d responses, average bytes: whole game %.0f, patch %.0f (%.1fx smaller)' % (
+        moves, full / moves, patched / moves, full / patched))
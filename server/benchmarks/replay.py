@@ -0,0 +1,64 @@
+"""Size and read speed of replay files (see hanabi.replay), for bot games copied out to the given number.
+
+Run from the server directory with
+
+    python -m benchmarks.replay [games]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+from hanabi.models import GameState, Move
+from hanabi.replay import ReplayWriter, analyze, read_replays
+from hanabi.simulation import CautiousPolicy
+
+# Distinct games played by the bots, which are repeated to make up the count
+SAMPLE_GAMES = 200
+
+
+def sample_games():
+    games = []
+    for seed in range(SAMPLE_GAMES):
+        num_players = 2 + seed % 4
+        state = GameState(num_players=num_players)
+        state.start(random.Random(seed))
+        bot = CautiousPolicy(random.Random(seed))
+        codes = []
+        while state.final_score is None:
+            move_json = bot.choose_move(state)
+            if move_json is None:
+                break
+            move = Move(move_json, state.turn, num_players)
+            state.make_move(move)
+            codes.append(move.encode())
+        games.append((seed, False, False, False, num_players, state.final_score or 0, 3 - state.misfires, codes))
+    return games
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    games = sample_games()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'games.replay')
+        start = time.perf_counter()
+        with open(path, 'wb') as f:
+            writer = ReplayWriter(f)
+            for i in range(count):
+                writer.write(i + 1, *games[i % SAMPLE_GAMES])
+            writer.close()
+        write_seconds = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        start = time.perf_counter()
+        read = sum(1 for _ in read_replays(path))
+        read_seconds = time.perf_counter() - start
+
+        summary = analyze([path])
+
+    print('%d games, %.1f bytes per game' % (count, size / count))
+    print('write    %9.0f games/sec' % (count / write_seconds))
+    print('read     %9.0f games/sec' % (read / read_seconds))
+    print('analyze  %9.0f games/sec on %d processes' % (summary['gamesPerSecond'], summary['processes']))
@@ -0,0 +1,81 @@
+"""Time to write a game response as each player sees it, through Game.to_json and flask's json module against
+hanabi.serializers, and the same for the public games list.
+
+Games are 5 player games, from just dealt to nearly over. Run from the server directory with
+
+    python -m benchmarks.serialization [games]
+"""
+import random
+import sys
+import time
+from uuid import uuid4
+
+from flask import json, jsonify
+
+from hanabi import create_app
+from hanabi.models import Game, GameState, Move
+from hanabi.serializers import dumps, game_json, orjson
+from hanabi.simulation import RandomPolicy
+
+STATE_COLUMNS = ['started', 'deck', 'hands', 'discard', 'in_play', 'hints', 'misfires', 'score', 'final_score',
+                 'last_turn', 'last_player', 'turn']
+
+
+def sample_games(count):
+    games = []
+    for game_id in range(1, count + 1):
+        state = GameState(num_players=5)
+        state.start()
+        policy = RandomPolicy(random.Random())
+        for _ in range(random.randrange(50)):
+            if state.final_score is not None:
+                break
+            state.make_move(Move(policy.choose_move(state), state.turn, 5))
+
+        game = Game(id=game_id, players=[uuid4().hex for _ in range(5)], hard_mode=False, perfect_mode=False,
+                    chameleon_mode=False, public=True)
+        for column, value in game.state_values(state, STATE_COLUMNS).items():
+            setattr(game, column, value)
+        # Not from the database, so there's nothing to replay
+        game._replayed = True
+        games.append(game)
+    return games
+
+
+def summary(game):
+    return {'url': 'http://localhost/api/v1/games/%d' % game.id, 'chameleonMode': game.chameleon_mode,
+            'perfectMode': game.perfect_mode, 'hardMode': game.hard_mode, 'players': len(game.players)}
+
+
+def time_per_call(function, items):
+    start = time.perf_counter()
+    for item in items:
+        function(item)
+    return (time.perf_counter() - start) / len(items) * 1e6
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    random.seed(0)
+    app = create_app('testing')
+    # Nothing here touches the database, so there's nothing to commit when each request ends
+    app.config['SQLALCHEMY_COMMIT_ON_TEARDOWN'] = False
+    with app.test_request_context(base_url='http://localhost/'):
+        games = sample_games(count)
+        seats = [(game, seat) for game in games for seat in range(5)]
+        for game, seat in seats:
+            assert game_json(game, seat) == json.dumps(game.to_json(seat))
+
+        print('game, us/seat     to_json  serializers')
+        print('                 %8.1f  %11.1f' % (
+            time_per_call(lambda item: json.dumps(item[0].to_json(item[1])), seats),
+            time_per_call(lambda item: game_json(*item), seats)))
+
+        lobby = [[summary(game) for game in games[i:i + 50]] for i in range(0, len(games), 50)]
+        print()
+        print('50 game list, us  jsonify  serializers (orjson %s)' % ('installed' if orjson else 'not installed'))
+        print('pretty           %8.1f  %11.1f' % (time_per_call(lambda data: jsonify(data).get_data(), lobby),
+                                                  time_per_call(dumps, lobby)))
+    with app.test_request_context(base_url='http://localhost/', headers={'X-Requested-With': 'XMLHttpRequest'}):
+        print('compact          %8.1f  %11.1f' % (time_per_call(lambda data: jsonify(data).get_data(), lobby),
+                                                  time_per_call(dumps, lobby)))
@@ -0,0 +1,91 @@
+"""Encode/decode time and stored size of a game row's state columns, pickled (as PickleType stored them) against the
+binary encodings in hanabi.models.codec.
+
+Rows are taken from bot games at various points, from just dealt to nearly over. Run from the server directory with
+
+    python -m benchmarks.state_codec [rows]
+"""
+import pickle
+import random
+import sys
+import time
+from uuid import uuid4
+
+from hanabi.models import Colour, GameState, Move
+from hanabi.models.codec import DeckColumn, DiscardColumn, HandsColumn, InPlayColumn, PlayersColumn
+from hanabi.simulation import CautiousPolicy
+
+COLUMNS = {
+    'players': PlayersColumn(),
+    'deck': DeckColumn(),
+    'hands': HandsColumn(),
+    'discard': DiscardColumn(),
+    'in_play': InPlayColumn()
+}
+
+
+def sample_rows(count):
+    rows = []
+    while len(rows) < count:
+        num_players = random.randint(2, 5)
+        state = GameState(num_players=num_players)
+        state.start()
+        bot = CautiousPolicy(random.Random())
+
+        for _ in range(random.randrange(60)):
+            move = bot.choose_move(state)
+            if state.final_score is not None or move is None:
+                break
+            state.make_move(Move(move, state.turn, num_players))
+
+        rows.append({
+            'players': [uuid4().hex for _ in range(num_players)],
+            'deck': state.deck,
+            'hands': state.hands,
+            'discard': {colour: state.discard[colour] for colour in Colour},
+            'in_play': {colour: state.in_play[colour] for colour in Colour}
+        })
+    return rows
+
+
+def time_per_row(function, rows):
+    start = time.perf_counter()
+    for row in rows:
+        function(row)
+    return (time.perf_counter() - start) / len(rows) * 1e6
+
+
+def pickle_row(row):
+    return {name: pickle.dumps(value, pickle.HIGHEST_PROTOCOL) for name, value in row.items()}
+
+
+def unpickle_row(row):
+    return {name: pickle.loads(data) for name, data in row.items()}
+
+
+def encode_row(row):
+    return {name: COLUMNS[name].process_bind_param(value, None) for name, value in row.items()}
+
+
+def decode_row(row):
+    return {name: COLUMNS[name].process_result_value(data, None) for name, data in row.items()}
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    random.seed(0)
+    rows = sample_rows(count)
+    pickled = [pickle_row(row) for row in rows]
+    encoded = [encode_row(row) for row in rows]
+
+    print('column    pickle bytes  binary bytes')
+    for name in COLUMNS:
+        print('%-8s  %12.1f  %12.1f' % (name, sum(len(row[name]) for row in pickled) / count,
+                                        sum(len(row[name]) for row in encoded) / count))
+    print('row       %12.1f  %12.1f' % (sum(map(len, (data for row in pickled for data in row.values()))) / count,
+                                        sum(map(len, (data for row in encoded for data in row.values()))) / count))
+
+    print()
+    print('          pickle us/row  binary us/row')
+    print('encode    %13.1f  %13.1f' % (time_per_row(pickle_row, rows), time_per_row(encode_row, rows)))
+    print('decode    %13.1f  %13.1f' % (time_per_row(unpickle_row, pickled), time_per_row(decode_row, encoded)))
@@ -0,0 +1,231 @@
+"""Optional ownership of games by worker processes, turned on with the GAME_ACTORS setting.
+
+Each worker process listens on a unix socket in ACTOR_SOCKET_DIR, named after the process. The sockets in that
+directory are the workers that are up, and a game belongs to whichever of them a consistent hash of its id picks, so
+when a worker starts or stops only the games that hash to it change hands. A worker sends moves for games it doesn't
+own to the owner's socket. The owner keeps its games in memory and applies moves one at a time from a queue, so a
+move is an in-memory operation plus the write of the move itself, and workers never race each other for a game.
+
+Nothing here is needed for correctness: if ownership is briefly disputed while workers come and go, the version and
+move log checks on games still stop two moves landing in the same place.
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import os
+import queue
+import socket
+import stat
+import threading
+
+from hanabi import db
+from hanabi.exceptions import ActorUnavailable
+from hanabi.models import Game
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes, with each node at several points on the ring to even out the load"""
+
+    def __init__(self, nodes, replicas=64):
+        self.nodes = sorted(nodes)
+        points = sorted((_hash('%s:%d' % (node, i)), node) for node in self.nodes for i in range(replicas))
+        self.hashes = [point for point, _ in points]
+        self.owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self.hashes:
+            return None
+        return self.owners[bisect.bisect(self.hashes, _hash(str(key))) % len(self.hashes)]
+
+
+def private_directory(path):
+    """Make sure path is a directory only this user can get into. Messages through the sockets in it carry player ids
+    and seats the owner trusts, so nobody else may listen there or connect"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError('%s must be a directory owned by this user' % path)
+    if stat.S_IMODE(info.st_mode) != 0o700:
+        os.chmod(path, 0o700)
+
+
+def send(path, message, timeout=None):
+    """Send a message to the worker listening at path and return its reply. Raises socket.timeout if there's no reply
+    within timeout seconds, and ConnectionResetError if the worker hangs up without one"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path)
+        stream = connection.makefile('rwb')
+        stream.write(json.dumps(message).encode('utf-8') + b'\n')
+        stream.flush()
+        reply = stream.readline()
+        if not reply:
+            raise ConnectionResetError('%s closed the connection without replying' % path)
+        return json.loads(reply.decode('utf-8'))
+
+
+class ActorPool:
+    """The games owned by this worker, and the thread that makes their moves.
+
+    handle(pool, message) is called on the actor thread, inside an app context, for each message in turn, and returns
+    a json reply. Games it looks up with pool.game stay loaded in pool.session between messages.
+    """
+
+    def __init__(self, app, handle, socket_dir, name=None, timeout=None):
+        self.app = app
+        self.handle = handle
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+        self.name = name or str(os.getpid())
+        self.path = self.socket_path(self.name)
+        self.queue = queue.Queue()
+        self.session = None
+        self.games = {}
+
+        self._ring = None
+        self._ring_listing = None
+        self._listener = None
+
+    def socket_path(self, name):
+        return os.path.join(self.socket_dir, name + '.sock')
+
+    def start(self):
+        private_directory(self.socket_dir)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(64)
+
+        threading.Thread(target=self._accept, daemon=True).start()
+        threading.Thread(target=self._run, daemon=True).start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Stop taking messages and hand this worker's games to the others"""
+        if self._listener is None:
+            return
+        self._listener.close()
+        self._listener = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.queue.put(None)
+
+    def ring(self):
+        """The ring over the workers that are up, rebuilt whenever one starts or stops"""
+        listing = sorted(entry for entry in os.listdir(self.socket_dir) if entry.endswith('.sock'))
+        if listing != self._ring_listing:
+            self._ring = HashRing(entry[:-len('.sock')] for entry in listing)
+            self._ring_listing = listing
+        return self._ring
+
+    def submit(self, game_id, message):
+        """Have the owner of a game deal with a message about it, and return the reply. Raises ActorUnavailable if the
+        owner took the message but didn't answer"""
+        owner = self.ring().owner(game_id)
+        if owner is not None and owner != self.name:
+            try:
+                return send(self.socket_path(owner), message, self.timeout)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The owner died without cleaning up. Take its socket out of the ring and deal with this here
+                try:
+                    os.unlink(self.socket_path(owner))
+                except FileNotFoundError:
+                    pass
+            except (socket.timeout, ConnectionResetError, BrokenPipeError):
+                # The owner may have made the move before it went quiet, so making it here could make it twice
+                raise ActorUnavailable(owner)
+
+        return self.call(message)
+
+    def call(self, message):
+        """Queue a message for this worker's actor thread and wait for the reply"""
+        reply = queue.Queue(maxsize=1)
+        self.queue.put((message, reply))
+        return reply.get()
+
+    def game(self, game_id):
+        """A game owned by this worker, loaded the first time it's asked for"""
+        game = self.games.get(game_id)
+        if game is None:
+            game = self.session.query(Game).get(game_id)
+            if game is not None:
+                self.games[game_id] = game
+        return game
+
+    def forget(self, game_id):
+        """Drop a game from memory, e.g. because someone else changed it"""
+        game = self.games.pop(game_id, None)
+        if game is not None:
+            self.session.expunge(game)
+
+    def _accept(self):
+        while self._listener is not None:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        with connection:
+            stream = connection.makefile('rwb')
+            line = stream.readline()
+            if not line:
+                return
+            message = json.loads(line.decode('utf-8'))
+            stream.write(json.dumps(self.call(message)).encode('utf-8') + b'\n')
+            stream.flush()
+
+    def _run(self):
+        with self.app.app_context():
+            # Games stay loaded after their moves are committed
+            self.session = db.create_scoped_session({'expire_on_commit': False})
+
+            ring_listing = None
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    self.session.remove()
+                    return
+                message, reply = item
+
+                # Let go of games that now belong to another worker
+                ring = self.ring()
+                if self._ring_listing != ring_listing:
+                    ring_listing = self._ring_listing
+                    for game_id in [game_id for game_id in self.games if ring.owner(game_id) != self.name]:
+                        self.forget(game_id)
+
+                try:
+                    reply.put(self.handle(self, message))
+                except Exception:
+                    # Start again from the database rather than trust games a failed move may have left half made
+                    self.app.logger.exception('Actor failed on %r', message)
+                    self.session.rollback()
+                    self.session.expunge_all()
+                    self.games.clear()
+                    reply.put({'status': 500, 'body': {'error': 'internal error'}})
+
+
+_pools_lock = threading.Lock()
+
+
+def actor_pool(app, handle):
+    """This process's actor pool for the app, started the first time it's needed. Forked workers get their own"""
+    with _pools_lock:
+        pools = app.extensions.setdefault('game_actors', {})
+        pool = pools.get(os.getpid())
+        if pool is None:
+            pool = pools[os.getpid()] = ActorPool(app, handle, app.config['ACTOR_SOCKET_DIR'],
+                                                  timeout=app.config['ACTOR_TIMEOUT'])
+            pool.start()
+        return pool
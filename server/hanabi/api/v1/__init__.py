@@ -3,3 +3,4 @@ from flask import Blueprint
 api = Blueprint('api', __name__)
 
 from . import games
+from . import players
@@ -1,34 +1,230 @@
 from . import api
 
+import json
+import math
+import re
+from functools import wraps
+from types import SimpleNamespace
 from uuid import uuid4
 
-from flask import jsonify, url_for, request
+import queue
+
+from flask import Response, abort, current_app, jsonify, url_for, request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
 from hanabi import db
-from hanabi.exceptions import CannotJoinGame, CannotStartGame, InvalidMove
-from hanabi.models import Game, Move
+from hanabi.actors import actor_pool
+from hanabi.auth import seat_token, token_seat
+from hanabi.cache import cached_game, cached_games, game_cache, revision, warm_cache
+from hanabi.events import event_hub, event_id, format_event, lobby_feed
+from hanabi.exceptions import ActorUnavailable, CannotJoinGame, CannotStartGame, InvalidMove
+from hanabi.models import Game, LoggedMove, Move, Player
+from hanabi.patches import patch_log
+from hanabi.reaper import start_reaper
+from hanabi.serializers import JSON_STYLE, compact_dumps, dumps, game_json, game_response, game_url, jsonify_style
+
+
+# The columns game_summary needs
+SUMMARY_COLUMNS = [Game.id, Game.chameleon_mode, Game.perfect_mode, Game.hard_mode, Game.player_count]
+
+# Filters the lobby takes, and the columns they filter on
+MODE_FILTERS = {'hardMode': Game.hard_mode, 'perfectMode': Game.perfect_mode, 'chameleonMode': Game.chameleon_mode}
+
+
+# Ids players may choose for themselves, when they'd like to use the same one across games
+PLAYER_ID = re.compile('^[0-9A-Za-z_-]{1,64}$')
+GAME_ID = re.compile('^[0-9]{1,10}$')
 
 
 def game_summary(game):
     """The all games list only needs some information, not all"""
     return {
-        'url': url_for('api.get_specific_game', game_id=game.id, _external=True),
+        'url': game_url(game.id),
         'chameleonMode': game.chameleon_mode,
         'perfectMode': game.perfect_mode,
         'hardMode': game.hard_mode,
-        'players': len(game.players)
+        'players': game.player_count
     }
 
 
+def retry_on_conflict(view):
+    """Run the view again from the start if the game changes under it, up to CONFLICT_RETRIES times.
+
+    Updates to a game only apply if its version hasn't changed since it was read, so two requests that read the same
+    game can't both write it. Only for views that are safe to redo against whatever the game has become.
+    """
+    @wraps(view)
+    def retrying_view(*args, **kwargs):
+        for _ in range(current_app.config['CONFLICT_RETRIES']):
+            try:
+                return view(*args, **kwargs)
+            except StaleDataError:
+                db.session.rollback()
+
+        return jsonify({'error': 'game is busy, try again'}), 409
+    return retrying_view
+
+
+def player_seat(game, player_id):
+    """A player's seat in a game, or None if they're not in it"""
+    if player_id is None or player_id not in game.players:
+        return None
+    return game.players.index(player_id)
+
+
+def find_seat(game_id, game, player_id, token):
+    """The seat in a game of whoever has a player id or token, or None if they're not in it. A signed token says which
+    seat without the game, otherwise the id is looked for in the game's players"""
+    if token is not None:
+        return token_seat(current_app, token, game_id)
+    return player_seat(game, player_id)
+
+
+def request_seat(game_id, game=None):
+    """The seat in a game the request is from, going by its token or id header"""
+    return find_seat(game_id, game, request.headers.get('id'), request.headers.get('token'))
+
+
+def seat_headers(game, player_id):
+    """The headers telling a player who they are in a game they've made or joined"""
+    headers = {'Location': url_for('api.get_specific_game', game_id=game.id, _external=True), 'id': player_id}
+    token = seat_token(current_app, game.id, game.players.index(player_id))
+    if token is not None:
+        headers['token'] = token
+    return headers
+
+
+def open_games():
+    """Summaries of every game in the lobby, by id"""
+    rows = db.session.query(*SUMMARY_COLUMNS).filter_by(started=False, public=True).order_by(Game.id)
+    return {row.id: game_summary(row) for row in rows}
+
+
+def game_changed(game):
+    """Let the cache and anyone watching know a game has changed, once the change has been flushed"""
+    game_cache(current_app).invalidate(game.id)
+    event_hub(current_app).publish(game)
+    patch_log(current_app).record(game)
+    lobby_feed(current_app).publish(game.id, game_summary(game) if game.public and not game.started else None)
+
+
+def game_etag(game_revision, seat):
+    """An ETag for a game as seen from a seat, which changes whenever the game does"""
+    return '%s.%d' % (event_id(game_revision), seat)
+
+
+def parse_revision(text):
+    """A revision of a game as a client sends it back, from an event id or ETag, or None if it isn't one"""
+    try:
+        version, seq = text.split('.')[:2]
+        return int(version), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_game_id(value):
+    """A game id from a JSON request, which may be a number or a string of digits. Raises ValueError for anything
+    else, or for an id too big for the games table"""
+    if isinstance(value, str) and GAME_ID.match(value):
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value < 1 << 31:
+        raise ValueError('not a game id: %r' % (value,))
+    return value
+
+
+def parse_wait(text, longest):
+    """Seconds to long poll for, from a wait query parameter, at most longest. Raises ValueError unless it's a finite
+    number, as anything else would slip past the limit"""
+    if text is None:
+        return 0
+    wait = float(text)
+    if not math.isfinite(wait):
+        raise ValueError('wait must be a finite number of seconds')
+    return min(max(wait, 0), longest)
+
+
+def patch_response(game, since, seat):
+    """A response with the patch for a seat from revision since to the game as it is, or None if there isn't one"""
+    patch = patch_log(current_app).patch(game, since, seat)
+    if patch is None:
+        return None
+    response = Response(compact_dumps(patch), mimetype='application/json-patch+json')
+    response.set_etag(game_etag(revision(game), seat))
+    return response
+
+
+def move_summary(logged_move, player_offset, num_players):
+    """A logged move as the action request that made it, plus who made it"""
+    move = logged_move.move
+    json_move = move.to_json(num_players)
+    json_move['seq'] = logged_move.seq
+    json_move['player'] = (move.moving_player + player_offset) % num_players
+    if logged_move.card is not None:
+        json_move['card'] = {'colour': logged_move.card // 10, 'rank': logged_move.card % 10}
+    return json_move
+
+
 @api.route('/games', methods=['GET'])
 def get_games():
-    games = list(map(game_summary, Game.query.filter_by(started=False, public=True).all()))
-    return jsonify(games), 200
+    """A page of the public games that haven't started, oldest first. The Link header has the next page, if any"""
+    limit = min(max(request.args.get('limit', current_app.config['LOBBY_PAGE_SIZE'], type=int), 1),
+                current_app.config['LOBBY_MAX_PAGE_SIZE'])
+    after = request.args.get('after', type=int)
+
+    query = db.session.query(*SUMMARY_COLUMNS).filter_by(started=False, public=True)
+    filters = {}
+    for name, column in MODE_FILTERS.items():
+        value = request.args.get(name)
+        if value is not None:
+            filters[name] = value
+            query = query.filter(column == (value.lower() in ('true', '1')))
+    if after is not None:
+        query = query.filter(Game.id > after)
+
+    # One extra row says whether there's another page
+    rows = query.order_by(Game.id).limit(limit + 1).all()
+    games = list(map(game_summary, rows[:limit]))
+
+    headers = {}
+    if len(rows) > limit:
+        headers['Link'] = '<%s>; rel="next"' % url_for('api.get_games', after=rows[limit - 1].id, limit=limit,
+                                                       _external=True, **filters)
+    return Response(dumps(games), mimetype='application/json'), 200, headers
+
+
+@api.route('/games/events')
+def get_lobby_events():
+    app = current_app._get_current_object()
+    feed = lobby_feed(app)
+    subscriber, snapshot = feed.subscribe(open_games)
+    url_root = request.url_root
+
+    # The stream only needs the database again to look for changes made by other workers
+    db.session.remove()
+
+    def stream():
+        try:
+            yield snapshot
+            while True:
+                try:
+                    yield subscriber.get(timeout=app.config['GAME_EVENTS_POLL'])
+                except queue.Empty:
+                    with app.test_request_context(base_url=url_root):
+                        feed.refresh(open_games)
+                    yield ': keepalive\n\n'
+        finally:
+            feed.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @api.route('/games/new', methods=['POST'])
 def new_game():
-    admin_id = uuid4().hex
+    admin_id = request.headers.get('id')
+    if admin_id is not None and not PLAYER_ID.match(admin_id):
+        return jsonify({'error': 'Badly formed id'}), 400
     json = request.get_json() or {}
 
     hard_mode = json.get('hardMode') or False
@@ -37,55 +233,278 @@ def new_game():
     public = json.get('public')
 
     new_game_object = Game(
-        players=[admin_id],
+        players=[],
         perfect_mode=perfect_mode,
         chameleon_mode=chameleon_mode,
         hard_mode=hard_mode,
         public=public)
+    admin_id = new_game_object.add_player(admin_id, json.get('nickname'))
 
     db.session.add(new_game_object)
     db.session.commit()
+    game_changed(new_game_object)
+
+    return jsonify(new_game_object.to_json()), 201, seat_headers(new_game_object, admin_id)
+
+
+def bulk_players(json):
+    """The players to seat in each game of a bulk request, admin first, or None if they're badly formed. Games with
+    no players given get a new admin"""
+    seated = json.get('players') or []
+    if not isinstance(seated, list) or not all(isinstance(players, list) for players in seated):
+        return None
+    count = json.get('count', len(seated))
+    if not isinstance(count, int) or isinstance(count, bool) \
+            or not 0 < count <= current_app.config['BULK_MAX_GAMES'] or len(seated) > count:
+        return None
+
+    games = []
+    for players in seated + [[]] * (count - len(seated)):
+        if len(players) > 5 \
+                or not all(isinstance(player_id, str) and PLAYER_ID.match(player_id) for player_id in players) \
+                or len(set(players)) != len(players):
+            return None
+        games.append(players or [uuid4().hex])
+    return games
+
+
+@api.route('/games/bulk', methods=['POST'])
+def new_games():
+    """Make many games with the same settings at once, e.g. for a tournament. Everything is inserted in one
+    transaction: the games in one executemany, their ids read back with one SELECT on the batch they share, and their
+    seats in another executemany"""
+    json = request.get_json(silent=True)
+    games = bulk_players(json) if isinstance(json, dict) else None
+    seed = json.get('seed') if games is not None else None
+    if games is None or seed is not None and (not isinstance(seed, int) or not 0 <= seed < 1 << 31):
+        return jsonify({'error': 'Badly formed request'}), 400
+
+    settings = {
+        'hard_mode': bool(json.get('hardMode')),
+        'perfect_mode': bool(json.get('perfectMode')),
+        'chameleon_mode': bool(json.get('chameleonMode')),
+        'public': bool(json.get('public')),
+        'seed': seed,
+        'batch': uuid4().hex
+    }
+    rows = [dict(settings, players=players, player_count=len(players)) for players in games]
+
+    # Asking for the ids back with the insert would make it one statement per game, so they're read afterwards,
+    # in the order the games went in
+    db.session.bulk_insert_mappings(Game, rows)
+    ids = db.session.query(Game.id).filter(Game.batch == settings['batch']).order_by(Game.id)
+    for row, (game_id,) in zip(rows, ids):
+        row['id'] = game_id
+    db.session.bulk_insert_mappings(Player, [
+        {'game_id': row['id'], 'seat': seat, 'token': player_id}
+        for row in rows for seat, player_id in enumerate(row['players'])])
+    db.session.commit()
+
+    created = []
+    feed = lobby_feed(current_app)
+    for row in rows:
+        game = {'url': game_url(row['id']), 'id': row['players'][0], 'players': row['players']}
+        tokens = [seat_token(current_app, row['id'], seat) for seat in range(len(row['players']))]
+        if tokens[0] is not None:
+            game['tokens'] = tokens
+        created.append(game)
+        if settings['public']:
+            feed.publish(row['id'], game_summary(SimpleNamespace(**row)))
+
+    return Response(dumps(created), mimetype='application/json'), 201
+
+
+@api.before_app_first_request
+def warm_game_cache():
+    warm_cache(current_app)
 
-    return jsonify(new_game_object.to_json()), 201, \
-        {'Location': url_for('api.get_specific_game', game_id=new_game_object.id, _external=True),
-            'id': admin_id}
+
+@api.before_app_first_request
+def start_game_reaper():
+    start_reaper(current_app._get_current_object())
 
 
 @api.route('/games/<int:game_id>')
 def get_specific_game(game_id):
+    game = cached_game(current_app, game_id)
+    if game is None:
+        abort(404)
+
+    seat = request_seat(game_id, game)
+    if seat is None:
+        return jsonify({'error': 'id missing or not in game'}), 403
+
+    try:
+        wait = parse_wait(request.args.get('wait'), current_app.config['LONG_POLL_MAX'])
+    except ValueError:
+        return jsonify({'error': 'wait must be a number of seconds'}), 400
+
+    since = parse_revision(request.args.get('since'))
+    etag = game_etag(revision(game), seat)
+    response = None
+    if request.if_none_match.contains(etag):
+        # The client is up to date, so it either gets told that or waits for the next change
+        event = wait and event_hub(current_app).wait(current_app._get_current_object(), game, seat, wait)
+        if event:
+            if since is not None:
+                latest = cached_game(current_app, game_id)
+                if latest is not None and revision(latest) == event[0]:
+                    response = patch_response(latest, since, seat)
+            if response is None:
+                # Events are laid out on one line, and the response is laid out as jsonify would
+                response = Response(dumps(json.loads(event[1])), mimetype='application/json')
+                response.set_etag(game_etag(event[0], seat))
+        else:
+            response = Response(status=304)
+            response.set_etag(etag)
+    else:
+        if since is not None:
+            response = patch_response(game, since, seat)
+        if response is None:
+            # Keep the revision the client is getting, so it can ask for what's changed since
+            patch_log(current_app).record(game)
+            data = game_cache(current_app).rendered(game, (seat, request.url_root, jsonify_style()),
+                                                    lambda: game_response(game, seat).encode('utf-8'))
+            response = Response(data, mimetype='application/json')
+            response.set_etag(etag)
+
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Location'] = url_for('api.get_specific_game', game_id=game_id, _external=True)
+    return response
+
+
+@api.route('/games/batch', methods=['POST'])
+def get_many_games():
+    """Several games at once, each as get_specific_game would return it, from a list of game ids and who's asking"""
+    entries = request.get_json(silent=True)
+    try:
+        game_ids = [parse_game_id(entry['gameId']) for entry in entries]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Badly formed request'}), 400
+    if len(game_ids) > current_app.config['BATCH_MAX_GAMES']:
+        return jsonify({'error': 'Too many games'}), 400
+
+    games = cached_games(current_app, set(game_ids))
+    cache = game_cache(current_app)
+    parts = []
+    for game_id, entry in zip(game_ids, entries):
+        # Every entry is laid out as json.dumps would, which is how game_json writes games
+        game = games.get(game_id)
+        if game is None:
+            parts.append(json.dumps({'gameId': game_id, 'error': 'game not found'}, sort_keys=True).encode('utf-8'))
+            continue
+
+        seat = find_seat(game_id, game, entry.get('playerId'), entry.get('token'))
+        if seat is None:
+            error = {'gameId': game_id, 'error': 'id missing or not in game'}
+            parts.append(json.dumps(error, sort_keys=True).encode('utf-8'))
+        else:
+            parts.append(cache.rendered(game, (seat, request.url_root, JSON_STYLE),
+                                        lambda: game_json(game, seat).encode('utf-8')))
+
+    return Response(b'[' + b', '.join(parts) + b']', mimetype='application/json'), 200
+
+
+@api.route('/games/<int:game_id>/events')
+def get_game_events(game_id):
+    game = cached_game(current_app, game_id)
+    if game is None:
+        abort(404)
+
+    seat = request_seat(game_id, game)
+    if seat is None:
+        return jsonify({'error': 'id missing or not in game'}), 403
+
+    app = current_app._get_current_object()
+    hub = event_hub(app)
+    subscriber = hub.subscribe(game_id, seat)
+    hub.publish(game)
+    event = hub.current(game_id, seat)
+    last_event_id = request.headers.get('Last-Event-ID')
+    url_root = request.url_root
+
+    # The stream only needs the database again to look for changes made by other workers
+    db.session.remove()
+
+    def stream(event):
+        try:
+            if event_id(event[0]) != last_event_id:
+                yield format_event(event)
+
+            while not event[2]:
+                try:
+                    latest = subscriber.get(timeout=app.config['GAME_EVENTS_POLL'])
+                except queue.Empty:
+                    with app.test_request_context(base_url=url_root):
+                        hub.refresh(app, game_id)
+                    yield ': keepalive\n\n'
+                    continue
+
+                # Skip anything this stream has already sent
+                if latest[0] > event[0]:
+                    event = latest
+                    yield format_event(event)
+        finally:
+            hub.unsubscribe(game_id, subscriber)
+
+    return Response(stream(event), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api.route('/games/<int:game_id>/moves')
+def get_moves(game_id):
+    """A page of a game's moves, oldest first, after the move numbered after if given. The Link header has the next
+    page, if any"""
     game = Game.query.get_or_404(game_id)
 
-    player_id = request.headers.get('id')
-    if player_id not in game.players:
+    player_offset = request_seat(game_id, game)
+    if player_offset is None:
         return jsonify({'error': 'id missing or not in game'}), 403
 
-    return jsonify(game.to_json(game.players.index(player_id))), 200, \
-        {'Location': url_for('api.get_specific_game', game_id=game_id, _external=True)}
+    limit = min(max(request.args.get('limit', current_app.config['MOVES_PAGE_SIZE'], type=int), 1),
+                current_app.config['MOVES_MAX_PAGE_SIZE'])
+    after = request.args.get('after', 0, type=int)
+
+    # One extra row says whether there's another page
+    logged_moves = game.moves.filter(LoggedMove.seq > after).limit(limit + 1).all()
+    num_players = len(game.players)
+    moves = [move_summary(logged_move, player_offset, num_players) for logged_move in logged_moves[:limit]]
+
+    headers = {}
+    if len(logged_moves) > limit:
+        headers['Link'] = '<%s>; rel="next"' % url_for('api.get_moves', game_id=game_id, after=moves[-1]['seq'],
+                                                       limit=limit, _external=True)
+    return Response(dumps(moves), mimetype='application/json'), 200, headers
 
 
 @api.route('/games/<int:game_id>/join', methods=['PUT'])
+@retry_on_conflict
 def join_game(game_id):
     game = Game.query.get_or_404(game_id)
 
+    player_id = request.headers.get('id')
+    if player_id is not None and not PLAYER_ID.match(player_id):
+        return jsonify({'error': 'Badly formed id'}), 400
+    json = request.get_json(silent=True) or {}
+
     try:
-        new_id = game.add_player()
+        new_id = game.add_player(player_id, json.get('nickname'))
         db.session.add(game)
         db.session.flush()
+        game_changed(game)
 
-        return jsonify(game.to_json()), 200, \
-            {'Location': url_for('api.get_specific_game', game_id=game.id, _external=True),
-                'id': new_id}
+        return jsonify(game.to_json()), 200, seat_headers(game, new_id)
     except CannotJoinGame as c:
         return jsonify({'error': str(c)}), 500
 
 
 @api.route('/games/<int:game_id>/start', methods=['PUT'])
+@retry_on_conflict
 def start_game(game_id):
     game = Game.query.get_or_404(game_id)
 
     # Must be admin to start the game
-    request_id = request.headers.get('id')
-    if request_id != game.players[0]:
+    if request_seat(game_id, game) != 0:
         return jsonify({'error': 'must be admin to start the game'}), 403
 
     try:
@@ -93,6 +512,7 @@ def start_game(game_id):
         game.start()
         db.session.add(game)
         db.session.flush()
+        game_changed(game)
 
         return jsonify(game.to_json()), 200, \
             {'Location': url_for('api.get_specific_game', game_id=game.id, _external=True)}
@@ -100,35 +520,102 @@ def start_game(game_id):
         return jsonify({'error': str(c)}), 500
 
 
-@api.route('/games/<int:game_id>/action', methods=['PUT'])
-def make_move(game_id):
-    game = Game.query.get_or_404(game_id)
+def play_move(game, player, json):
+    """Have the player in a seat make a move in a game, and return the response body and status"""
 
     # Check that the player is in the game
-    player_id = request.headers.get('id')
-    if player_id not in game.players:
-        return jsonify({'error': 'id missing or not in game'}), 403
+    if player is None:
+        return {'error': 'id missing or not in game'}, 403
 
-    player = game.players.index(player_id)
     num_players = len(game.players)
 
-    # Parse json
-    json = request.get_json()
-
     # Make sure the json looks like we're expecting
     try:
         move = Move(json, player, num_players)
     except InvalidMove as i:
-        return jsonify({'error': str(i)}), 500
+        return {'error': str(i)}, 500
     except:
-        return jsonify({'error': 'Badly formed request'}), 400
+        return {'error': 'Badly formed request'}, 400
 
     try:
         game.make_move(move)
+    except InvalidMove as i:
+        return {'error': str(i)}, 500
+
+    return game.to_json(), 200
+
+
+def actor_move(pool, message):
+    """Make a move in a game this worker owns. Runs on the actor thread, one move at a time"""
+    game_id = message['gameId']
+    cached = game_id in pool.games
+    game = pool.game(game_id)
+    if game is None:
+        return {'status': 404, 'body': {'error': 'game not found'}}
+
+    seat = message.get('seat')
+    if seat is None:
+        seat = player_seat(game, message['playerId'])
+    with current_app.test_request_context(base_url=message['urlRoot']):
+        try:
+            body, status = play_move(game, seat, message['move'])
+            if status == 200:
+                pool.session.commit()
+        except (IntegrityError, StaleDataError):
+            # Someone outside this worker moved first, so what's in memory is out of date. The move can be flushed
+            # while it's being made as well as when it's committed
+            pool.session.rollback()
+            pool.forget(game_id)
+            return {'status': 409, 'body': {'error': 'another move was made first'}}
+        if status == 200:
+            game_changed(game)
+
+    if status != 200 or game.final_score is not None:
+        pool.forget(game_id)
+        if status != 200 and cached:
+            # The game may have been changed outside this worker since it was loaded, so check the move against the
+            # database before turning it down
+            pool.session.rollback()
+            return actor_move(pool, message)
+    return {'status': status, 'body': body}
+
+
+@api.route('/games/<int:game_id>/action', methods=['PUT'])
+def make_move(game_id):
+    if current_app.config['GAME_ACTORS']:
+        # Leave the game to the worker that owns it
+        try:
+            reply = actor_pool(current_app._get_current_object(), actor_move).submit(game_id, {
+                'gameId': game_id,
+                # A token is checked here, so the owner needn't look at the players
+                'playerId': None if 'token' in request.headers else request.headers.get('id'),
+                'seat': request_seat(game_id) if 'token' in request.headers else None,
+                'move': request.get_json(),
+                'urlRoot': request.url_root
+            })
+        except ActorUnavailable:
+            game_cache(current_app).invalidate(game_id)
+            return jsonify({'error': 'the game is unavailable; check whether the move was made before trying again'}), \
+                503
+        game_cache(current_app).invalidate(game_id)
+        headers = {'Location': url_for('api.get_specific_game', game_id=game_id, _external=True)} \
+            if reply['status'] == 200 else {}
+        return jsonify(reply['body']), reply['status'], headers
+
+    game = Game.query.get_or_404(game_id)
+    body, status = play_move(game, request_seat(game_id, game), request.get_json())
+    if status != 200:
+        return jsonify(body), status
+
+    try:
         db.session.add(game)
         db.session.flush()
+        game_changed(game)
 
-        return jsonify(game.to_json()), 200, \
+        return jsonify(body), 200, \
             {'Location': url_for('api.get_specific_game', game_id=game.id, _external=True)}
-    except InvalidMove as i:
-        return jsonify({'error': str(i)}), 500
+    except (IntegrityError, StaleDataError):
+        # Another move got in first, either to the same place in the move log or to the snapshot. This one was
+        # chosen without seeing it, so it isn't retried
+        db.session.rollback()
+        return jsonify({'error': 'another move was made first'}), 409
@@ -0,0 +1,30 @@
+from . import api
+
+from flask import jsonify, request
+
+from hanabi import db
+from hanabi.api.v1.games import SUMMARY_COLUMNS, game_summary
+from hanabi.models import Game, Player
+
+
+def player_game_summary(row):
+    """A game in a player's list: the lobby summary, plus where it's got to and where they sit"""
+    json_game = game_summary(row)
+    json_game.update({
+        'seat': row.seat,
+        'nickname': row.nickname,
+        'started': row.started,
+        'finalScore': row.final_score
+    })
+    return json_game
+
+
+@api.route('/players/me/games')
+def get_my_games():
+    player_id = request.headers.get('id')
+    if not player_id:
+        return jsonify({'error': 'id missing'}), 403
+
+    rows = db.session.query(Player.seat, Player.nickname, Game.started, Game.final_score, *SUMMARY_COLUMNS) \
+        .join(Game, Game.id == Player.game_id).filter(Player.token == player_id).order_by(Player.game_id)
+    return jsonify(list(map(player_game_summary, rows))), 200
@@ -0,0 +1,376 @@
+"""Serving the API from an asyncio event loop, for workers holding many event streams and long polls.
+
+Under a threaded WSGI server every open stream or waiting long poll holds a thread. AsyncApp is an ASGI application
+that holds them as coroutines instead: the event streams and long polls are handled here, subscribing to the same
+EventHub and LobbyFeed as the Flask views with a queue that hands events to the loop, and the streams only go back to
+the thread pool for the checks refresh makes every GAME_EVENTS_POLL seconds. Every other request goes to the Flask app
+unchanged, on a pool of ASYNC_THREADS threads, so the routes, game engine and database access are the same as under
+WSGI and never block the loop.
+
+Run it with any ASGI server, e.g. `uvicorn asgi:application` from the server directory.
+"""
+import asyncio
+import io
+import re
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import parse_qsl, urlencode
+
+from hanabi.api.v1.games import open_games, parse_wait, request_seat
+from hanabi.cache import cached_game
+from hanabi.events import event_hub, event_id, format_event, lobby_feed
+
+GAME_EVENTS_PATH = re.compile(r'^/api/v1/games/(\d+)/events$')
+LOBBY_EVENTS_PATH = '/api/v1/games/events'
+GAME_PATH = re.compile(r'^/api/v1/games/(\d+)$')
+
+STREAM_HEADERS = [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                  (b'x-accel-buffering', b'no')]
+
+
+class Handoff:
+    """Hands items put from other threads to queues on an event loop. A change to a game is put on every stream
+    watching it at once, so the loop is woken once for everything put since it last looked, not once per item"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def put(self, queue, item):
+        with self._lock:
+            self._pending.append((queue, item))
+            wake = len(self._pending) == 1
+        if wake:
+            self.loop.call_soon_threadsafe(self._deliver)
+
+    def _deliver(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for queue, item in pending:
+            queue.deliver(item)
+
+
+class LoopQueue:
+    """A subscriber for EventHub and LobbyFeed, for a coroutine to get from"""
+
+    def __init__(self, handoff):
+        self.handoff = handoff
+        self._items = deque()
+        self._waiter = None
+
+    def put(self, item):
+        self.handoff.put(self, item)
+
+    def deliver(self, item):
+        self._items.append(item)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def get(self, timeout):
+        """The next item, or None after timeout seconds"""
+        if not self._items:
+            loop = self.handoff.loop
+            self._waiter = waiter = loop.create_future()
+            timer = loop.call_later(timeout, lambda: waiter.done() or waiter.set_result(None))
+            try:
+                await waiter
+            finally:
+                timer.cancel()
+                self._waiter = None
+        return self._items.popleft() if self._items else None
+
+
+@lru_cache(maxsize=256)
+def encoded_event(event):
+    """An event as sent, encoded once however many streams send it"""
+    return format_event(event).encode('utf-8')
+
+
+def wsgi_environ(scope, body, query_string=None):
+    """The WSGI environ for an ASGI http request, with the whole body already read"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': (scope.get('query_string', b'') if query_string is None else query_string).decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = environ[key] + ',' + value if key in environ else value
+
+    # The body has been read whole, however it was sent
+    environ['CONTENT_LENGTH'] = str(len(body))
+    environ.pop('HTTP_TRANSFER_ENCODING', None)
+    return environ
+
+
+def without_wait(query_string):
+    """A query string with any wait parameter taken out"""
+    return urlencode([(key, value) for key, value in parse_qsl(query_string.decode('latin-1'), keep_blank_values=True)
+                      if key != 'wait']).encode('latin-1')
+
+
+def parse_etag(value):
+    """The revision and seat in a game's ETag, or None if it isn't one"""
+    try:
+        version, snapshot_seq, seat = map(int, value.strip('"').split('.'))
+    except ValueError:
+        return None
+    return (version, snapshot_seq), seat
+
+
+class AsyncApp:
+    """An ASGI application serving a Flask app made by create_app"""
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.executor = ThreadPoolExecutor(threads or app.config['ASYNC_THREADS'])
+        self._handoff = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+
+        path = scope['path']
+        if scope['method'] == 'GET':
+            match = GAME_EVENTS_PATH.match(path)
+            if match:
+                return await self.game_events(scope, receive, send, int(match.group(1)))
+            if path == LOBBY_EVENTS_PATH:
+                return await self.lobby_events(scope, receive, send)
+            match = GAME_PATH.match(path)
+            if match and b'wait' in dict(parse_qsl(scope.get('query_string', b''))):
+                return await self.long_poll(scope, receive, send, int(match.group(1)))
+
+        body = await self.read_body(receive)
+        await self.send_response(send, *await self.run(self.call_flask, wsgi_environ(scope, body)))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def subscriber(self):
+        loop = asyncio.get_event_loop()
+        if self._handoff is None or self._handoff.loop is not loop:
+            self._handoff = Handoff(loop)
+        return LoopQueue(self._handoff)
+
+    def run(self, function, *args):
+        return asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    @staticmethod
+    async def read_body(receive):
+        body = []
+        while True:
+            message = await receive()
+            body.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(body)
+
+    @staticmethod
+    async def send_response(send, status, headers, body):
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def call_flask(self, environ):
+        """Run a request through the Flask app. Returns the status, headers and whole body"""
+        response = []
+        body = []
+
+        def start_response(status, headers, exc_info=None):
+            response[:] = [status, headers]
+            return body.append
+
+        result = self.app(environ, start_response)
+        try:
+            body.extend(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        status, headers = response
+        return (int(status.split(' ', 1)[0]),
+                [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers], b''.join(body))
+
+    async def until_disconnected(self, receive, stream):
+        """Run a stream until it ends or the client goes away"""
+        task = asyncio.ensure_future(stream)
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await task
+        except asyncio.CancelledError:
+            # Only the client going away ends the stream quietly
+            if not watcher.done():
+                raise
+        finally:
+            watcher.cancel()
+
+    def open_game_stream(self, environ, game_id, subscriber):
+        """Subscribe to a game as get_game_events would. Returns the event the stream starts with, or None if the
+        request can't have a stream, for the Flask view to answer"""
+        with self.app.request_context(environ):
+            game = cached_game(self.app, game_id)
+            seat = None if game is None else request_seat(game_id, game)
+            if seat is None:
+                return None
+
+            hub = event_hub(self.app)
+            hub.subscribe(game_id, seat, subscriber)
+            hub.publish(game)
+            return hub.current(game_id, seat)
+
+    def refresh_game(self, environ, game_id):
+        with self.app.request_context(environ):
+            event_hub(self.app).refresh(self.app, game_id)
+
+    def refresh_lobby(self, environ):
+        with self.app.request_context(environ):
+            lobby_feed(self.app).refresh(open_games)
+
+    async def game_events(self, scope, receive, send, game_id):
+        environ = wsgi_environ(scope, b'')
+        hub = event_hub(self.app)
+        poll = self.app.config['GAME_EVENTS_POLL']
+        subscriber = self.subscriber()
+        try:
+            event = await self.run(self.open_game_stream, environ, game_id, subscriber)
+            if event is None:
+                return await self.send_response(send, *await self.run(self.call_flask, wsgi_environ(scope, b'')))
+
+            last_event_id = environ.get('HTTP_LAST_EVENT_ID')
+
+            async def stream(event):
+                if event_id(event[0]) != last_event_id:
+                    await send({'type': 'http.response.body', 'body': encoded_event(event), 'more_body': True})
+
+                while not event[2]:
+                    latest = await subscriber.get(poll)
+                    if latest is None:
+                        if hub.due(game_id):
+                            await self.run(self.refresh_game, environ, game_id)
+                        await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                        continue
+
+                    # Skip anything this stream has already sent
+                    if latest[0] > event[0]:
+                        event = latest
+                        await send({'type': 'http.response.body', 'body': encoded_event(event), 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+
+            await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+            await self.until_disconnected(receive, stream(event))
+        finally:
+            hub.unsubscribe(game_id, subscriber)
+
+    async def lobby_events(self, scope, receive, send):
+        environ = wsgi_environ(scope, b'')
+        feed = lobby_feed(self.app)
+        poll = self.app.config['GAME_EVENTS_POLL']
+        subscriber = self.subscriber()
+
+        def subscribe():
+            with self.app.request_context(environ):
+                return feed.subscribe(open_games, subscriber)[1]
+
+        try:
+            snapshot = await self.run(subscribe)
+
+            async def stream():
+                await send({'type': 'http.response.body', 'body': snapshot.encode('utf-8'), 'more_body': True})
+                while True:
+                    event = await subscriber.get(poll)
+                    if event is None:
+                        if feed.due():
+                            await self.run(self.refresh_lobby, environ)
+                        event = ': keepalive\n\n'
+                    await send({'type': 'http.response.body', 'body': event.encode('utf-8'), 'more_body': True})
+
+            await send({'type': 'http.response.start', 'status': 200, 'headers': STREAM_HEADERS})
+            await self.until_disconnected(receive, stream())
+        finally:
+            feed.unsubscribe(subscriber)
+
+    async def long_poll(self, scope, receive, send, game_id):
+        """GET /games/<id>?wait=, waiting here rather than in a thread. The Flask view answers without the wait, and if
+        that's a 304, the request waits on the game's channel and goes to the view again once the game changes"""
+        body = await self.read_body(receive)
+        query_string = scope.get('query_string', b'')
+        text = next(value for key, value in parse_qsl(query_string.decode('latin-1'), keep_blank_values=True)
+                    if key == 'wait')
+        try:
+            wait = parse_wait(text, self.app.config['LONG_POLL_MAX'])
+        except ValueError:
+            # The view refuses it the same way
+            return await self.send_response(send, *await self.run(self.call_flask, wsgi_environ(scope, body)))
+        query_string = without_wait(query_string)
+
+        response = await self.run(self.call_flask, wsgi_environ(scope, body, query_string))
+        status, headers = response[:2]
+        etag = parse_etag(dict(headers).get(b'etag', b'').decode('latin-1'))
+        if status == 304 and wait and etag is not None:
+            changed = await self.wait_for_change(wsgi_environ(scope, b''), game_id, *etag, timeout=wait)
+            if changed:
+                response = await self.run(self.call_flask, wsgi_environ(scope, body, query_string))
+        await self.send_response(send, *response)
+
+    async def wait_for_change(self, environ, game_id, game_revision, seat, timeout):
+        """Wait up to timeout seconds for a game to move on from a revision. Returns whether it did"""
+        loop = asyncio.get_event_loop()
+        hub = event_hub(self.app)
+        poll = self.app.config['GAME_EVENTS_POLL']
+        subscriber = self.subscriber()
+        hub.subscribe(game_id, seat, subscriber)
+        try:
+            # The channel may be new, or not have been checked in a while
+            await self.run(self.refresh_game, environ, game_id)
+            event = hub.current(game_id, seat)
+            if event is not None and event[0] > game_revision:
+                return True
+
+            deadline = loop.time() + timeout
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return False
+                event = await subscriber.get(min(remaining, poll))
+                if event is None:
+                    await self.run(self.refresh_game, environ, game_id)
+                elif event[0] > game_revision:
+                    return True
+        finally:
+            hub.unsubscribe(game_id, subscriber)
@@ -0,0 +1,32 @@
+"""Signed seat tokens.
+
+A seat token is a game id and a seat, signed with the app's SECRET_KEY. Players get one alongside their id when they
+make or join a game, and sending it in the token header instead of the id says which seat a request is from without
+looking at the game's players. Tokens are only handed out when SECRET_KEY is set.
+"""
+from itsdangerous import BadSignature, URLSafeSerializer
+
+
+def _serializer(app):
+    serializer = app.extensions.get('seat_tokens')
+    if serializer is None:
+        serializer = app.extensions['seat_tokens'] = URLSafeSerializer(app.config['SECRET_KEY'], salt='seat')
+    return serializer
+
+
+def seat_token(app, game_id, seat):
+    """A token for a seat in a game, or None if the app has no SECRET_KEY to sign it with"""
+    if not app.config['SECRET_KEY']:
+        return None
+    return _serializer(app).dumps([game_id, seat])
+
+
+def token_seat(app, token, game_id):
+    """The seat a token is for, or None if it isn't a valid token for the game"""
+    if not app.config['SECRET_KEY']:
+        return None
+    try:
+        token_game_id, seat = _serializer(app).loads(token)
+    except (BadSignature, TypeError, ValueError):
+        return None
+    return seat if token_game_id == game_id else None
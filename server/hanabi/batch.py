@@ -0,0 +1,360 @@
+"""A vectorised copy of the GameState rules for playing thousands of games at once.
+
+Every game in a batch has the same number of players and the same modes. Cards use the same 10 * colour + rank
+numbers as new_deck, and what a player knows about each card in their hand is kept beside it as the bits GameState
+packs above the number, shifted down to fit in an int8. This module needs numpy, which the server itself does not.
+
+Games live in slots, and most arrays have the slot as their last axis, so that a step works on long rows of int8s.
+Lookups and gathers cost many times more per element than arithmetic does, so a step picks out a player's hand, a card
+in it or the pile for a colour by multiplying by a mask and summing, rather than by indexing. Games that finish are
+moved out of the slots at the front now and then, so the games still being played stay together.
+"""
+from array import array
+
+import numpy as np
+
+from hanabi.models import Colour, GameState, MoveType
+from hanabi.models.card import CARD_BITS, HARD_RAINBOW_COPIES, KNOWN_COLOUR_SHIFT, KNOWN_RANK, RANK_COPIES
+
+NUM_COLOURS = len(Colour)
+RAINBOW = int(Colour.RAINBOW)
+MAX_HAND = 5
+DECK_WORDS = 8
+
+# Row numbers, for comparing against a value per game to get a mask with a row per hand slot or colour
+HAND_SLOTS = np.arange(MAX_HAND, dtype=np.int8)[:, None]
+COLOUR_ROWS = np.arange(NUM_COLOURS, dtype=np.int8)[:, None]
+
+HINT = int(MoveType.HINT)
+DISCARD = int(MoveType.DISCARD)
+
+# What a player knows about a card, as in GameState hands but without the number: the colour they've been told plus
+# one in the low three bits, and whether they've been told its rank above those
+KNOWN_RANK_BIT = KNOWN_RANK >> KNOWN_COLOUR_SHIFT
+KNOWN_RAINBOW = RAINBOW + 1
+
+# Compact once this share of the slots in play hold finished games
+COMPACT_AT = 1 / 16
+
+
+def deck_cards(hard_mode=False):
+    """The unshuffled deck, as new_deck would build it"""
+    deck = [10 * colour + rank for colour in range(5) for rank in [1, 1, 1, 2, 2, 3, 3, 4, 4, 5]]
+    if hard_mode:
+        deck.extend(50 + rank for rank in range(1, 6))
+    else:
+        deck.extend(50 + rank for rank in [1, 1, 1, 2, 2, 3, 3, 4, 4, 5])
+    return np.array(deck, dtype=np.int8)
+
+
+def pile_shift(colour, rank):
+    """Where the count of a card in a word of remaining copies starts"""
+    return 2 * (5 * colour + rank - 1)
+
+
+class BatchGames:
+    """The state of a batch of games, as numpy arrays.
+
+    Game i is in slot slots[i], and games[s] is the game in slot s. The games still being played are all in the
+    first live slots, which may also hold some that have just finished; step takes a move for each of those slots.
+    Hands and knowledge are indexed by player, then hand slot. Hands hold 0 in empty slots and are kept packed to the
+    left. Decks are indexed by slot, then card, with the top card last. The copies of each card not yet thrown away
+    are packed two bits a card into one word per game, at pile_shift. A final score for a game in progress and an
+    unset last player are -1.
+    """
+
+    def __init__(self, size, num_players, hard_mode=False, perfect_mode=False, chameleon_mode=False):
+        self.size = size
+        self.num_players = num_players
+        self.hard_mode = hard_mode
+        self.perfect_mode = perfect_mode
+        self.chameleon_mode = chameleon_mode
+        self.num_cards = 5 if num_players < 4 else 4
+
+        self.games = np.arange(size)
+        self.slots = np.arange(size)
+        self.live = size
+
+        # Copies of each card in the box, as in GameState
+        self.copies = np.array([RANK_COPIES] * NUM_COLOURS, dtype=np.int8)
+        if hard_mode:
+            self.copies[RAINBOW] = HARD_RAINBOW_COPIES
+        full = sum(int(self.copies[colour, rank]) << pile_shift(colour, rank)
+                   for colour in range(NUM_COLOURS) for rank in range(1, 6))
+        self.remaining = np.full(size, full, dtype=np.uint64)
+
+        # Everything else is a row or a block of rows of one int8 array, so that moving a game to another slot is a
+        # single swap
+        hand_rows = num_players * MAX_HAND
+        hands_at = 8 + 2 * NUM_COLOURS
+        self._board = np.zeros((hands_at + 2 * hand_rows, size), dtype=np.int8)
+        (self.hints, self.misfires, self.score, self.final_score, last_turn, self.last_player, self.turn,
+         self.deck_size) = self._board[:8]
+        self.last_turn = last_turn.view(bool)
+        self.in_play = self._board[8:8 + NUM_COLOURS]
+        self.reachable = self._board[8 + NUM_COLOURS:hands_at]
+        self.hands = self._board[hands_at:hands_at + hand_rows].reshape(num_players, MAX_HAND, size)
+        self.knowledge = self._board[hands_at + hand_rows:].reshape(num_players, MAX_HAND, size)
+
+        self.hints[:] = 8
+        self.misfires[:] = 3
+        self.final_score[:] = -1
+        self.last_player[:] = -1
+        self.reachable[:] = 5
+
+        # A step only reads one card from each deck, so decks are packed eight cards to a little-endian word, in eight
+        # rows rather than sixty
+        self.deck = np.zeros((DECK_WORDS, size), dtype='<u8')
+
+        self._seats = np.arange(num_players, dtype=np.int8)[:, None]
+        self._slots = np.arange(size)
+        self._finished = 0
+
+    @classmethod
+    def new(cls, size, num_players, hard_mode=False, perfect_mode=False, chameleon_mode=False, rng=None):
+        """Shuffle and deal a batch of fresh games"""
+        rng = rng if rng is not None else np.random.default_rng()
+        batch = cls(size, num_players, hard_mode, perfect_mode, chameleon_mode)
+
+        cards = deck_cards(hard_mode)
+        shuffled = cards[np.argsort(rng.random((size, len(cards))), axis=1)]
+
+        # Deal from the end of the deck, one player at a time, like GameState.start
+        num_cards = batch.num_cards
+        undealt = len(cards) - num_cards * num_players
+        dealt = shuffled[:, undealt:][:, ::-1].reshape(size, num_players, num_cards)
+        batch.hands[:, :num_cards] = dealt.transpose(1, 2, 0)
+        decks = np.zeros((size, DECK_WORDS * 8), dtype=np.int8)
+        decks[:, :undealt] = shuffled[:, :undealt]
+        batch.deck[:] = decks.view('<u8').T
+        batch.deck_size[:] = undealt
+
+        batch.turn[:] = rng.integers(0, num_players, size)
+        return batch
+
+    @classmethod
+    def from_states(cls, states):
+        """Build a batch out of started GameStates, which must agree on players and modes"""
+        first = states[0]
+        batch = cls(len(states), first.num_players, first.hard_mode, first.perfect_mode, first.chameleon_mode)
+
+        for i, state in enumerate(states):
+            deck = np.zeros(DECK_WORDS * 8, dtype=np.int8)
+            deck[:len(state.deck)] = state.deck
+            batch.deck[:, i] = deck.view('<u8')
+            batch.deck_size[i] = len(state.deck)
+            for player, hand in enumerate(state.hands):
+                cards = np.array(hand, dtype=np.int16)
+                batch.hands[player, :len(hand), i] = cards & CARD_BITS
+                batch.knowledge[player, :len(hand), i] = cards >> KNOWN_COLOUR_SHIFT
+            remaining = int(batch.remaining[i])
+            for colour in Colour:
+                batch.in_play[colour, i] = state.in_play[colour]
+                batch.reachable[colour, i] = state.reachable[colour]
+                for rank in state.discard[colour]:
+                    remaining -= 1 << pile_shift(colour, rank)
+            batch.remaining[i] = remaining
+            batch.hints[i] = state.hints
+            batch.misfires[i] = state.misfires
+            batch.score[i] = state.score
+            batch.final_score[i] = -1 if state.final_score is None else state.final_score
+            batch.last_turn[i] = state.last_turn
+            batch.last_player[i] = -1 if state.last_player is None else state.last_player
+            batch.turn[i] = state.turn
+
+        return batch
+
+    def get_state(self, i):
+        """Game i as a GameState. Discard piles come back sorted, since the batch only keeps counts"""
+        slot = self.slots[i]
+        hands = []
+        for player in range(self.num_players):
+            held = self.hands[player, :, slot] != 0
+            numbers = self.hands[player, held, slot].astype(np.int16)
+            knowledge = self.knowledge[player, held, slot].astype(np.int16)
+            hands.append(array('H', (numbers | knowledge << KNOWN_COLOUR_SHIFT).tolist()))
+        remaining = int(self.remaining[slot])
+
+        return GameState(
+            num_players=self.num_players,
+            hard_mode=self.hard_mode,
+            perfect_mode=self.perfect_mode,
+            chameleon_mode=self.chameleon_mode,
+            started=True,
+            deck=self.deck[:, slot].copy().view(np.int8)[:self.deck_size[slot]].tolist(),
+            hands=hands,
+            discard=[[rank for rank in range(1, 6)
+                      for _ in range(self.copies[colour, rank] - (remaining >> pile_shift(colour, rank) & 3))]
+                     for colour in range(NUM_COLOURS)],
+            in_play=[int(rank) for rank in self.in_play[:, slot]],
+            hints=int(self.hints[slot]),
+            misfires=int(self.misfires[slot]),
+            score=int(self.score[slot]),
+            final_score=None if self.final_score[slot] == -1 else int(self.final_score[slot]),
+            last_turn=bool(self.last_turn[slot]),
+            last_player=None if self.last_player[slot] == -1 else int(self.last_player[slot]),
+            turn=int(self.turn[slot]))
+
+    @property
+    def in_progress(self):
+        """Which games are still being played, by game"""
+        return self.final_score[self.slots] == -1
+
+    @property
+    def max_score(self):
+        """The best score each game can still get, by game"""
+        return self.reachable.sum(axis=0)[self.slots]
+
+    def step(self, move_type, card_index, hinted_player, hint_colour, hint_rank):
+        """Make one move in each of the first live slots, for the player whose turn it is.
+
+        All arguments are arrays of small integers with an entry per slot in play: move_type holds MoveType values,
+        hinted_player is a player index, and a hint_colour of -1 or a hint_rank of 0 means that part of the hint is
+        unused. Moves that GameState would reject, including anything in a finished game, leave that game alone.
+        Negative card indexes are rejected rather than counted from the end of the hand.
+        Returns a boolean array of which moves were made. Slots may be reordered afterwards, so read games and live
+        again before the next step.
+        """
+        live = self.live
+        move_type = move_type.astype(np.int8, copy=False)
+        card_index = card_index.astype(np.int8, copy=False)
+        hinted_player = hinted_player.astype(np.int8, copy=False)
+        hint_colour = hint_colour.astype(np.int8, copy=False)
+        hint_rank = hint_rank.astype(np.int8, copy=False)
+
+        turn = self.turn[:live]
+        hints = self.hints[:live]
+        score = self.score[:live]
+        final_score = self.final_score[:live]
+        deck_size = self.deck_size[:live]
+        active = final_score == -1
+        hinting = move_type == HINT
+        discarding = move_type == DISCARD
+
+        # Each move reads and changes one hand: the mover's for a play or discard, the hinted player's for a hint
+        target = turn + (hinted_player - turn) * hinting.view(np.int8)
+        seats = (target == self._seats).view(np.int8)[:, None]
+        hands = self.hands[:, :, :live]
+        knowledge = self.knowledge[:, :, :live]
+        hand = (hands * seats).sum(axis=0, dtype=np.int8)
+        known = (knowledge * seats).sum(axis=0, dtype=np.int8)
+
+        # Plays and discards. An empty slot or an index off the end of the hand picks out no card
+        card = (hand * (HAND_SLOTS == card_index).view(np.int8)).sum(axis=0, dtype=np.int8)
+        removing = active & ~hinting & (card != 0) & ~(discarding & (hints == 8))
+        colour = card // 10
+        rank = card - colour * 10
+
+        in_play = self.in_play[:, :live]
+        colours = (COLOUR_ROWS == colour).view(np.int8)
+        played = (in_play * colours).sum(axis=0, dtype=np.int8)
+        success = removing & ~discarding & (played + 1 == rank)
+        in_play += colours * success.view(np.int8)
+        score += success.view(np.int8)
+        won = success & (score == 30)
+
+        failed = removing & ~success
+        misfired = failed & ~discarding
+        misfires = self.misfires[:live]
+        misfires -= misfired.view(np.int8)
+        lost = misfired & (misfires == 0)
+
+        # Throwing away the last copy of a card caps its colour below that rank
+        shift = (colour * 10 + rank * 2 - 2).astype(np.uint64)
+        remaining = self.remaining[:live]
+        left = (remaining >> shift & 3).astype(np.int8)
+        remaining -= failed.astype(np.uint64) << shift
+        reachable = self.reachable[:, :live]
+        reach = (reachable * colours).sum(axis=0, dtype=np.int8)
+        dead = failed & (left == 1) & (played < rank) & (rank <= reach)
+        reachable += colours * ((rank - 1 - reach) * dead.view(np.int8))
+        if self.perfect_mode:
+            lost |= dead
+
+        # Take the card out, shifting the cards after it to the left. Hands stay full for as long as there are cards
+        # to draw, so a drawn card always goes in the last slot
+        first_moved = card_index + (MAX_HAND - card_index) * (~removing).view(np.int8)
+        after = (HAND_SLOTS >= first_moved).view(np.int8)
+        change = np.empty_like(hand)
+        np.subtract(hand[1:], hand[:-1], out=change[:-1])
+        np.negative(hand[-1], out=change[-1])
+        change *= after
+        known_change = np.empty_like(known)
+        np.subtract(known[1:], known[:-1], out=known_change[:-1])
+        np.negative(known[-1], out=known_change[-1])
+        known_change *= after
+        drawing = removing & (deck_size > 0)
+        # The word holding each top card is the only gather in a step. Empty decks point before the first word, and
+        # draw nothing from wherever that clips to
+        top_word = self.deck.reshape(-1).take((deck_size - 1 >> 3).astype(np.intp) * self.size + self._slots[:live],
+                                              mode='clip')
+        top = (top_word >> ((deck_size - 1 & 7) * 8).astype(np.uint64)).astype(np.int8)
+        change[self.num_cards - 1] += top * drawing.view(np.int8)
+        deck_size -= drawing.view(np.int8)
+
+        # Hints. Cards of a colour are numbered from 10 * colour + 1 to 10 * colour + 5, and a rank of 0 picks out
+        # only empty slots, so unused hint ranks are swapped for one no card has
+        hinting &= active & (hints > 0) & (hinted_player != turn)
+        if self.chameleon_mode:
+            hinting &= hint_colour != RAINBOW
+        colour_match = (hand - (hint_colour * 10 + 1)).view(np.uint8) < 5
+        rank_match = hand - hand // 10 * 10 == hint_rank + (hint_rank == 0).view(np.int8) * 9
+        touched = colour_match | rank_match
+        if self.chameleon_mode:
+            rainbow = (hand - (RAINBOW * 10 + 1)).view(np.uint8) < 5
+            touched |= rainbow
+
+        # Hints have to be about at least one card
+        hinting &= touched.any(axis=0)
+
+        colour_match &= hinting
+        rank_match &= hinting
+        known_colour = known & 7
+        hinted_colour = hint_colour + 1
+        hinted = known | rank_match.view(np.int8) * KNOWN_RANK_BIT
+        hinted += (hinted_colour - known_colour) * colour_match.view(np.int8)
+        if self.chameleon_mode:
+            # A rainbow card hinted two different colours must be rainbow
+            rainbow &= hinting
+            agrees = (known_colour == 0) | (known_colour == hinted_colour)
+            rainbow_colour = KNOWN_RAINBOW + (hinted_colour - KNOWN_RAINBOW) * agrees.view(np.int8)
+            hinted += (rainbow_colour - known_colour) * rainbow.view(np.int8)
+        known_change += hinted - known
+
+        hands += change * seats
+        knowledge += known_change * seats
+        hints += (failed & discarding).view(np.int8) - hinting.view(np.int8)
+
+        # Advance the turn, and end the game if that was the last player's last turn
+        moved = removing | hinting
+        last_turn = self.last_turn[:live]
+        last_player = self.last_player[:live]
+        over = moved & last_turn & (last_player == turn)
+        ended = over | lost | won
+        result = won.view(np.int8) * 30
+        result += (score - result) * over.view(np.int8)
+        final_score += (result + 1) * ended.view(np.int8)
+        if not self.perfect_mode:
+            last_round = moved & (deck_size == 0) & ~last_turn
+            last_turn |= last_round
+            last_player += (turn - last_player) * last_round.view(np.int8)
+        turn += moved.view(np.int8) - (moved & (turn == self.num_players - 1)).view(np.int8) * self.num_players
+
+        self._finished += np.count_nonzero(ended)
+        if self._finished > COMPACT_AT * live:
+            self._compact()
+        return moved
+
+    def _compact(self):
+        """Swap the finished games in the first live slots with games still being played from behind them"""
+        live = self.live
+        in_progress = self.final_score[:live] == -1
+        self.live = int(np.count_nonzero(in_progress))
+        self._finished = 0
+        finished = np.flatnonzero(~in_progress[:self.live])
+        playing = self.live + np.flatnonzero(in_progress[self.live:])
+
+        for values in [self._board, self.deck, self.remaining, self.games]:
+            values[..., finished], values[..., playing] = values[..., playing], values[..., finished]
+        self.slots[self.games[finished]] = finished
+        self.slots[self.games[playing]] = playing
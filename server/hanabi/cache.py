@@ -0,0 +1,187 @@
+"""An in-process cache of games for the read-only endpoints, so that polling an unchanged game doesn't query the
+database.
+
+Cached games are detached from any session with their move log already replayed, so reading them never loads
+anything, and each keeps its responses once they've been rendered, so polling it again is a lookup. Each worker has
+its own cache: writes through this worker invalidate it straight away, and GAME_CACHE_TTL bounds how long a game
+changed through another worker can be served stale.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import func
+
+from hanabi import db
+from hanabi.models import Game, LoggedMove
+
+# The most responses kept with each cached game, e.g. one for each seat, layout and url root
+MAX_RENDERS = 32
+
+
+def revision(game):
+    """How far along a game is. Versions count changes to the row and snapshot_seq (once replayed) counts moves"""
+    return game.version or 0, game.snapshot_seq or 0
+
+
+class GameCache:
+    """Games by id, dropping the least recently used past max_size and any older than ttl seconds"""
+
+    def __init__(self, max_size, ttl, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.renders = 0
+
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._games)
+
+    def get(self, game_id):
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is None or entry[0] < self.clock():
+                if entry is not None:
+                    del self._games[game_id]
+                self.misses += 1
+                return None
+
+            self._games.move_to_end(game_id)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, game):
+        """Cache a detached game, unless a later revision of it is already cached"""
+        if not self.max_size:
+            return
+
+        with self._lock:
+            entry = self._games.get(game.id)
+            if entry is not None and entry[1] > revision(game):
+                return
+
+            self._games[game.id] = (self.clock() + self.ttl, revision(game), game, {})
+            self._games.move_to_end(game.id)
+            while len(self._games) > self.max_size:
+                self._games.popitem(last=False)
+                self.evictions += 1
+
+    def rendered(self, game, key, render):
+        """The response render() makes for a game, kept with the game if it's cached. key is whatever else the
+        response depends on, such as the seat"""
+        with self._lock:
+            entry = self._games.get(game.id)
+        if entry is None or entry[2] is not game:
+            return render()
+
+        renders = entry[3]
+        data = renders.get(key)
+        if data is None:
+            data = render()
+            # Keys can come from the request, e.g. its Host header, so only so many are kept. Two requests may both
+            # render, but they'll make the same thing
+            if len(renders) < MAX_RENDERS:
+                renders[key] = data
+                self.renders += 1
+        return data
+
+    def invalidate(self, game_id):
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def stats(self):
+        return {'size': len(self._games), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'renders': self.renders}
+
+
+def game_cache(app):
+    cache = app.extensions.get('game_cache')
+    if cache is None:
+        cache = app.extensions['game_cache'] = GameCache(app.config['GAME_CACHE_SIZE'], app.config['GAME_CACHE_TTL'])
+    return cache
+
+
+def load_game(game_id):
+    """A game from the database, replayed and detached, ready to cache. None if there's no such game"""
+    game = Game.query.get(game_id)
+    if game is not None:
+        game.to_state()
+        db.session.expunge(game)
+    return game
+
+
+def load_games(game_ids):
+    """Games from the database by id, replayed, with one query for the games and one for their moves whatever the
+    number of games"""
+    games = {game.id: game for game in Game.query.filter(Game.id.in_(game_ids))}
+
+    unreplayed = [game_id for game_id, game in games.items() if not game._replayed]
+    if unreplayed:
+        logged_moves = {game_id: [] for game_id in unreplayed}
+        query = LoggedMove.query.join(Game, Game.id == LoggedMove.game_id) \
+            .filter(LoggedMove.game_id.in_(unreplayed), LoggedMove.seq > func.coalesce(Game.snapshot_seq, 0)) \
+            .order_by(LoggedMove.game_id, LoggedMove.seq)
+        for logged_move in query:
+            logged_moves[logged_move.game_id].append(logged_move)
+        for game_id in unreplayed:
+            games[game_id].replay(logged_moves[game_id])
+
+    return games
+
+
+def cached_game(app, game_id):
+    """Read through the cache. The game may be detached, so only for reading. Its moves have been replayed, so its
+    revision is up to date"""
+    cache = game_cache(app)
+    if not cache.max_size:
+        game = Game.query.get(game_id)
+        if game is not None:
+            game.to_state()
+        return game
+
+    game = cache.get(game_id)
+    if game is None:
+        game = load_game(game_id)
+        if game is not None:
+            cache.put(game)
+    return game
+
+
+def cached_games(app, game_ids):
+    """cached_game for many games, loading the ones that aren't cached together. Returns the games found by id"""
+    cache = game_cache(app)
+    if not cache.max_size:
+        return load_games(game_ids)
+
+    games = {}
+    for game_id in game_ids:
+        game = cache.get(game_id)
+        if game is not None:
+            games[game_id] = game
+
+    missing = [game_id for game_id in game_ids if game_id not in games]
+    if missing:
+        for game_id, game in load_games(missing).items():
+            db.session.expunge(game)
+            cache.put(game)
+            games[game_id] = game
+    return games
+
+
+def warm_cache(app):
+    """Load the most recent games in progress, which are the ones likely to be polled"""
+    cache = game_cache(app)
+    if not cache.max_size:
+        return
+
+    recent = Game.query.with_entities(Game.id).filter(Game.started.is_(True), Game.final_score.is_(None)) \
+        .order_by(Game.id.desc()).limit(min(app.config['GAME_CACHE_WARM'], cache.max_size))
+    for game_id, in recent:
+        game = load_game(game_id)
+        if game is not None:
+            cache.put(game)
@@ -1,4 +1,6 @@
 import os
+import tempfile
+from datetime import timedelta
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -6,6 +8,66 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
 
+    # How many moves a game makes between snapshots of its state
+    SNAPSHOT_INTERVAL = 20
+
+    # How many times to try joining or starting a game that other requests keep changing
+    CONFLICT_RETRIES = 3
+
+    # Whether each game's moves are made by one worker process that keeps it in memory (see hanabi.actors), and the
+    # directory the workers find each other in, which must belong to the user they run as. The temporary directory is
+    # shared between users on unix, so the default is named after the user there; Windows has no uids, but gives each
+    # user a temporary directory of their own
+    GAME_ACTORS = bool(os.environ.get('GAME_ACTORS'))
+    ACTOR_SOCKET_DIR = os.environ.get('ACTOR_SOCKET_DIR') or os.path.join(
+        tempfile.gettempdir(), ('hanabi-actors-%d' % os.getuid()) if hasattr(os, 'getuid') else 'hanabi-actors')
+
+    # How long, in seconds, to wait for the worker that owns a game to make a move sent to it
+    ACTOR_TIMEOUT = 10.0
+
+    # Games kept in memory for polling (0 turns the cache off), how many seconds a cached game may be served for, and
+    # how many recent games each worker loads when it starts
+    GAME_CACHE_SIZE = 1024
+    GAME_CACHE_TTL = 2.0
+    GAME_CACHE_WARM = 100
+
+    # How often, in seconds, event streams send a keepalive and check their game for changes made by other workers
+    GAME_EVENTS_POLL = 5.0
+
+    # How many recent revisions of how many recently seen games each worker keeps, to send clients only what's changed
+    # since the revision they have (0 games turns this off)
+    PATCH_GAMES = 1024
+    PATCH_HISTORY = 8
+
+    # Threads the asyncio server (see hanabi.asgi) runs views and database work on
+    ASYNC_THREADS = 32
+
+    # The longest a request for a game may wait for it to change, in seconds
+    LONG_POLL_MAX = 30
+
+    # Games per page of the lobby, unless the request asks for fewer or more, and the most it can ask for
+    LOBBY_PAGE_SIZE = 50
+    LOBBY_MAX_PAGE_SIZE = 200
+
+    # Moves per page of a game's history, unless the request asks for fewer or more, and the most it can ask for
+    MOVES_PAGE_SIZE = 100
+    MOVES_MAX_PAGE_SIZE = 500
+
+    # The most games one request for several games can ask for
+    BATCH_MAX_GAMES = 50
+
+    # The most games one request can create at once
+    BULK_MAX_GAMES = 1000
+
+    # Finished games are moved to the archive file once they've been over for ARCHIVE_AFTER, and games that haven't
+    # started are deleted once nobody has joined them for ABANDON_AFTER (see hanabi.reaper). Each worker reaps every
+    # REAP_INTERVAL seconds, or never if it's 0, in which case run manage.py reap instead
+    ARCHIVE_PATH = os.environ.get('ARCHIVE_PATH') or os.path.join(basedir, os.pardir, 'archive', 'games.jsonl.gz')
+    ARCHIVE_AFTER = timedelta(days=7)
+    ABANDON_AFTER = timedelta(days=1)
+    REAP_INTERVAL = 0
+    REAP_BATCH_SIZE = 500
+
     @staticmethod
     def init_app(app):
         pass
@@ -19,6 +81,7 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL')
+    GAME_CACHE_SIZE = 0
 
 
 class ProductionConfig(Config):
@@ -0,0 +1,315 @@
+"""Server-sent events for games, so players don't have to poll.
+
+Each worker has one hub. Every stream open on a game subscribes to the game's channel with the seat it's watching
+from, and when the game changes it is rendered once for each seat and the result handed to every stream on that seat,
+however many there are. Changes made through other workers are found by checking the game at most once every
+GAME_EVENTS_POLL seconds per channel, rather than once per stream.
+
+Events are ids of the form version.snapshot_seq (see hanabi.cache.revision) with the game as seen from the seat as
+data. Every event carries the whole state, so a client that comes back with a Last-Event-ID only needs the latest one,
+and doesn't need anything if it's already up to date.
+"""
+import queue
+import threading
+import time
+
+from hanabi import db
+from hanabi.cache import cached_game, revision
+from hanabi.serializers import compact_dumps, game_json
+
+
+def event_id(game_revision):
+    return '%d.%d' % game_revision
+
+
+def format_event(event):
+    return 'id: %s\ndata: %s\n\n' % (event_id(event[0]), event[1])
+
+
+def lobby_event(name, data):
+    return 'event: %s\ndata: %s\n\n' % (name, compact_dumps(data))
+
+
+class Channel:
+    """The streams open on one game, and the game as last rendered for each of its seats"""
+
+    def __init__(self):
+        # The seat each stream watches from, by its queue
+        self.subscribers = {}
+        self.revision = None
+        self.rendered = []
+        self.finished = False
+        self.checked = 0
+
+
+class EventHub:
+    """Fans game changes out to the streams watching them.
+
+    Events are (revision, data, finished). Streams get a queue from subscribe, which publish puts events on, and may see
+    an event more than once. Anything with a put method will do as the queue, e.g. to hand events to an event loop.
+    Publishing an older revision of a game than its channel has already seen does nothing, so it's safe to publish
+    whatever copy is to hand.
+    """
+
+    def __init__(self, poll, clock=time.monotonic):
+        self.poll = poll
+        self.clock = clock
+        self.renders = 0
+
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, game_id, seat, subscriber=None):
+        """Start a stream on a seat of a game. Events are put on subscriber, or a new queue, which is returned"""
+        if subscriber is None:
+            subscriber = queue.Queue()
+        with self._lock:
+            channel = self._channels.setdefault(game_id, Channel())
+            channel.subscribers[subscriber] = seat
+        return subscriber
+
+    def unsubscribe(self, game_id, subscriber):
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                return
+            channel.subscribers.pop(subscriber, None)
+            if not channel.subscribers:
+                del self._channels[game_id]
+
+    def subscribers(self, game_id):
+        with self._lock:
+            channel = self._channels.get(game_id)
+            return len(channel.subscribers) if channel is not None else 0
+
+    def render(self, game, seat):
+        self.renders += 1
+        return game_json(game, seat)
+
+    def publish(self, game):
+        """Send a game to the streams watching it. Rendering needs a request context, for the game's url"""
+        with self._lock:
+            if game.id not in self._channels:
+                return
+
+        # Replay the move log, if it hasn't been already, so that the revision counts every move
+        game.to_state()
+        game_revision = revision(game)
+        with self._lock:
+            channel = self._channels.get(game.id)
+            if channel is None or channel.revision is not None and game_revision <= channel.revision:
+                return
+
+        # Every seat is rendered, so that streams joining later can start from the channel
+        rendered = [self.render(game, seat) for seat in range(len(game.players))]
+        finished = game.final_score is not None
+
+        with self._lock:
+            # Another copy may have got in while this one was rendering
+            if channel.revision is not None and game_revision <= channel.revision:
+                return
+            channel.revision = game_revision
+            channel.rendered = rendered
+            channel.finished = finished
+            for subscriber, seat in channel.subscribers.items():
+                subscriber.put((game_revision, rendered[seat], finished))
+
+    def current(self, game_id, seat):
+        """The latest event published for a seat, or None if there's been nothing published since it subscribed"""
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None or channel.revision is None:
+                return None
+            return channel.revision, channel.rendered[seat], channel.finished
+
+    def wait(self, app, game, seat, timeout):
+        """Wait up to timeout seconds for a game to move on from the given copy of it, for long polling. Returns the
+        event for the change, or None if there wasn't one. Needs a request context"""
+        game_revision = revision(game)
+        subscriber = self.subscribe(game.id, seat)
+        try:
+            self.publish(game)
+            event = self.current(game.id, seat)
+
+            # Don't hold on to a connection while waiting
+            db.session.remove()
+
+            deadline = self.clock() + timeout
+            while event[0] <= game_revision:
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return None
+                try:
+                    event = subscriber.get(timeout=min(remaining, self.poll))
+                except queue.Empty:
+                    self.refresh(app, game.id)
+            return event
+        finally:
+            self.unsubscribe(game.id, subscriber)
+
+    def due(self, game_id):
+        """Whether refresh would check a game now"""
+        with self._lock:
+            channel = self._channels.get(game_id)
+            return channel is not None and self.clock() - channel.checked >= self.poll
+
+    def refresh(self, app, game_id):
+        """Check a game for changes made through other workers, unless it was checked in the last poll seconds"""
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None or self.clock() - channel.checked < self.poll:
+                return
+            channel.checked = self.clock()
+
+        try:
+            game = cached_game(app, game_id)
+            if game is not None:
+                self.publish(game)
+        finally:
+            # Streams are long lived, so don't keep a connection or stale copies of games between checks
+            db.session.remove()
+
+
+class LobbyFeed:
+    """The public games that haven't started, for lobby streams.
+
+    The lobby is loaded when the first stream subscribes and kept while any are open. Changes come from publish, as a
+    game's summary or None once it has left the lobby, and from refresh, which reloads the lobby to find changes made
+    through other workers. Each change is encoded once, and the same event handed to every stream.
+    """
+
+    def __init__(self, poll, clock=time.monotonic):
+        self.poll = poll
+        self.clock = clock
+        self.games = None
+        self.encodes = 0
+
+        self._subscribers = set()
+        self._snapshot = None
+        self._published = {}
+        self._checked = 0
+        self._lock = threading.Lock()
+
+        # Streams loading the lobby, and what's been published while they were
+        self._loading = 0
+        self._pending = {}
+
+    def subscribe(self, load, subscriber=None):
+        """Start a stream. Returns its queue (subscriber, if given) and the snapshot event it starts with. load()
+        returns the summaries of the games in the lobby by id, and needs a request context"""
+        if subscriber is None:
+            subscriber = queue.Queue()
+        with self._lock:
+            loading = self.games is None
+            if loading:
+                self._loading += 1
+
+        if loading:
+            # Without the lock, so publishers needn't wait on the database
+            loaded = self.clock()
+            try:
+                games = load()
+            except Exception:
+                with self._lock:
+                    self._loading -= 1
+                    if not self._loading:
+                        self._pending = {}
+                raise
+
+        with self._lock:
+            if loading:
+                self._loading -= 1
+                if self.games is None:
+                    # Anything published while loading may be newer than what was loaded
+                    for game_id, summary in self._pending.items():
+                        if summary is None:
+                            games.pop(game_id, None)
+                        else:
+                            games[game_id] = summary
+                    self._pending = {}
+                    self.games = games
+                    self._checked = loaded
+                elif not self._loading:
+                    self._pending = {}
+            self._subscribers.add(subscriber)
+            if self._snapshot is None:
+                self._snapshot = self._encode('snapshot', list(self.games.values()))
+            return subscriber, self._snapshot
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self.games = None
+                self._snapshot = None
+                self._published = {}
+
+    def publish(self, game_id, summary):
+        """A game has changed in this worker. summary is None if it's not (or no longer) in the lobby"""
+        with self._lock:
+            if self.games is not None:
+                self._published[game_id] = self.clock()
+                self._change(game_id, summary)
+            elif self._loading:
+                self._published[game_id] = self.clock()
+                self._pending[game_id] = summary
+
+    def due(self):
+        """Whether refresh would reload the lobby now"""
+        with self._lock:
+            return self.games is not None and self.clock() - self._checked >= self.poll
+
+    def refresh(self, load):
+        """Reload the lobby and send what's changed, unless it was reloaded in the last poll seconds"""
+        with self._lock:
+            if self.games is None or self.clock() - self._checked < self.poll:
+                return
+            self._checked = loaded = self.clock()
+
+        games = load()
+        with self._lock:
+            if self.games is None:
+                return
+
+            # Games published while the lobby was loading may be newer than what was loaded
+            recent = {game_id for game_id, published in self._published.items() if published >= loaded}
+            self._published = {game_id: self._published[game_id] for game_id in recent}
+            for game_id in [game_id for game_id in self.games if game_id not in games and game_id not in recent]:
+                self._change(game_id, None)
+            for game_id, summary in games.items():
+                if game_id not in recent:
+                    self._change(game_id, summary)
+
+    def _encode(self, name, data):
+        self.encodes += 1
+        return lobby_event(name, data)
+
+    def _change(self, game_id, summary):
+        old = self.games.get(game_id)
+        if summary == old:
+            return
+
+        if summary is None:
+            del self.games[game_id]
+            event = self._encode('remove', {'url': old['url']})
+        else:
+            self.games[game_id] = summary
+            event = self._encode('add' if old is None else 'update', summary)
+
+        self._snapshot = None
+        for subscriber in self._subscribers:
+            subscriber.put(event)
+
+
+def lobby_feed(app):
+    feed = app.extensions.get('lobby_feed')
+    if feed is None:
+        feed = app.extensions['lobby_feed'] = LobbyFeed(app.config['GAME_EVENTS_POLL'])
+    return feed
+
+
+def event_hub(app):
+    hub = app.extensions.get('game_events')
+    if hub is None:
+        hub = app.extensions['game_events'] = EventHub(app.config['GAME_EVENTS_POLL'])
+    return hub
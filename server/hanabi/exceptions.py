@@ -8,3 +8,7 @@ class CannotJoinGame(Exception):
 
 class CannotStartGame(Exception):
     pass
+
+
+class ActorUnavailable(Exception):
+    """The worker that owns a game didn't answer, so a move may or may not have been made"""
@@ -0,0 +1,113 @@
+"""Converting stored games from older formats"""
+from sqlalchemy import inspect, select, type_coerce
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.types import LargeBinary
+
+from hanabi import db
+from hanabi.models import Game, Player
+from hanabi.models.codec import StateColumn, is_legacy
+
+
+# What rows from before a column was added get in it, as SQL, for the columns that can't be left NULL
+BACKFILL = {
+    ('games', 'version'): '1',
+    ('games', 'snapshot_seq'): '0',
+    # Games from before updated count as old
+    ('games', 'updated'): "'1970-01-01 00:00:00'",
+}
+
+
+def upgrade_schema():
+    """Bring a database made by an older version up to date: create the tables it doesn't have, and add the columns
+    and indexes missing from the ones it does. Columns in BACKFILL that a version let be NULL are filled in. Returns
+    what was added, as table or table.column names. Safe to run more than once, but the ALTERs lock the tables they
+    change, so run it before starting the new version"""
+    engine = db.engine
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing:
+            table.create(engine)
+            added.append(table.name)
+            continue
+
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                ddl = str(CreateColumn(column).compile(dialect=engine.dialect))
+                if (table.name, column.name) in BACKFILL:
+                    ddl += ' DEFAULT ' + BACKFILL[table.name, column.name]
+                engine.execute('ALTER TABLE %s ADD COLUMN %s' % (table.name, ddl))
+                added.append('%s.%s' % (table.name, column.name))
+            elif (table.name, column.name) in BACKFILL:
+                engine.execute('UPDATE %s SET %s = %s WHERE %s IS NULL' % (
+                    table.name, column.name, BACKFILL[table.name, column.name], column.name))
+
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(engine)
+    return added
+
+
+def migrate_state(batch_size=500):
+    """Rewrite every game column still holding a pickle in its binary encoding, and count the players of games from
+    before player_count, committing after each batch of games. Returns the number of games changed. Safe to run more
+    than once, or on a live database"""
+    table = Game.__table__
+    columns = [column for column in table.columns if isinstance(column.type, StateColumn)]
+
+    # Read the raw bytes, so rows that are already converted needn't be decoded
+    query = select([table.c.id, table.c.player_count] + [type_coerce(column, LargeBinary) for column in columns]) \
+        .order_by(table.c.id).limit(batch_size)
+
+    migrated = 0
+    last_id = None
+    while True:
+        batch = query if last_id is None else query.where(table.c.id > last_id)
+        rows = db.session.execute(batch).fetchall()
+        if not rows:
+            return migrated
+
+        for row in rows:
+            values = {}
+            for column, data in zip(columns, row[2:]):
+                if data is not None and is_legacy(bytes(data)):
+                    values[column.name] = column.type.process_result_value(data, None)
+                if column.name == 'players' and row[1] is None:
+                    players = column.type.process_result_value(data, None)
+                    values['player_count'] = len(players) if players is not None else 0
+
+            if values:
+                # Converting a game isn't a change to it, so it keeps its place in the reaper's queue
+                db.session.execute(table.update().where(table.c.id == row[0]).values(updated=table.c.updated,
+                                                                                     **values))
+                migrated += 1
+
+        db.session.commit()
+        last_id = rows[-1][0]
+
+
+def index_players(batch_size=500):
+    """Add the seats of games from before the players table to it, committing after each batch of games. Returns the
+    number of games indexed. Safe to run more than once"""
+    indexed = 0
+    last_id = None
+    while True:
+        query = Game.query.filter(~Game.seats.any()).order_by(Game.id)
+        if last_id is not None:
+            query = query.filter(Game.id > last_id)
+        games = query.limit(batch_size).all()
+        if not games:
+            return indexed
+
+        for game in games:
+            for seat, player_id in enumerate(game.players):
+                db.session.add(Player(game_id=game.id, seat=seat, token=player_id))
+            if game.players:
+                indexed += 1
+
+        db.session.commit()
+        last_id = games[-1].id
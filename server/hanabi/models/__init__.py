@@ -1,3 +1,6 @@
 from hanabi.models.card import Colour, Card, new_deck
 from hanabi.models.move import Move, MoveType
+from hanabi.models.state import GameState
+from hanabi.models.move_log import LoggedMove
+from hanabi.models.player import Player
 from hanabi.models.game import Game
@@ -1,5 +1,15 @@
 from enum import IntEnum
-from random import shuffle
+import random
+
+# A card in a hand is a single small integer. The low six bits are the card's number as in the deck
+# (10 * colour + rank), the next three are the colour its holder has been told plus one (zero if they haven't
+# been told one), and the bit above that is whether they've been told its rank. A card nobody has hinted about is
+# therefore just its number, and a hand fits in an array('H').
+CARD_BITS = 0x3f
+KNOWN_COLOUR_SHIFT = 6
+KNOWN_COLOUR_BITS = 0x7 << KNOWN_COLOUR_SHIFT
+KNOWN_RANK = 1 << 9
+
 
 class Colour(IntEnum):
     BLUE = 0
@@ -9,15 +19,46 @@ class Colour(IntEnum):
     YELLOW = 4
     RAINBOW = 5
 
-class Card:
-    def __init__(self, int_representation):
-        self.colour = Colour(int_representation // 10)
-        self.rank = int_representation % 10
-        self.known_colour = None
-        self.known_rank = False
+
+COLOURS = list(Colour)
+
+# Copies of each rank of a colour in the box, indexed by rank
+RANK_COPIES = [0, 3, 2, 2, 2, 1]
+HARD_RAINBOW_COPIES = [0, 1, 1, 1, 1, 1]
+
+
+class Card(int):
+    """A read-only view of a packed card. Card(n) for a deck number n is that card with nothing known about it"""
+    __slots__ = ()
+
+    @classmethod
+    def pack(cls, number, known_colour=None, known_rank=False):
+        known_colour = 0 if known_colour is None else known_colour + 1
+        return cls(number | known_colour << KNOWN_COLOUR_SHIFT | (KNOWN_RANK if known_rank else 0))
+
+    @property
+    def colour(self):
+        return COLOURS[(self & CARD_BITS) // 10]
+
+    @property
+    def rank(self):
+        return (self & CARD_BITS) % 10
+
+    @property
+    def known_colour(self):
+        known_colour = (self & KNOWN_COLOUR_BITS) >> KNOWN_COLOUR_SHIFT
+        return COLOURS[known_colour - 1] if known_colour else None
+
+    @property
+    def known_rank(self):
+        return bool(self & KNOWN_RANK)
 
     def to_num(self):
-        return 10 * self.colour.value + self.rank
+        return self & CARD_BITS
+
+    def __reduce__(self):
+        # Pickle as the plain integer. Pickles that mention Card are from before cards were packed
+        return int, (int(self),)
 
     def to_json(self):
         return {
@@ -28,8 +69,15 @@ class Card:
         }
 
 
-def new_deck(hard_mode=False):
-    """Return a full, shuffled deck in number form"""
+class UnpackedCard:
+    """Cards as they were before being packed into integers, for reading hands pickled by older versions"""
+
+    def pack(self):
+        return Card.pack(10 * self.colour + self.rank, self.known_colour, self.known_rank)
+
+
+def new_deck(hard_mode=False, rng=random):
+    """Return a full, shuffled deck in number form, shuffled by rng (the random module unless given a Random)"""
     deck = []
     for colour in range(5):
         for rank in [1, 1, 1, 2, 2, 3, 3, 4, 4, 5]:
@@ -42,5 +90,5 @@ def new_deck(hard_mode=False):
         for rank in range(1, 6):
             deck.append(50 + rank)
 
-    shuffle(deck)
+    rng.shuffle(deck)
     return deck
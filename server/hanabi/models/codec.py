@@ -0,0 +1,174 @@
+"""Column types that store a game's state as compact bytes instead of pickles.
+
+Every value starts with a version byte, followed by a fixed layout for that kind of column:
+
+* deck: one byte per card number
+* hands: for each hand, its size and then its packed cards as little endian 16 bit ints
+* discard: for each colour, how many of each rank from 1 to 5 have been thrown away
+* in play: for each colour, the rank on top of its pile
+* players: for each player, 0x80 followed by 16 bytes for an id that is a uuid4().hex, otherwise the length of the id
+  and the id in utf-8
+
+Rows written when these columns were PickleType start with something other than a version byte, and are still read,
+so they can be converted at leisure (see hanabi.migrate).
+"""
+import pickle
+import re
+import sys
+from array import array
+from io import BytesIO
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+from hanabi.models.card import COLOURS, UnpackedCard
+
+VERSION = 1
+
+BIG_ENDIAN = sys.byteorder == 'big'
+UUID_HEX = re.compile('^[0-9a-f]{32}$')
+UUID_FLAG = 0x80
+
+
+class _Unpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # Hands written before cards were packed hold Card objects, which Card can no longer be unpickled as
+        if module == 'hanabi.models.card' and name == 'Card':
+            return UnpackedCard
+        return super().find_class(module, name)
+
+
+class HandsPickler:
+    dumps = staticmethod(pickle.dumps)
+
+    @staticmethod
+    def loads(data):
+        return _Unpickler(BytesIO(data)).load()
+
+
+def pack_hand(hand):
+    """A hand as an array of packed cards, whatever form it was stored in"""
+    return array('H', [card if isinstance(card, int) else card.pack() for card in hand])
+
+
+def is_legacy(data):
+    """Whether stored bytes are a pickle from before these encodings"""
+    return data[0] != VERSION
+
+
+class StateColumn(TypeDecorator):
+    """A versioned binary encoding. Subclasses fill in encode and decode, which don't see the version byte"""
+    impl = LargeBinary
+
+    legacy_loads = staticmethod(pickle.loads)
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return bytes([VERSION]) + self.encode(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+
+        # Some drivers hand back memoryviews
+        data = bytes(value)
+        if is_legacy(data):
+            return self.legacy_loads(data)
+        return self.decode(data[1:])
+
+    def encode(self, value):
+        raise NotImplementedError
+
+    def decode(self, data):
+        raise NotImplementedError
+
+
+class DeckColumn(StateColumn):
+    def encode(self, deck):
+        return bytes(deck)
+
+    def decode(self, data):
+        return list(data)
+
+
+class HandsColumn(StateColumn):
+    legacy_loads = staticmethod(HandsPickler.loads)
+
+    def encode(self, hands):
+        data = bytearray()
+        for hand in hands:
+            hand = pack_hand(hand)
+            if BIG_ENDIAN:
+                hand.byteswap()
+            data.append(len(hand))
+            data += hand.tobytes()
+        return bytes(data)
+
+    def decode(self, data):
+        hands = []
+        i = 0
+        while i < len(data):
+            size = data[i]
+            hand = array('H')
+            hand.frombytes(data[i + 1:i + 1 + 2 * size])
+            if BIG_ENDIAN:
+                hand.byteswap()
+            hands.append(hand)
+            i += 1 + 2 * size
+        return hands
+
+
+class DiscardColumn(StateColumn):
+    """Discard piles, as a dict of colour to ranks. Only the counts are stored, so the ranks come back sorted"""
+
+    def encode(self, discard):
+        data = bytearray(5 * len(COLOURS))
+        for colour, ranks in discard.items():
+            for rank in ranks:
+                data[5 * colour + rank - 1] += 1
+        return bytes(data)
+
+    def decode(self, data):
+        discard = {}
+        for colour in COLOURS:
+            pile = discard[colour] = []
+            for rank, count in enumerate(data[5 * colour:5 * colour + 5], 1):
+                if count:
+                    pile += [rank] * count
+        return discard
+
+
+class InPlayColumn(StateColumn):
+    def encode(self, in_play):
+        return bytes([in_play.get(colour, 0) for colour in COLOURS])
+
+    def decode(self, data):
+        return dict(zip(COLOURS, data))
+
+
+class PlayersColumn(StateColumn):
+    def encode(self, players):
+        data = bytearray()
+        for player in players:
+            if UUID_HEX.match(player):
+                data.append(UUID_FLAG)
+                data += bytes.fromhex(player)
+            else:
+                encoded = player.encode('utf-8')
+                if len(encoded) >= UUID_FLAG:
+                    raise ValueError('Player id too long: %r' % player)
+                data.append(len(encoded))
+                data += encoded
+        return bytes(data)
+
+    def decode(self, data):
+        players = []
+        i = 0
+        while i < len(data):
+            if data[i] == UUID_FLAG:
+                players.append(data[i + 1:i + 17].hex())
+                i += 17
+            else:
+                players.append(data[i + 1:i + 1 + data[i]].decode('utf-8'))
+                i += 1 + data[i]
+        return players
@@ -1,11 +1,17 @@
-from random import randint
+from datetime import datetime
+from random import Random, randrange
 from uuid import uuid4
 
-from flask import url_for
+from flask import current_app, url_for
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.mutable import MutableList
+from sqlalchemy.orm import validates
+from sqlalchemy.orm.attributes import flag_modified, set_committed_value
 
 from hanabi import db
-from hanabi.exceptions import CannotJoinGame, CannotStartGame, InvalidMove
-from hanabi.models import Colour, new_deck, MoveType, Card
+from hanabi.exceptions import CannotJoinGame
+from hanabi.models import Card, Colour, GameState, LoggedMove, Player
+from hanabi.models.codec import DeckColumn, DiscardColumn, HandsColumn, InPlayColumn, PlayersColumn, pack_hand
 
 
 def rotate(array, offset):
@@ -13,9 +19,20 @@ def rotate(array, offset):
 
 
 class Game(db.Model):
+    """A game as stored in the database.
+
+    The game info columns are a snapshot of the game after its first snapshot_seq moves, and the moves since then are
+    in the move log. to_state replays those moves, so anything wanting the current game should go through it rather
+    than the columns. Making a move only inserts into the log, apart from every SNAPSHOT_INTERVAL moves and at the end
+    of the game, when the snapshot is rewritten, and then only the columns that have changed since the last one are
+    written.
+    """
     __tablename__ = 'games'
     id = db.Column(db.Integer, primary_key=True)
 
+    # The lobby lists open games in id order
+    __table_args__ = (db.Index('ix_games_lobby', 'started', 'public', 'id'),)
+
     # Settings
     hard_mode = db.Column(db.Boolean, default=False)
     perfect_mode = db.Column(db.Boolean, default=False)
@@ -23,25 +40,48 @@ class Game(db.Model):
     chameleon_mode = db.Column(db.Boolean, default=False)
 
     # Game Info
-    discard = db.Column(db.PickleType, default={key: [] for key in Colour})
-    deck = db.Column(db.PickleType, default=[])
+    discard = db.Column(DiscardColumn, default={key: [] for key in Colour})
+    deck = db.Column(DeckColumn, default=[])
     final_score = db.Column(db.SmallInteger, nullable=True, default=None)
-    hands = db.Column(db.PickleType, default=[])
+    hands = db.Column(HandsColumn, default=[])
     hints = db.Column(db.SmallInteger, default=8)
-    in_play = db.Column(db.PickleType, default=dict.fromkeys(list(Colour), 0))
+    in_play = db.Column(InPlayColumn, default=dict.fromkeys(list(Colour), 0))
     last_turn = db.Column(db.Boolean, default=False)
     last_player = db.Column(db.SmallInteger, nullable=True, default=None)
     misfires = db.Column(db.SmallInteger, default=3)
-    players = db.Column(db.PickleType, default=[])
+    players = db.Column(MutableList.as_mutable(PlayersColumn), default=[])
+    # len(players), so the lobby doesn't have to load them
+    player_count = db.Column(db.SmallInteger, default=0)
+    seats = db.relationship(Player, lazy='dynamic', order_by=Player.seat)
     score = db.Column(db.SmallInteger, default=0)
     started = db.Column(db.Boolean, index=True, default=False)
     turn = db.Column(db.SmallInteger, default=0)
 
+    # When the row was last written, which for a finished game is when it finished. Old games are reaped by this
+    updated = db.Column(db.DateTime, index=True, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Event log
+    seed = db.Column(db.Integer, nullable=True, default=None)
+    snapshot_seq = db.Column(db.Integer, default=0)
+
+    # Set on games made together by POST /games/bulk, so that their ids can be read back with one query
+    batch = db.Column(db.String(32), index=True, nullable=True, default=None)
+    moves = db.relationship(LoggedMove, lazy='dynamic', order_by=LoggedMove.seq)
+
+    # Bumped by every UPDATE, which only applies if the row still has the version it was read with
+    version = db.Column(db.Integer, nullable=False, default=1)
+    __mapper_args__ = {'version_id_col': version}
+
+    # Whether the moves after the snapshot have been replayed onto the columns since they were loaded, and which
+    # columns are ahead of the snapshot in the database
+    _replayed = False
+    _unsaved = frozenset()
+
     def __repr__(self):
         return '<Game %r>' % self.id
 
-    def add_player(self):
-        """Add a new player to the game and return their ID"""
+    def add_player(self, player_id=None, nickname=None):
+        """Add a player to the game and return their ID, which is new unless one is given"""
 
         # Can't have more than 5 players, can't join a game that's started already (yet)
         if len(self.players) == 5:
@@ -50,142 +90,141 @@ class Game(db.Model):
         if self.started:
             raise CannotJoinGame("Game already in progress")
 
-        new_id = uuid4().hex
+        if player_id in self.players:
+            raise CannotJoinGame("Already in this game")
+
+        new_id = player_id or uuid4().hex
         self.players.append(new_id)
+        self.player_count = len(self.players)
+        self.seats.append(Player(seat=len(self.players) - 1, token=new_id, nickname=nickname))
 
         return new_id
 
+    @validates('players')
+    def _count_players(self, key, players):
+        self.player_count = len(players)
+        return players
+
     def to_json(self, player_offset=0):
+        state = self.to_state()
         json_game = {
             'url': url_for('api.get_specific_game', game_id=self.id, _external=True),
-            'discard': self.discard,
-            'hands': rotate(list(map(lambda arr: list(map(lambda card: card.to_json(), arr)), self.hands)),
+            'discard': {colour: state.discard[colour] for colour in Colour},
+            'hands': rotate(list(map(lambda hand: list(map(lambda card: Card(card).to_json(), hand)), state.hands)),
                             player_offset),
             'hardMode': self.hard_mode,
-            'deckSize': len(self.deck),
-            'finalScore': self.final_score,
-            'turn': (self.turn + player_offset) % len(self.players),
-            'started': self.started,
+            'deckSize': len(state.deck),
+            'finalScore': state.final_score,
+            'maxScore': state.max_score,
+            'turn': (state.turn + player_offset) % len(self.players),
+            'started': state.started,
             'chameleonMode': self.chameleon_mode,
             'perfectMode': self.perfect_mode,
-            'inPlay': self.in_play,
-            'lastTurn': self.last_turn,
-            'lastPlayer': self.last_player and (self.last_player + player_offset) % len(self.players),
-            'misfires': self.misfires,
-            'hints': self.hints
+            'inPlay': {colour: state.in_play[colour] for colour in Colour},
+            'lastTurn': state.last_turn,
+            'lastPlayer': state.last_player and (state.last_player + player_offset) % len(self.players),
+            'misfires': state.misfires,
+            'hints': state.hints
         }
         return json_game
 
-    def start(self):
-        # No point starting a game with one player, or that's already started
-        if len(self.players) < 2:
-            raise CannotStartGame('Cannot start game with one player')
-
-        if self.started:
-            raise CannotStartGame('Game already in progress')
-
-        self.started = True
-        self.deck = new_deck(self.hard_mode)
-        self.turn = randint(0, len(self.players) - 1)
+    def to_state(self):
+        """Build the current GameState from the snapshot and the move log. The state gets its own copies, so the
+        columns are only changed when the state is written back"""
+        if not self._replayed and self.id is not None:
+            return self.replay(self.moves.filter(LoggedMove.seq > (self.snapshot_seq or 0)).all())
+        return self.snapshot_state()
+
+    def snapshot_state(self):
+        """The GameState the columns hold, without any moves made since they were written"""
+        return GameState(
+            num_players=len(self.players),
+            hard_mode=self.hard_mode,
+            perfect_mode=self.perfect_mode,
+            chameleon_mode=self.chameleon_mode,
+            started=self.started,
+            deck=list(self.deck),
+            hands=[pack_hand(hand) for hand in self.hands],
+            discard=[list(self.discard.get(colour, [])) for colour in Colour],
+            in_play=[self.in_play.get(colour, 0) for colour in Colour],
+            hints=self.hints,
+            misfires=self.misfires,
+            score=self.score,
+            final_score=self.final_score,
+            last_turn=self.last_turn,
+            last_player=self.last_player,
+            turn=self.turn)
+
+    def replay(self, logged_moves):
+        """Replay the moves logged since the snapshot and return the current state. to_state loads the moves itself,
+        but they can be loaded some other way, e.g. for several games at once"""
+        state = self.snapshot_state()
+        for logged_move in logged_moves:
+            state.make_move(logged_move.move)
+
+        # Bring the columns up to date in memory, so the moves don't have to be replayed again
+        if logged_moves:
+            self.sync_state(state, logged_moves[-1].seq)
+            state = self.snapshot_state()
+        self._replayed = True
+        return state
+
+    def state_values(self, state, columns):
+        """The values of the given columns for a GameState"""
+        values = {column: getattr(state, column) for column in columns}
+        if 'discard' in values:
+            values['discard'] = {colour: state.discard[colour] for colour in Colour}
+        if 'in_play' in values:
+            values['in_play'] = {colour: state.in_play[colour] for colour in Colour}
+        return values
+
+    def load_state(self, state, seq=None):
+        """Write a GameState back to the columns as a snapshot, taken after move seq if given. Only the columns the
+        state or earlier synced states changed are written"""
+        for column, value in self.state_values(state, self._unsaved | state.dirty).items():
+            setattr(self, column, value)
+            flag_modified(self, column)
+        self._unsaved = frozenset()
+
+        if seq is not None:
+            self.snapshot_seq = seq
+
+    def sync_state(self, state, seq):
+        """Put a GameState in the columns without writing it to the database, because the move log already has it"""
+        for column, value in self.state_values(state, state.dirty).items():
+            set_committed_value(self, column, value)
+        set_committed_value(self, 'snapshot_seq', seq)
+        self._unsaved = self._unsaved | state.dirty
 
-        num_cards = 5 if len(self.players) < 4 else 4
-        for i in range(len(self.players)):
-            self.hands.append([])
-            for j in range(num_cards):
-                self.hands[-1].append(Card(self.deck.pop()))
+    def start(self):
+        """Shuffle and deal, from the game's seed if it was made with one"""
+        state = self.to_state()
+        seed = self.seed if self.seed is not None else randrange(1 << 31)
+        state.start(Random(seed))
+        self.seed = seed
+        self.load_state(state)
 
     def make_move(self, move):
         """Make a move or raise InvalidMove"""
+        state = self.to_state()
 
-        if not self.started or self.final_score is not None:
-            raise InvalidMove('Game not in progress')
-
-        if self.turn != move.moving_player:
-            raise InvalidMove('Not your turn')
-
-        if move.move_type == MoveType.HINT:
-            if self.hints == 0:
-                raise InvalidMove('No hints available')
-
-            if move.moving_player == move.hinted_player:
-                raise InvalidMove('Can\'t hint yourself')
-
-            if self.chameleon_mode and move.hint_colour == Colour.RAINBOW:
-                raise InvalidMove('Can\'t hint about rainbow in a chameleon mode game')
-
-            hinted_a_card = False
-            for card in self.hands[move.hinted_player]:
-                if card.colour == move.hint_colour:
-                    card.known_colour = move.hint_colour
-                    hinted_a_card = True
-                if card.rank == move.hint_rank:
-                    card.known_rank = True
-                    hinted_a_card = True
+        # Snapshot straight away if the snapshot has changes that haven't been flushed, or the game isn't in the
+        # database yet, since sync_state would throw them away
+        instance = inspect(self)
+        unsaved = instance.modified or not instance.persistent
 
-                if self.chameleon_mode and card.colour == Colour.RAINBOW:
-                    hinted_a_card = True
-                    if card.known_colour is None or card.known_colour == move.hint_colour:
-                        card.known_colour = move.hint_colour
-                    else:
-                        # Making the assumption they can figure out that if a card is red and green, it's rainbow
-                        card.known_colour = Colour.RAINBOW
+        card = state.make_move(move)
+        seq = (self.snapshot_seq or 0) + 1
+        self.moves.append(LoggedMove(seq=seq, code=move.encode(), card=card))
 
-            if not hinted_a_card:
-                raise InvalidMove('Can\'t hint about a card that doesn\'t exist')
-
-            self.hints -= 1
-
-        elif move.move_type == MoveType.DISCARD:
-            if self.hints == 8:
-                raise InvalidMove('Can\'t discard with 8 hints')
-
-            discarded_card = self.hands[move.moving_player].pop(move.card_index)
-            self.hints += 1
-            if self.perfect_mode:
-                self.check_impossible(discarded_card)
+        if unsaved or state.final_score is not None or seq % current_app.config['SNAPSHOT_INTERVAL'] == 0:
+            self.load_state(state, seq)
+        else:
+            self.sync_state(state, seq)
 
-            self.discard[discarded_card.colour].append(discarded_card.rank)
 
-        else:
-            played_card = self.hands[move.moving_player].pop(move.card_index)
-            if self.in_play[played_card.colour] + 1 == played_card.rank:
-                self.in_play[played_card.colour] += 1
-
-                # Increment the score, check if game is over
-                self.score += 1
-                if self.score == 30:
-                    self.final_score = self.score
-            else:
-                self.misfires -= 1
-                if self.perfect_mode:
-                    self.check_impossible(played_card)
-                if self.misfires == 0:
-                    self.final_score = 0
-
-                self.discard[played_card.colour].append(played_card.rank)
-
-        # Draw a card if necessary and able
-        if move.move_type != MoveType.HINT and len(self.deck) > 0:
-            self.hands[move.moving_player].append(Card(self.deck.pop()))
-
-        # Advance the turn
-        self.turn = (self.turn + 1) % len(self.players)
-
-        # Is the game over?
-        if self.last_turn and self.last_player == move.moving_player:
-            self.final_score = self.score
-
-        # Is it the last round?
-        if len(self.deck) == 0 and not self.perfect_mode and not self.last_turn:
-            self.last_turn = True
-            self.last_player = move.moving_player
-
-    def check_impossible(self, discarded_card):
-        """Check if the game is over for perfect mode. Call before adding the new card to the discard pile"""
-        if discarded_card.rank == 5 or (self.hard_mode and discarded_card.colour == Colour.RAINBOW):
-            self.final_score = 0
-        elif discarded_card.rank == 1:
-            if self.discard[discarded_card.colour].count(1) == 2:
-                self.final_score = 0
-        elif discarded_card.rank in self.discard[discarded_card.colour]:
-            self.final_score = 0
+@event.listens_for(Game, 'expire')
+def _game_expired(game, attrs):
+    # Expired columns get reloaded from the snapshot, so the log needs replaying again
+    game._replayed = False
+    game._unsaved = frozenset()
@@ -10,7 +10,16 @@ class MoveType(IntEnum):
     DISCARD = 2
 
 
+COLOUR_NAMES = ['blue', 'green', 'red', 'white', 'yellow', 'rainbow']
+
+
 class Move:
+    """A move made by a player, as read from the API.
+
+    A move also packs into a small integer for the move log: the type in the low two bits, then three bits each for
+    the moving player, the card index or hinted player, the hinted colour plus one and the hinted rank.
+    """
+
     def __init__(self, json, player, num_players):
         self.move_type = MoveType(['hint', 'play', 'discard'].index(json['type']))
         self.moving_player = player
@@ -20,13 +29,50 @@ class Move:
                 raise InvalidMove('Both rank and colour specified in hint')
 
             if json.get('rank'):
-                self.hint_rank = json['rank']
+                if json['rank'] not in range(1, 6):
+                    raise InvalidMove('Rank must be between 1 and 5')
+                self.hint_rank = int(json['rank'])
                 self.hint_colour = None
             else:
-                self.hint_colour = Colour(['blue', 'green', 'red', 'white', 'yellow', 'rainbow'].index(json['colour']))
+                self.hint_colour = Colour(COLOUR_NAMES.index(json['colour']))
                 self.hint_rank = None
 
             self.hinted_player = (json['playerIndex'] + player) % num_players
 
         else:
             self.card_index = json['cardIndex']
+
+    def encode(self):
+        """Pack the move into an int. Card indexes must already be made non-negative"""
+        code = self.move_type | self.moving_player << 2
+        if self.move_type == MoveType.HINT:
+            colour = 0 if self.hint_colour is None else self.hint_colour + 1
+            return code | self.hinted_player << 5 | colour << 8 | (self.hint_rank or 0) << 11
+        return code | self.card_index << 5
+
+    @classmethod
+    def decode(cls, code):
+        """The move packed by encode"""
+        move = cls.__new__(cls)
+        move.move_type = MoveType(code & 3)
+        move.moving_player = code >> 2 & 7
+        if move.move_type == MoveType.HINT:
+            move.hinted_player = code >> 5 & 7
+            colour = code >> 8 & 7
+            move.hint_colour = Colour(colour - 1) if colour else None
+            move.hint_rank = code >> 11 & 7 or None
+        else:
+            move.card_index = code >> 5 & 7
+        return move
+
+    def to_json(self, num_players):
+        """The move as the API would receive it from the moving player"""
+        if self.move_type != MoveType.HINT:
+            return {'type': self.move_type.name.lower(), 'cardIndex': self.card_index}
+
+        json = {'type': 'hint', 'playerIndex': (self.hinted_player - self.moving_player) % num_players}
+        if self.hint_rank:
+            json['rank'] = self.hint_rank
+        else:
+            json['colour'] = COLOUR_NAMES[self.hint_colour]
+        return json
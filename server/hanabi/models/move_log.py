@@ -0,0 +1,24 @@
+from hanabi import db
+from hanabi.models.move import Move
+
+
+class LoggedMove(db.Model):
+    """One move of a game, in the order it was made.
+
+    The game's own columns are a snapshot taken every so often; the moves made since the snapshot are replayed on top
+    of it to get the current state, so making a move only has to insert one of these.
+    """
+    __tablename__ = 'moves'
+    game_id = db.Column(db.Integer, db.ForeignKey('games.id'), primary_key=True)
+    seq = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    code = db.Column(db.SmallInteger, nullable=False)
+    # The number (10 * colour + rank) of the card played or discarded, which the move history shows. None for hints,
+    # and for moves logged before it was kept
+    card = db.Column(db.SmallInteger, nullable=True)
+
+    def __repr__(self):
+        return '<LoggedMove %r:%r>' % (self.game_id, self.seq)
+
+    @property
+    def move(self):
+        return Move.decode(self.code)
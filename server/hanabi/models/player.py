@@ -0,0 +1,19 @@
+from hanabi import db
+
+
+class Player(db.Model):
+    """Who sits in each seat of a game.
+
+    Game.players is still the order of play; this is the same thing indexed by id, so that a player's games can be
+    found without loading every game's players.
+    """
+    __tablename__ = 'players'
+    game_id = db.Column(db.Integer, db.ForeignKey('games.id'), primary_key=True)
+    seat = db.Column(db.SmallInteger, primary_key=True, autoincrement=False)
+    token = db.Column(db.String(64), nullable=False)
+    nickname = db.Column(db.String(64), nullable=True)
+
+    __table_args__ = (db.Index('ix_players_token', 'token', 'game_id', unique=True),)
+
+    def __repr__(self):
+        return '<Player %r:%r>' % (self.game_id, self.seat)
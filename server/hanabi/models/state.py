@@ -0,0 +1,225 @@
+import random
+from array import array
+
+from hanabi.exceptions import CannotStartGame, InvalidMove
+from hanabi.models.card import CARD_BITS, HARD_RAINBOW_COPIES, KNOWN_COLOUR_SHIFT, KNOWN_RANK, RANK_COPIES, Colour, \
+    new_deck
+from hanabi.models.move import MoveType
+
+
+def remaining_copies(discard, hard_mode=False):
+    """Copies of each card that haven't been thrown away, as a list per colour indexed by rank"""
+    remaining = []
+    for colour, ranks in enumerate(discard):
+        copies = HARD_RAINBOW_COPIES if hard_mode and colour == Colour.RAINBOW else RANK_COPIES
+        remaining.append(list(copies))
+        for rank in ranks:
+            remaining[-1][rank] -= 1
+    return remaining
+
+
+def reachable_rank(in_play, remaining):
+    """The highest rank a colour can still get to, given how far it's got and the copies that are left"""
+    rank = in_play
+    while rank < 5 and remaining[rank + 1] > 0:
+        rank += 1
+    return rank
+
+
+def max_score(in_play, discard, hard_mode=False):
+    """The best score still possible, for discard piles and cards in play as lists indexed by colour"""
+    remaining = remaining_copies(discard, hard_mode)
+    return sum(reachable_rank(in_play[colour], remaining[colour]) for colour in Colour)
+
+
+class GameState:
+    """The rules of the game, without any persistence.
+
+    Discard piles and cards in play are stored as lists indexed by colour rather than dicts keyed by Colour, hands are
+    arrays of packed cards (see hanabi.models.card), and everything lives in slots, so that validating and applying a
+    move is cheap. Game is a thin adapter around this.
+
+    The state also counts the copies of each card that are left, and from those how far each colour can still get,
+    so that max_score (the best score still possible) is kept up to date in constant time per move.
+
+    dirty is the set of fields that have changed since the state was made, so that only those need saving.
+    """
+    __slots__ = ('hard_mode', 'perfect_mode', 'chameleon_mode', 'num_players', 'started', 'deck', 'hands',
+                 'discard', 'in_play', 'hints', 'misfires', 'score', 'final_score', 'last_turn', 'last_player',
+                 'turn', 'remaining', 'reachable', 'max_score', 'dirty')
+
+    def __init__(self, num_players=0, hard_mode=False, perfect_mode=False, chameleon_mode=False, started=False,
+                 deck=None, hands=None, discard=None, in_play=None, hints=8, misfires=3, score=0, final_score=None,
+                 last_turn=False, last_player=None, turn=0):
+        self.num_players = num_players
+        self.hard_mode = hard_mode
+        self.perfect_mode = perfect_mode
+        self.chameleon_mode = chameleon_mode
+        self.started = started
+        self.deck = deck if deck is not None else []
+        self.hands = hands if hands is not None else []
+        self.discard = discard if discard is not None else [[] for _ in Colour]
+        self.in_play = in_play if in_play is not None else [0] * len(Colour)
+        self.hints = hints
+        self.misfires = misfires
+        self.score = score
+        self.final_score = final_score
+        self.last_turn = last_turn
+        self.last_player = last_player
+        self.turn = turn
+
+        self.remaining = remaining_copies(self.discard, hard_mode)
+        self.reachable = [reachable_rank(self.in_play[colour], self.remaining[colour]) for colour in Colour]
+        self.max_score = sum(self.reachable)
+        self.dirty = set()
+
+    def __repr__(self):
+        return '<GameState %d players, turn %d>' % (self.num_players, self.turn)
+
+    def start(self, rng=random):
+        """Shuffle and deal. Passing a seeded Random makes the deal reproducible"""
+        # No point starting a game with one player, or that's already started
+        if self.num_players < 2:
+            raise CannotStartGame('Cannot start game with one player')
+
+        if self.started:
+            raise CannotStartGame('Game already in progress')
+
+        self.started = True
+        self.deck = new_deck(self.hard_mode, rng)
+        self.turn = rng.randint(0, self.num_players - 1)
+
+        num_cards = 5 if self.num_players < 4 else 4
+        deck = self.deck
+        self.hands = [array('H', [deck.pop() for _ in range(num_cards)]) for _ in range(self.num_players)]
+        self.dirty.update(('started', 'deck', 'hands', 'turn'))
+
+    def make_move(self, move):
+        """Make a move or raise InvalidMove. Returns the number of the card played or discarded, if any"""
+
+        if not self.started or self.final_score is not None:
+            raise InvalidMove('Game not in progress')
+
+        if self.turn != move.moving_player:
+            raise InvalidMove('Not your turn')
+
+        move_type = move.move_type
+        dirty = self.dirty
+        revealed = None
+        if move_type != MoveType.HINT:
+            # Negative indexes count from the end of the hand. Keep the plain index, for the move log
+            hand_size = len(self.hands[move.moving_player])
+            if -hand_size <= move.card_index < 0:
+                move.card_index += hand_size
+
+        if move_type == MoveType.HINT:
+            if self.hints == 0:
+                raise InvalidMove('No hints available')
+
+            if move.moving_player == move.hinted_player:
+                raise InvalidMove('Can\'t hint yourself')
+
+            hint_colour = move.hint_colour
+            hint_rank = move.hint_rank
+            if self.chameleon_mode and hint_colour == Colour.RAINBOW:
+                raise InvalidMove('Can\'t hint about rainbow in a chameleon mode game')
+
+            hinted_known_colour = 0 if hint_colour is None else hint_colour + 1
+            hand = self.hands[move.hinted_player]
+            hinted_a_card = False
+            for i, card in enumerate(hand):
+                number = card & CARD_BITS
+                colour = number // 10
+                known_colour = card >> KNOWN_COLOUR_SHIFT & 7
+                known_rank = card & KNOWN_RANK
+                if colour == hint_colour:
+                    known_colour = hinted_known_colour
+                    hinted_a_card = True
+                if number % 10 == hint_rank:
+                    known_rank = KNOWN_RANK
+                    hinted_a_card = True
+
+                if self.chameleon_mode and colour == Colour.RAINBOW:
+                    hinted_a_card = True
+                    if known_colour == 0 or known_colour == hinted_known_colour:
+                        known_colour = hinted_known_colour
+                    else:
+                        # Making the assumption they can figure out that if a card is red and green, it's rainbow
+                        known_colour = Colour.RAINBOW + 1
+
+                hand[i] = number | known_colour << KNOWN_COLOUR_SHIFT | known_rank
+
+            if not hinted_a_card:
+                raise InvalidMove('Can\'t hint about a card that doesn\'t exist')
+
+            self.hints -= 1
+            dirty.update(('hands', 'hints'))
+
+        elif move_type == MoveType.DISCARD:
+            if self.hints == 8:
+                raise InvalidMove('Can\'t discard with 8 hints')
+
+            discarded_card = revealed = self.hands[move.moving_player].pop(move.card_index) & CARD_BITS
+            self.hints += 1
+            self.throw_away(discarded_card)
+            dirty.update(('hands', 'hints'))
+
+        else:
+            played_card = revealed = self.hands[move.moving_player].pop(move.card_index) & CARD_BITS
+            colour = played_card // 10
+            rank = played_card % 10
+            if self.in_play[colour] + 1 == rank:
+                self.in_play[colour] += 1
+
+                # Increment the score, check if game is over
+                self.score += 1
+                dirty.update(('hands', 'in_play', 'score'))
+                if self.score == 30:
+                    self.final_score = self.score
+                    dirty.add('final_score')
+            else:
+                self.misfires -= 1
+                self.throw_away(played_card)
+                dirty.update(('hands', 'misfires'))
+                if self.misfires == 0:
+                    self.final_score = 0
+                    dirty.add('final_score')
+
+        # Draw a card if necessary and able
+        if move_type != MoveType.HINT and self.deck:
+            self.hands[move.moving_player].append(self.deck.pop())
+            dirty.add('deck')
+
+        # Advance the turn
+        self.turn = (self.turn + 1) % self.num_players
+        dirty.add('turn')
+
+        # Is the game over?
+        if self.last_turn and self.last_player == move.moving_player:
+            self.final_score = self.score
+            dirty.add('final_score')
+
+        # Is it the last round?
+        if not self.deck and not self.perfect_mode and not self.last_turn:
+            self.last_turn = True
+            self.last_player = move.moving_player
+            dirty.update(('last_turn', 'last_player'))
+
+        return revealed
+
+    def throw_away(self, card):
+        """Put a card's number in the discard pile, and end a perfect mode game if that makes 30 impossible"""
+        colour = card // 10
+        rank = card % 10
+        self.discard[colour].append(rank)
+        self.dirty.add('discard')
+
+        remaining = self.remaining[colour]
+        remaining[rank] -= 1
+        if remaining[rank] == 0 and self.in_play[colour] < rank <= self.reachable[colour]:
+            self.max_score -= self.reachable[colour] - (rank - 1)
+            self.reachable[colour] = rank - 1
+
+            if self.perfect_mode:
+                self.final_score = 0
+                self.dirty.add('final_score')
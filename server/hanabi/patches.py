@@ -0,0 +1,113 @@
+"""Sending clients what's changed in a game since the copy they have, rather than the whole game again.
+
+Each worker keeps the last few revisions it has seen of recently seen games, as the game looks from seat 0. A client
+that sends the revision it has gets a JSON patch (RFC 6902) from that revision to the current one, as seen from its
+seat. If the revision it has isn't kept (it's too old, or it came from another worker), it gets the whole game.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from hanabi.cache import revision
+from hanabi.serializers import game_json
+
+
+def seat_view(view, num_players, seat):
+    """A game as seen from seat 0 turned around to be seen from another seat, as game_json would have it"""
+    if not seat:
+        return view
+    return dict(view, hands=view['hands'][-seat:] + view['hands'][:seat], turn=(view['turn'] + seat) % num_players,
+                lastPlayer=view['lastPlayer'] and (view['lastPlayer'] + seat) % num_players)
+
+
+def _pointer(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def diff(old, new, path=''):
+    """JSON patch operations turning old into new. Lists that only grow get adds, and lists of the same length are
+    compared item by item; anything else is replaced whole"""
+    if type(old) is not type(new):
+        return [{'op': 'replace', 'path': path, 'value': new}]
+
+    if isinstance(new, dict):
+        operations = []
+        for key in old:
+            if key not in new:
+                operations.append({'op': 'remove', 'path': path + '/' + _pointer(key)})
+        for key, value in new.items():
+            if key not in old:
+                operations.append({'op': 'add', 'path': path + '/' + _pointer(key), 'value': value})
+            elif old[key] != value:
+                operations.extend(diff(old[key], value, path + '/' + _pointer(key)))
+        return operations
+
+    if isinstance(new, list) and old != new:
+        if len(new) > len(old) and new[:len(old)] == old:
+            return [{'op': 'add', 'path': path + '/-', 'value': value} for value in new[len(old):]]
+
+        # A card leaving a hand, and maybe another being drawn into it
+        first = next((i for i, (old_value, value) in enumerate(zip(old, new)) if old_value != value), len(old) - 1)
+        if len(old) - 1 <= len(new) <= len(old) and old[first + 1:] == new[first:len(old) - 1] and old:
+            return [{'op': 'remove', 'path': '%s/%d' % (path, first)}] + \
+                [{'op': 'add', 'path': path + '/-', 'value': value} for value in new[len(old) - 1:]]
+
+        if len(new) == len(old):
+            operations = []
+            for i, (old_value, value) in enumerate(zip(old, new)):
+                if old_value != value:
+                    operations.extend(diff(old_value, value, '%s/%d' % (path, i)))
+            return operations
+
+    return [] if old == new else [{'op': 'replace', 'path': path, 'value': new}]
+
+
+class PatchLog:
+    """The last history revisions of up to max_games games, dropping the least recently seen"""
+
+    def __init__(self, max_games, history):
+        self.max_games = max_games
+        self.history = history
+
+        self._games = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, game):
+        """Keep the current revision of a game, if it isn't already. Needs a request context, for the game's url"""
+        if not self.max_games:
+            return
+
+        game_revision = revision(game)
+        with self._lock:
+            revisions = self._games.get(game.id)
+            if revisions is not None and game_revision in revisions:
+                self._games.move_to_end(game.id)
+                return
+
+        view = json.loads(game_json(game, 0))
+        with self._lock:
+            revisions = self._games.setdefault(game.id, OrderedDict())
+            self._games.move_to_end(game.id)
+            revisions[game_revision] = (view, len(game.players))
+            while len(revisions) > self.history:
+                revisions.popitem(last=False)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+
+    def patch(self, game, since, seat):
+        """The patch taking a seat's view of a game from revision since to now, or None if since isn't kept"""
+        self.record(game)
+        with self._lock:
+            revisions = self._games.get(game.id, {})
+            old = revisions.get(since)
+            new = revisions.get(revision(game))
+        if old is None or new is None:
+            return None
+        return diff(seat_view(*old, seat=seat), seat_view(*new, seat=seat))
+
+
+def patch_log(app):
+    log = app.extensions.get('game_patches')
+    if log is None:
+        log = app.extensions['game_patches'] = PatchLog(app.config['PATCH_GAMES'], app.config['PATCH_HISTORY'])
+    return log
@@ -0,0 +1,191 @@
+"""Clearing old games out of the games table, so it only holds the ones that are still of interest.
+
+Finished games are moved to an archive file once they've been over for ARCHIVE_AFTER, and games nobody has started
+are deleted once nobody has joined them for ABANDON_AFTER. Both go by Game.updated, which is indexed. Games are reaped
+a batch at a time, each in its own short transaction, so the table is never locked for long, and a batch is only
+deleted once it's safely in the archive.
+
+The archive is gzipped json, one game per line, with each batch appended as a gzip member of its own, so the file only
+ever grows and gzip reads it as one stream. If reaping stops between writing a batch and deleting it, the batch is
+archived again next time, so readers should take the last copy of each game. Only one process reaps at a time.
+"""
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+from sqlalchemy import and_, select
+
+from hanabi import db
+from hanabi.cache import game_cache
+from hanabi.models import Game, LoggedMove, Player
+
+games = Game.__table__
+players = Player.__table__
+moves = LoggedMove.__table__
+
+
+def finished(cutoff):
+    return and_(games.c.final_score.isnot(None), games.c.updated < cutoff)
+
+
+def abandoned(cutoff):
+    return and_(games.c.started.is_(False), games.c.updated < cutoff)
+
+
+def try_lock(lock):
+    """Take the lock on an open lock file unless another process has it, and return whether it did"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+    except (BlockingIOError, PermissionError):
+        return False
+    return True
+
+
+def archive_record(row, seats, codes):
+    """A finished game as it's kept in the archive: enough to replay it from its seed"""
+    return {
+        'id': row.id,
+        'hardMode': row.hard_mode,
+        'perfectMode': row.perfect_mode,
+        'chameleonMode': row.chameleon_mode,
+        'public': row.public,
+        'seed': row.seed,
+        'players': [seat.token for seat in seats],
+        'nicknames': [seat.nickname for seat in seats],
+        'finalScore': row.final_score,
+        'misfires': 3 - row.misfires,
+        'finished': row.updated.isoformat(),
+        'moves': codes
+    }
+
+
+def append_archive(path, records):
+    """Add games to the end of an archive file, as a gzip member of their own"""
+    data = gzip.compress(''.join(json.dumps(record, sort_keys=True) + '\n' for record in records).encode('utf-8'))
+    with open(path, 'ab') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def read_archive(path):
+    """The games in an archive file, in the order they were archived"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def archive_batch(path, cutoff, batch_size):
+    """Archive and delete the next batch of finished games. Returns their ids"""
+    rows = db.session.execute(select([games]).where(finished(cutoff)).order_by(games.c.id).limit(batch_size)) \
+        .fetchall()
+    if not rows:
+        return []
+    game_ids = [row.id for row in rows]
+
+    seats = {game_id: [] for game_id in game_ids}
+    for seat in db.session.execute(select([players]).where(players.c.game_id.in_(game_ids))
+                                   .order_by(players.c.game_id, players.c.seat)):
+        seats[seat.game_id].append(seat)
+    codes = {game_id: [] for game_id in game_ids}
+    for game_id, code in db.session.execute(select([moves.c.game_id, moves.c.code])
+                                            .where(moves.c.game_id.in_(game_ids))
+                                            .order_by(moves.c.game_id, moves.c.seq)):
+        codes[game_id].append(code)
+
+    append_archive(path, [archive_record(row, seats[row.id], codes[row.id]) for row in rows])
+
+    # Finished games don't change, so there's nothing to recheck
+    db.session.execute(moves.delete().where(moves.c.game_id.in_(game_ids)))
+    db.session.execute(players.delete().where(players.c.game_id.in_(game_ids)))
+    db.session.execute(games.delete().where(games.c.id.in_(game_ids)))
+    db.session.commit()
+    return game_ids
+
+
+def delete_batch(cutoff, batch_size):
+    """Delete the next batch of abandoned games. Returns the ids picked, and how many of them were deleted"""
+    game_ids = [row.id for row in db.session.execute(
+        select([games.c.id]).where(abandoned(cutoff)).order_by(games.c.id).limit(batch_size))]
+    if not game_ids:
+        return [], 0
+
+    # Someone may have joined or started one since it was picked, so check again as it's deleted
+    still_abandoned = and_(games.c.id.in_(game_ids), abandoned(cutoff))
+    db.session.execute(players.delete().where(players.c.game_id.in_(select([games.c.id]).where(still_abandoned))))
+    deleted = db.session.execute(games.delete().where(still_abandoned)).rowcount
+    db.session.commit()
+    return game_ids, deleted
+
+
+def reap(app, batch_size=None, now=None):
+    """Archive old finished games and delete abandoned ones, a batch at a time. Returns how many of each and how fast,
+    or None if another process is already reaping. Needs an app context"""
+    batch_size = batch_size or app.config['REAP_BATCH_SIZE']
+    now = now or datetime.utcnow()
+    path = app.config['ARCHIVE_PATH']
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with open(path + '.lock', 'w') as lock:
+        if not try_lock(lock):
+            return None
+
+        # Games this worker has cached may be gone. Other workers' copies expire within GAME_CACHE_TTL
+        cache = game_cache(app)
+        start = time.monotonic()
+        archived = deleted = 0
+        while True:
+            game_ids = archive_batch(path, now - app.config['ARCHIVE_AFTER'], batch_size)
+            archived += len(game_ids)
+            for game_id in game_ids:
+                cache.invalidate(game_id)
+            if len(game_ids) < batch_size:
+                break
+        while True:
+            game_ids, count = delete_batch(now - app.config['ABANDON_AFTER'], batch_size)
+            deleted += count
+            for game_id in game_ids:
+                cache.invalidate(game_id)
+            if len(game_ids) < batch_size:
+                break
+        seconds = time.monotonic() - start
+
+    return {'archived': archived, 'deleted': deleted, 'seconds': seconds,
+            'gamesPerSecond': (archived + deleted) / seconds if seconds else 0}
+
+
+def start_reaper(app):
+    """Reap every REAP_INTERVAL seconds on a background thread, if that's turned on. Once per app"""
+    interval = app.config['REAP_INTERVAL']
+    if not interval or 'reaper' in app.extensions:
+        return
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                try:
+                    stats = reap(app)
+                    if stats is not None and stats['archived'] + stats['deleted']:
+                        app.logger.info('Archived %(archived)d games and deleted %(deleted)d in %(seconds).2fs '
+                                        '(%(gamesPerSecond).0f games/sec)', stats)
+                except Exception:
+                    app.logger.exception('Reaping failed')
+                finally:
+                    db.session.remove()
+
+    thread = app.extensions['reaper'] = threading.Thread(target=run, daemon=True)
+    thread.start()
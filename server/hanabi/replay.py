@@ -0,0 +1,245 @@
+"""A compact binary format for finished games, for analysing lots of them at once.
+
+A replay file is a header followed by blocks, each of which is its length, its number of games, and the games
+themselves deflated together. A game is a fixed size record (see RECORD) followed by its moves as the codes the move
+log keeps, two bytes each, so with the seed and settings it can be played through again exactly. Nothing about who
+played is kept.
+
+Readers memory map the file and inflate one block at a time, so a file of any size is read in constant memory, and
+the blocks can be split between processes. Everything is little endian.
+"""
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from multiprocessing import Pool, cpu_count
+
+from sqlalchemy import select
+
+from hanabi import db
+from hanabi.models import Game, LoggedMove, MoveType
+from hanabi.reaper import read_archive
+
+MAGIC = b'HNBRPLY1'
+
+# Compressed length and number of games in a block
+BLOCK = struct.Struct('<II')
+
+# Game id, seed (NO_SEED if it has none), modes (HARD, PERFECT and CHAMELEON), players, final score, misfires and the
+# number of moves that follow
+RECORD = struct.Struct('<IIBBBBH')
+
+NO_SEED = 0xFFFFFFFF
+HARD = 1
+PERFECT = 2
+CHAMELEON = 4
+
+# Games per block. Bigger blocks compress better; smaller ones split more evenly between processes
+BLOCK_GAMES = 4096
+
+
+class Replay(namedtuple('Replay', 'id seed hard_mode perfect_mode chameleon_mode num_players final_score misfires '
+                                  'moves')):
+    """A finished game as read from a replay file. moves is the move codes as little endian bytes"""
+    __slots__ = ()
+
+    @property
+    def codes(self):
+        codes = array('H', self.moves)
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        return codes
+
+
+class ReplayWriter:
+    """Writes games to a replay file, a block at a time"""
+
+    def __init__(self, f, block_games=BLOCK_GAMES):
+        self.f = f
+        self.block_games = block_games
+        self.games = 0
+
+        self._records = []
+        f.write(MAGIC)
+
+    def write(self, game_id, seed, hard_mode, perfect_mode, chameleon_mode, num_players, final_score, misfires,
+              codes):
+        codes = array('H', codes)
+        if sys.byteorder != 'little':
+            codes.byteswap()
+        modes = (HARD if hard_mode else 0) | (PERFECT if perfect_mode else 0) | (CHAMELEON if chameleon_mode else 0)
+        self._records.append(RECORD.pack(game_id, NO_SEED if seed is None else seed, modes, num_players,
+                                         final_score or 0, misfires, len(codes)) + codes.tobytes())
+        self.games += 1
+        if len(self._records) == self.block_games:
+            self.flush()
+
+    def flush(self):
+        if self._records:
+            data = zlib.compress(b''.join(self._records))
+            self.f.write(BLOCK.pack(len(data), len(self._records)) + data)
+            self._records = []
+
+    def close(self):
+        self.flush()
+        self.f.flush()
+
+
+def replay_blocks(path):
+    """Where each block in a replay file starts, without reading the blocks themselves"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError('%s is not a replay file' % path)
+        size = os.fstat(f.fileno()).st_size
+        offset = len(MAGIC)
+        while offset < size:
+            yield offset
+            f.seek(offset)
+            length, _ = BLOCK.unpack(f.read(BLOCK.size))
+            offset += BLOCK.size + length
+
+
+def read_replays(path, start=None, stop=None):
+    """The games in a replay file, or in the blocks starting from offset start up to (but not including) offset stop"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError('%s is not a replay file' % path)
+
+            offset = start or len(MAGIC)
+            stop = stop or len(data)
+            while offset < stop:
+                length, games = BLOCK.unpack_from(data, offset)
+                offset += BLOCK.size
+                block = zlib.decompress(data[offset:offset + length])
+                offset += length
+
+                position = 0
+                for _ in range(games):
+                    game_id, seed, modes, num_players, final_score, misfires, num_moves = \
+                        RECORD.unpack_from(block, position)
+                    position += RECORD.size
+                    end = position + 2 * num_moves
+                    yield Replay(game_id, None if seed == NO_SEED else seed, bool(modes & HARD),
+                                 bool(modes & PERFECT), bool(modes & CHAMELEON), num_players, final_score, misfires,
+                                 block[position:end])
+                    position = end
+
+
+def export_replays(writer, archive_paths=(), batch_size=500):
+    """Write every finished game to a replay file: those still in the database, a batch at a time, then those in
+    archive files (see hanabi.reaper). Games archived more than once are only written once. Returns the number of
+    games written. Needs an app context"""
+    games = Game.__table__
+    moves = LoggedMove.__table__
+    written = set()
+
+    query = select([games.c.id, games.c.seed, games.c.hard_mode, games.c.perfect_mode, games.c.chameleon_mode,
+                    games.c.player_count, games.c.final_score, games.c.misfires]) \
+        .where(games.c.final_score.isnot(None)).order_by(games.c.id).limit(batch_size)
+    last_id = None
+    while True:
+        rows = db.session.execute(query if last_id is None else query.where(games.c.id > last_id)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        codes = {row.id: [] for row in rows}
+        for game_id, code in db.session.execute(select([moves.c.game_id, moves.c.code])
+                                                .where(moves.c.game_id.in_(list(codes)))
+                                                .order_by(moves.c.game_id, moves.c.seq)):
+            codes[game_id].append(code)
+
+        for row in rows:
+            writer.write(row.id, row.seed, row.hard_mode, row.perfect_mode, row.chameleon_mode, row.player_count,
+                         row.final_score, 3 - row.misfires, codes[row.id])
+            written.add(row.id)
+
+    for path in archive_paths:
+        for record in read_archive(path):
+            if record['id'] in written:
+                continue
+            writer.write(record['id'], record['seed'], record['hardMode'], record['perfectMode'],
+                         record['chameleonMode'], len(record['players']), record['finalScore'], record['misfires'],
+                         record['moves'])
+            written.add(record['id'])
+
+    writer.close()
+    return len(written)
+
+
+# For counting moves of each type straight from the low bytes of their codes
+HINTS = bytes(0 if byte & 3 == MoveType.HINT else 1 for byte in range(256))
+PLAYS = bytes(0 if byte & 3 == MoveType.PLAY else 1 for byte in range(256))
+
+
+def _analyze_blocks(task):
+    """Totals for the games in some blocks of a replay file, by mode and number of players"""
+    path, start, stop = task
+    totals = {}
+    for replay in read_replays(path, start, stop):
+        key = (replay.hard_mode, replay.perfect_mode, replay.chameleon_mode, replay.num_players)
+        mode = totals.get(key)
+        if mode is None:
+            mode = totals[key] = {'games': 0, 'moves': 0, 'hints': 0, 'plays': 0, 'misfires': 0, 'lost': 0,
+                                  'scores': [0] * 31}
+
+        # The low byte of each code holds its type
+        types = replay.moves[::2]
+        mode['games'] += 1
+        mode['moves'] += len(types)
+        mode['hints'] += types.translate(HINTS).count(0)
+        mode['plays'] += types.translate(PLAYS).count(0)
+        mode['misfires'] += replay.misfires
+        mode['lost'] += replay.misfires == 3
+        mode['scores'][replay.final_score] += 1
+    return totals
+
+
+def analyze(paths, processes=None, blocks_per_task=16):
+    """Aggregate stats for the games in replay files, split between a pool of processes by block. Returns a summary
+    dict, with a line for each combination of modes and number of players"""
+    tasks = []
+    for path in paths:
+        offsets = list(replay_blocks(path))
+        for i in range(0, len(offsets), blocks_per_task):
+            stop = offsets[i + blocks_per_task] if i + blocks_per_task < len(offsets) else None
+            tasks.append((path, offsets[i], stop))
+    processes = processes or cpu_count()
+
+    totals = {}
+    start = time.perf_counter()
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(_analyze_blocks, tasks):
+            for key, counts in result.items():
+                mode = totals.get(key)
+                if mode is None:
+                    totals[key] = counts
+                    continue
+                for name, count in counts.items():
+                    mode[name] = [a + b for a, b in zip(mode[name], count)] if name == 'scores' else mode[name] + count
+    seconds = time.perf_counter() - start
+
+    games = sum(mode['games'] for mode in totals.values())
+    return {
+        'games': games,
+        'processes': processes,
+        'seconds': seconds,
+        'gamesPerSecond': games / seconds if seconds else float('inf'),
+        'modes': [{'hardMode': key[0], 'perfectMode': key[1], 'chameleonMode': key[2], 'players': key[3],
+                   'games': mode['games'],
+                   'averageScore': sum(score * count for score, count in enumerate(mode['scores'])) / mode['games'],
+                   'scores': mode['scores'],
+                   'averageMisfires': mode['misfires'] / mode['games'],
+                   'misfiresPerPlay': mode['misfires'] / mode['plays'] if mode['plays'] else 0,
+                   'lostToMisfires': mode['lost'] / mode['games'],
+                   'averageHints': mode['hints'] / mode['games'],
+                   'averageMoves': mode['moves'] / mode['games']}
+                  for key, mode in sorted(totals.items())]
+    }
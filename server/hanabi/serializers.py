@@ -0,0 +1,143 @@
+"""Writing API responses straight to JSON text, for the requests that are made most.
+
+game_json writes what flask.json.dumps(game.to_json(seat)) would, byte for byte, with the default JSON_SORT_KEYS and
+JSON_AS_ASCII settings, but without building the dicts first: every card a hand can hold is written once, up front,
+and game urls come from a prefix worked out once per url root rather than from url_for every time. It can also lay
+the game out as jsonify does, which is how game_response writes GET /games/<id>.
+
+dumps writes what jsonify would for anything else. Compact output goes through orjson if it's installed. Only pass
+it data made of ASCII strings, ints, bools and None, which orjson and the json module write the same way.
+"""
+import json
+from functools import lru_cache
+
+from flask import current_app, has_request_context, request, url_for
+
+from hanabi.models.card import COLOURS, KNOWN_COLOUR_SHIFT, KNOWN_RANK, Card
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# How game_json lays out its text: the separator between items, the separator after a key, and the indent per level
+# (None for all on one line). JSON_STYLE is json.dumps's, and jsonify uses PRETTY_STYLE or COMPACT_STYLE
+JSON_STYLE = (', ', ': ', None)
+COMPACT_STYLE = (',', ':', None)
+PRETTY_STYLE = (', ', ': ', 2)
+STYLES = [JSON_STYLE, COMPACT_STYLE, PRETTY_STYLE]
+
+# How deep cards are in a game: in a hand, in the list of hands
+CARD_LEVEL = 3
+
+
+def _card_json(style):
+    item_separator, key_separator, indent = style
+    cards = {}
+    for colour in COLOURS:
+        for rank in range(1, 6):
+            for known_colour in range(len(COLOURS) + 1):
+                for known_rank in (0, KNOWN_RANK):
+                    card = Card(10 * colour + rank | known_colour << KNOWN_COLOUR_SHIFT | known_rank)
+                    text = json.dumps(card.to_json(), sort_keys=True, indent=indent,
+                                      separators=(item_separator, key_separator))
+                    cards[card] = text if indent is None else text.replace('\n', '\n' + ' ' * indent * CARD_LEVEL)
+    return cards
+
+# Every packed card, as it appears in a hand, in each style
+CARD_JSON = {style: _card_json(style) for style in STYLES}
+
+
+def _join(opening, values, closing, level, style):
+    """Values written out between brackets, as json.dumps would at the given depth"""
+    item_separator, _, indent = style
+    if indent is None:
+        return opening + item_separator.join(values) + closing
+    if not values:
+        return opening + closing
+    newline = '\n' + ' ' * indent * (level + 1)
+    return opening + newline + (item_separator + newline).join(values) + '\n' + ' ' * indent * level + closing
+
+
+def _list(values, level, style):
+    return _join('[', values, ']', level, style)
+
+
+def _object(items, level, style):
+    return _join('{', ['"%s"%s%s' % (key, style[1], value) for key, value in items], '}', level, style)
+
+
+@lru_cache(maxsize=64)
+def _url_prefix(url_root):
+    # The url root comes from the request's Host header, so only the most recent are kept
+    return url_for('api.get_games', _external=True) + '/'
+
+
+def game_url(game_id):
+    """The same as url_for('api.get_specific_game', game_id=game_id, _external=True)"""
+    return _url_prefix(request.url_root if has_request_context() else None) + str(game_id)
+
+
+def _value(value):
+    if value is None:
+        return 'null'
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    return int.__repr__(value)
+
+
+def game_json(game, seat=0, style=JSON_STYLE):
+    """A game as seen from a seat, as JSON text laid out in the given style"""
+    state = game.to_state()
+    num_players = len(game.players)
+    hands = state.hands[-seat:] + state.hands[:seat]
+    cards = CARD_JSON[style]
+
+    return _object([
+        ('chameleonMode', _value(game.chameleon_mode)),
+        ('deckSize', str(len(state.deck))),
+        ('discard', _object([(str(colour), _list(list(map(str, pile)), 2, style))
+                             for colour, pile in zip(COLOURS, state.discard)], 1, style)),
+        ('finalScore', _value(state.final_score)),
+        ('hands', _list([_list([cards[card] for card in hand], 2, style) for hand in hands], 1, style)),
+        ('hardMode', _value(game.hard_mode)),
+        ('hints', _value(state.hints)),
+        ('inPlay', _object([(str(colour), str(rank)) for colour, rank in zip(COLOURS, state.in_play)], 1, style)),
+        ('lastPlayer', _value(state.last_player and (state.last_player + seat) % num_players)),
+        ('lastTurn', _value(state.last_turn)),
+        ('maxScore', _value(state.max_score)),
+        ('misfires', _value(state.misfires)),
+        ('perfectMode', _value(game.perfect_mode)),
+        ('started', _value(state.started)),
+        ('turn', _value((state.turn + seat) % num_players)),
+        ('url', '"' + game_url(game.id) + '"')
+    ], 0, style)
+
+
+def jsonify_style():
+    """The style jsonify lays out its text in, for the current request"""
+    if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] and not request.is_xhr:
+        return PRETTY_STYLE
+    return COMPACT_STYLE
+
+
+def compact_dumps(data):
+    """data as JSON on one line, with no spaces"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+    return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+def dumps(data):
+    """The text of jsonify(data), for the current request"""
+    if jsonify_style() is PRETTY_STYLE:
+        return json.dumps(data, indent=2, separators=(', ', ': '), sort_keys=True) + '\n'
+    return compact_dumps(data) + '\n'
+
+
+def game_response(game, seat):
+    """The text of jsonify(game.to_json(seat)), for the current request"""
+    return game_json(game, seat, jsonify_style()) + '\n'
@@ -0,0 +1,177 @@
+"""Games between bots, played on GameState alone and spread over worker processes, for testing policies at scale"""
+import json
+import random
+import time
+from itertools import product
+from multiprocessing import Pool, cpu_count
+
+from hanabi.models import Colour, GameState, Move
+from hanabi.models.card import CARD_BITS, KNOWN_COLOUR_BITS, KNOWN_COLOUR_SHIFT, KNOWN_RANK
+from hanabi.models.move import COLOUR_NAMES
+
+# Generous upper bound on the length of a game, in case a policy finds a way to stall forever
+MAX_TURNS = 500
+
+
+def legal_moves(state):
+    """Every valid move for the player whose turn it is, as the json the API would receive"""
+    player = state.turn
+    hand = state.hands[player]
+    moves = []
+
+    if state.hints > 0:
+        for offset in range(1, state.num_players):
+            other_hand = [card & CARD_BITS for card in state.hands[(player + offset) % state.num_players]]
+            if not other_hand:
+                continue
+
+            # In chameleon mode a rainbow card is touched by every hint, rank hints included
+            colours = {card // 10 for card in other_hand}
+            any_hint = state.chameleon_mode and Colour.RAINBOW in colours
+            ranks = range(1, 6) if any_hint else sorted({card % 10 for card in other_hand})
+            if state.chameleon_mode:
+                colours = range(5) if any_hint else sorted(colours)
+            else:
+                colours = sorted(colours)
+
+            moves.extend({'type': 'hint', 'rank': rank, 'playerIndex': offset} for rank in ranks)
+            moves.extend({'type': 'hint', 'colour': COLOUR_NAMES[colour], 'playerIndex': offset}
+                         for colour in colours)
+
+    moves.extend({'type': 'play', 'cardIndex': i} for i in range(len(hand)))
+    if state.hints < 8:
+        moves.extend({'type': 'discard', 'cardIndex': i} for i in range(len(hand)))
+
+    return moves
+
+
+class Policy:
+    """A bot. Policies may look at everyone's cards but their own, where they only get what they've been told"""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def choose_move(self, state):
+        raise NotImplementedError
+
+
+class RandomPolicy(Policy):
+    """Picks uniformly from the legal moves"""
+
+    def choose_move(self, state):
+        moves = legal_moves(state)
+        return self.rng.choice(moves) if moves else None
+
+
+class CautiousPolicy(Policy):
+    """Plays cards it knows are playable, hints about other players' playable cards, and otherwise discards the
+    oldest card it knows nothing about"""
+
+    def choose_move(self, state):
+        player = state.turn
+        hand = state.hands[player]
+
+        for i, card in enumerate(hand):
+            known_colour = (card & KNOWN_COLOUR_BITS) >> KNOWN_COLOUR_SHIFT
+            if card & KNOWN_RANK and known_colour and state.in_play[known_colour - 1] + 1 == (card & CARD_BITS) % 10:
+                return {'type': 'play', 'cardIndex': i}
+
+        if state.hints > 0:
+            for offset in range(1, state.num_players):
+                for card in state.hands[(player + offset) % state.num_players]:
+                    colour, rank = divmod(card & CARD_BITS, 10)
+                    if state.in_play[colour] + 1 != rank:
+                        continue
+                    if not card & KNOWN_RANK:
+                        return {'type': 'hint', 'rank': rank, 'playerIndex': offset}
+                    if not card & KNOWN_COLOUR_BITS and not (state.chameleon_mode and colour == Colour.RAINBOW):
+                        return {'type': 'hint', 'colour': COLOUR_NAMES[colour], 'playerIndex': offset}
+
+        if state.hints < 8 and hand:
+            unknown = [i for i, card in enumerate(hand) if not card & (KNOWN_RANK | KNOWN_COLOUR_BITS)]
+            return {'type': 'discard', 'cardIndex': unknown[0] if unknown else 0}
+
+        moves = legal_moves(state)
+        return self.rng.choice(moves) if moves else None
+
+
+POLICIES = {
+    'random': RandomPolicy,
+    'cautious': CautiousPolicy
+}
+
+
+def play_game(seed, num_players=3, policy='cautious', hard_mode=False, perfect_mode=False, chameleon_mode=False):
+    """Play one game to the end and return a summary of it. The same seed always plays the same game"""
+    state = GameState(num_players=num_players, hard_mode=hard_mode, perfect_mode=perfect_mode,
+                      chameleon_mode=chameleon_mode)
+    state.start(random.Random(seed))
+    bot = POLICIES[policy](random.Random(seed))
+
+    turns = 0
+    hints_given = 0
+    while state.final_score is None and turns < MAX_TURNS:
+        move_json = bot.choose_move(state)
+        if move_json is None:
+            # Nobody can do anything, e.g. a perfect mode game with empty hands and no hints
+            break
+
+        state.make_move(Move(move_json, state.turn, num_players))
+        turns += 1
+        if move_json['type'] == 'hint':
+            hints_given += 1
+
+    return {
+        'seed': seed,
+        'players': num_players,
+        'policy': policy,
+        'hardMode': hard_mode,
+        'perfectMode': perfect_mode,
+        'chameleonMode': chameleon_mode,
+        'score': state.score,
+        'finalScore': state.final_score,
+        'turns': turns,
+        'misfires': 3 - state.misfires,
+        'hintsGiven': hints_given
+    }
+
+
+def _play_task(task):
+    return play_game(*task)
+
+
+def simulate(games, output, num_players=3, policy='cautious', hard_mode=False, perfect_mode=False,
+             chameleon_mode=False, all_modes=False, processes=None, seed=0):
+    """Play games across a process pool, writing one json line per game to output. Returns a summary dict.
+
+    With all_modes the games are spread evenly over every combination of hard, perfect and chameleon mode"""
+    if all_modes:
+        modes = list(product([False, True], repeat=3))
+    else:
+        modes = [(hard_mode, perfect_mode, chameleon_mode)]
+
+    tasks = [(seed + i, num_players, policy) + modes[i % len(modes)] for i in range(games)]
+    processes = processes or cpu_count()
+
+    # Big enough chunks that workers aren't waiting on the parent, small enough that they all finish together
+    chunksize = max(1, games // (processes * 16))
+
+    totals = {}
+    start = time.perf_counter()
+    with Pool(processes) as pool:
+        for result in pool.imap_unordered(_play_task, tasks, chunksize):
+            output.write(json.dumps(result) + '\n')
+            mode = (result['hardMode'], result['perfectMode'], result['chameleonMode'])
+            count, score, misfires = totals.get(mode, (0, 0, 0))
+            totals[mode] = (count + 1, score + (result['finalScore'] or 0), misfires + result['misfires'])
+    seconds = time.perf_counter() - start
+
+    return {
+        'games': games,
+        'processes': processes,
+        'seconds': seconds,
+        'gamesPerSecond': games / seconds if seconds else float('inf'),
+        'modes': [{'hardMode': mode[0], 'perfectMode': mode[1], 'chameleonMode': mode[2], 'games': count,
+                   'averageScore': score / count, 'averageMisfires': misfires / count}
+                  for mode, (count, score, misfires) in sorted(totals.items())]
+    }
@@ -44,5 +44,99 @@ def test(coverage=False, test_name=None):
         print('HTML version: file://%s/index.html' % covdir)
         COV.erase()
 
+
+@manager.option('-n', '--games', type=int, default=1000, help='Number of games to play')
+@manager.option('-p', '--players', type=int, default=3, help='Players per game')
+@manager.option('--policy', default='cautious', help='Bot policy: random or cautious')
+@manager.option('--hard-mode', dest='hard_mode', action='store_true', default=False)
+@manager.option('--perfect-mode', dest='perfect_mode', action='store_true', default=False)
+@manager.option('--chameleon-mode', dest='chameleon_mode', action='store_true', default=False)
+@manager.option('--all-modes', dest='all_modes', action='store_true', default=False,
+                help='Spread the games over every combination of modes')
+@manager.option('-j', '--processes', type=int, default=None, help='Worker processes (default: one per core)')
+@manager.option('-s', '--seed', type=int, default=0, help='Seed of the first game')
+@manager.option('-o', '--output', default='simulation.jsonl', help='Where to write one json line per game')
+def simulate(games, players, policy, hard_mode, perfect_mode, chameleon_mode, all_modes, processes, seed, output):
+    """Play games between bots without a database and report the scores."""
+    from hanabi.simulation import simulate as run_simulation
+
+    with open(output, 'w') as f:
+        summary = run_simulation(games, f, num_players=players, policy=policy, hard_mode=hard_mode,
+                                 perfect_mode=perfect_mode, chameleon_mode=chameleon_mode, all_modes=all_modes,
+                                 processes=processes, seed=seed)
+
+    for mode in summary['modes']:
+        print('hard=%-5s perfect=%-5s chameleon=%-5s  %6d games  average score %5.2f  average misfires %4.2f' % (
+            mode['hardMode'], mode['perfectMode'], mode['chameleonMode'], mode['games'], mode['averageScore'],
+            mode['averageMisfires']))
+    print('%d games in %.2fs on %d processes: %.0f games/sec' % (
+        summary['games'], summary['seconds'], summary['processes'], summary['gamesPerSecond']))
+
+
+@manager.command
+def upgrade():
+    """Add the tables, columns and indexes a database from an older version is missing."""
+    from hanabi.migrate import upgrade_schema
+
+    added = upgrade_schema()
+    print('Added %s' % ', '.join(added) if added else 'Already up to date')
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500, help='Games to convert per commit')
+def migrate_state(batch_size):
+    """Convert games stored as pickles to the binary state encoding."""
+    from hanabi.migrate import migrate_state as run_migration
+
+    print('Converted %d games' % run_migration(batch_size))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=500, help='Games to index per commit')
+def index_players(batch_size):
+    """Add the players of games made before the players table to it."""
+    from hanabi.migrate import index_players as run_indexing
+
+    print('Indexed %d games' % run_indexing(batch_size))
+
+
+@manager.option('-b', '--batch-size', dest='batch_size', type=int, default=None, help='Games to reap per commit')
+def reap(batch_size):
+    """Move old finished games to the archive and delete abandoned ones."""
+    from hanabi.reaper import reap as run_reaper
+
+    stats = run_reaper(app, batch_size)
+    if stats is None:
+        print('Already reaping in another process')
+    else:
+        print('Archived %d games and deleted %d in %.2fs: %.0f games/sec' % (
+            stats['archived'], stats['deleted'], stats['seconds'], stats['gamesPerSecond']))
+
+
+@manager.option('-o', '--output', default='games.replay', help='Replay file to write')
+@manager.option('-a', '--archive', dest='archives', action='append', default=[],
+                help='Archive file to include as well as the database (may be given more than once)')
+def export_replays(output, archives):
+    """Write every finished game to a replay file for analysis."""
+    from hanabi.replay import ReplayWriter, export_replays as run_export
+
+    with open(output, 'wb') as f:
+        print('Wrote %d games' % run_export(ReplayWriter(f), archives))
+
+
+@manager.option('paths', nargs='+', help='Replay files to read')
+@manager.option('-j', '--processes', type=int, default=None, help='Worker processes (default: one per core)')
+def analyze(paths, processes):
+    """Report scores, misfires and hints across replay files."""
+    from hanabi.replay import analyze as run_analysis
+
+    summary = run_analysis(paths, processes)
+    for mode in summary['modes']:
+        print('hard=%-5s perfect=%-5s chameleon=%-5s %d players  %8d games  average score %5.2f  '
+              'misfires %4.2f (%4.1f%% of plays, %4.1f%% lost)  hints %5.2f' % (
+                  mode['hardMode'], mode['perfectMode'], mode['chameleonMode'], mode['players'], mode['games'],
+                  mode['averageScore'], mode['averageMisfires'], 100 * mode['misfiresPerPlay'],
+                  100 * mode['lostToMisfires'], mode['averageHints']))
+    print('%d games in %.2fs on %d processes: %.0f games/sec' % (
+        summary['games'], summary['seconds'], summary['processes'], summary['gamesPerSecond']))
+
 if __name__ == '__main__':
-    manager.run()
\ No newline at end of file
+    manager.run()
@@ -0,0 +1,42 @@
+import json
+import random
+
+from flask import url_for
+
+from hanabi.models import Card
+
+COLOURS = ['blue', 'green', 'red', 'white', 'yellow', 'rainbow']
+
+
+def random_move_json(state):
+    """Pick a move that is well formed, but not necessarily valid. Plays are mostly of playable cards, so that games
+    run long enough to empty the deck"""
+    hand = state.hands[state.turn]
+    move_type = random.choice(['hint', 'hint', 'play', 'discard', 'discard'])
+    if move_type == 'play':
+        playable = [i for i, card in enumerate(map(Card, hand)) if state.in_play[card.colour] + 1 == card.rank]
+        if playable and random.random() < 0.9:
+            return {'type': 'play', 'cardIndex': random.choice(playable)}
+        if random.random() < 0.8:
+            move_type = 'discard'
+    if move_type != 'hint':
+        return {'type': move_type, 'cardIndex': random.randrange(max(len(hand), 1))}
+
+    if random.random() < 0.5:
+        return {'type': 'hint', 'rank': random.randint(1, 5), 'playerIndex': random.randint(0, 4)}
+    return {'type': 'hint', 'colour': random.choice(COLOURS), 'playerIndex': random.randint(0, 4)}
+
+
+def hint_headers(player_id):
+    return {'Content-Type': 'application/json', 'id': player_id}
+
+
+def hint_body(player_index):
+    """A hint about ones, which every dealt hand in the tests has"""
+    return json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': player_index})
+
+
+def hint(client, game_id, player_id, player_index=1):
+    """Have player_id hint player_index through the Flask app"""
+    return client.put(url_for('api.make_move', game_id=game_id), headers=hint_headers(player_id),
+                      data=hint_body(player_index))
@@ -0,0 +1,191 @@
+import json
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import threading
+import unittest
+
+from hanabi import create_app, db
+from hanabi.actors import ActorPool, HashRing, actor_pool, private_directory
+from hanabi.api.v1.games import actor_move
+from hanabi.models import Card, Game, LoggedMove, Move
+
+from helpers import hint
+
+
+class HashRingTestCase(unittest.TestCase):
+    def test_owner(self):
+        """Every key has an owner, and the same one every time"""
+        ring = HashRing(['a', 'b', 'c'])
+        owners = [ring.owner(key) for key in range(3000)]
+
+        self.assertListEqual(owners, [HashRing(['c', 'a', 'b']).owner(key) for key in range(3000)])
+        for node in 'abc':
+            self.assertGreater(owners.count(node), 600)
+
+    def test_add_node(self):
+        """A new node only takes keys, and only its share of them"""
+        before = HashRing(['a', 'b', 'c'])
+        after = HashRing(['a', 'b', 'c', 'd'])
+
+        moved = [key for key in range(3000) if before.owner(key) != after.owner(key)]
+        self.assertTrue(all(after.owner(key) == 'd' for key in moved))
+        self.assertLess(len(moved), 1200)
+
+    def test_empty(self):
+        self.assertIsNone(HashRing([]).owner(1))
+
+
+class ActorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['GAME_ACTORS'] = True
+        self.app.config['ACTOR_SOCKET_DIR'] = self.socket_dir = tempfile.mkdtemp()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+        self.pool = actor_pool(self.app, actor_move)
+        self.other = None
+
+    def tearDown(self):
+        self.pool.stop()
+        if self.other is not None:
+            self.other.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.socket_dir)
+
+    def add_game(self, owner):
+        """A started game whose id hashes to owner"""
+        ring = self.pool.ring()
+        game_id = next(game_id for game_id in range(1, 100) if ring.owner(game_id) == owner)
+        db.session.add(Game(id=game_id, players=['id1', 'id2'], started=True, deck=[5, 4, 3],
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        return game_id
+
+    def hint(self, game_id, player_id):
+        return hint(self.client, game_id, player_id)
+
+    def test_local_game(self):
+        """Games owned by this worker stay in memory between moves"""
+        game_id = self.add_game(self.pool.name)
+
+        response = self.hint(game_id, 'id1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['hints'], 7)
+        self.assertIn(game_id, self.pool.games)
+
+        response = self.hint(game_id, 'id2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LoggedMove.query.filter_by(game_id=game_id).count(), 2)
+
+        # Players still get checked
+        self.assertEqual(self.hint(game_id, 'id3').status_code, 403)
+
+    def test_stale_game(self):
+        """Changes made around the owner are conflicts rather than errors, and the owner reloads the game after them"""
+        self.app.config['SNAPSHOT_INTERVAL'] = 2
+        game_id = self.add_game(self.pool.name)
+        self.assertEqual(self.hint(game_id, 'id1').status_code, 200)
+
+        # The snapshot was rewritten, so writing the next one fails the version check
+        db.session.execute(Game.__table__.update().where(Game.id == game_id).values(version=Game.version + 1))
+        db.session.commit()
+        self.assertEqual(self.hint(game_id, 'id2').status_code, 409)
+        self.assertNotIn(game_id, self.pool.games)
+        self.assertEqual(self.hint(game_id, 'id2').status_code, 200)
+
+        def move_around(*players):
+            game = Game.query.get(game_id)
+            for player in players:
+                game.make_move(Move({'type': 'hint', 'rank': 1, 'playerIndex': 1}, player, 2))
+            db.session.commit()
+
+        # It's id2's turn in the database but not in memory, so the move is checked against the database again
+        move_around(0)
+        self.assertEqual(self.hint(game_id, 'id2').status_code, 200)
+
+        # The owner's next move goes to a place in the log that's taken
+        move_around(0, 1)
+        self.assertEqual(self.hint(game_id, 'id1').status_code, 409)
+        self.assertNotIn(game_id, self.pool.games)
+
+        response = self.hint(game_id, 'id1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['hints'], 1)
+
+    def test_forwarded_game(self):
+        """Moves for another worker's games are made by that worker"""
+        self.other = ActorPool(self.app, actor_move, self.socket_dir, name='other')
+        self.other.start()
+        game_id = self.add_game('other')
+
+        response = self.hint(game_id, 'id1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(game_id, self.other.games)
+        self.assertNotIn(game_id, self.pool.games)
+
+        # When the other worker stops, this one takes over
+        self.other.stop()
+        self.assertEqual(self.hint(game_id, 'id2').status_code, 200)
+        self.assertIn(game_id, self.pool.games)
+
+    def test_dead_worker(self):
+        """A worker that died without removing its socket is dropped from the ring"""
+        path = os.path.join(self.socket_dir, 'dead.sock')
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        dead.bind(path)
+        dead.close()
+        game_id = self.add_game('dead')
+
+        self.assertEqual(self.hint(game_id, 'id1').status_code, 200)
+        self.assertFalse(os.path.exists(path))
+
+    def test_unresponsive_worker(self):
+        """A worker that takes a move but doesn't answer gets a 503, rather than the move being made twice"""
+        self.pool.timeout = 0.1
+        path = os.path.join(self.socket_dir, 'stuck.sock')
+        stuck = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stuck.bind(path)
+        stuck.listen(2)
+        game_id = self.add_game('stuck')
+
+        def hang_up():
+            # Read the message and hang up without a reply
+            connection, _ = stuck.accept()
+            with connection:
+                connection.makefile('rb').readline()
+
+        try:
+            self.assertEqual(self.hint(game_id, 'id1').status_code, 503)
+            stuck.accept()[0].close()
+
+            hanging_up = threading.Thread(target=hang_up)
+            hanging_up.start()
+            self.assertEqual(self.hint(game_id, 'id1').status_code, 503)
+            hanging_up.join()
+        finally:
+            stuck.close()
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(LoggedMove.query.filter_by(game_id=game_id).count(), 0)
+
+    def test_socket_dir(self):
+        """Only the user the workers run as can get into the socket directory"""
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_dir).st_mode), 0o700)
+
+        loose = os.path.join(self.socket_dir, 'loose')
+        os.mkdir(loose, 0o777)
+        os.chmod(loose, 0o777)
+        private_directory(loose)
+        self.assertEqual(stat.S_IMODE(os.stat(loose).st_mode), 0o700)
+
+        link = os.path.join(self.socket_dir, 'link')
+        os.symlink(loose, link)
+        with self.assertRaises(RuntimeError):
+            private_directory(link)
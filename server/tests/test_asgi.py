@@ -0,0 +1,152 @@
+import asyncio
+import json
+import unittest
+
+from hanabi import create_app, db
+from hanabi.asgi import AsyncApp
+from hanabi.events import event_hub
+from hanabi.models import Card, Game
+
+from helpers import hint_body, hint_headers
+
+
+def parse_event(body):
+    fields = dict(line.split(': ', 1) for line in body.decode('utf-8').strip().split('\n'))
+    return fields['id'], json.loads(fields['data'])
+
+
+class AsgiTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['GAME_EVENTS_POLL'] = 0.01
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        # One thread, as the tests' in-memory database is a single connection
+        self.asgi = AsyncApp(self.app, threads=1)
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+        db.session.add(Game(players=['id1', 'id2'], started=True, deck=[5, 4, 3],
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+        self.asgi.executor.shutdown()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def open(self, path, method='GET', query=b'', headers=None, body=b''):
+        """Start a request. Returns a queue of what the app sends, and an event that disconnects the client"""
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query, 'scheme': 'http',
+                 'server': ('localhost', 80), 'client': ('127.0.0.1', 5000),
+                 'headers': [(b'host', b'localhost')] + [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                                          for name, value in (headers or {}).items()]}
+        sent = asyncio.Queue()
+        disconnected = asyncio.Event()
+        messages = [{'type': 'http.request', 'body': body}]
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        task = asyncio.ensure_future(self.asgi(scope, receive, sent.put))
+        return sent, disconnected, task
+
+    async def response(self, *args, **kwargs):
+        sent, _, task = self.open(*args, **kwargs)
+        await task
+        start = sent.get_nowait()
+        body = b''
+        while not sent.empty():
+            body += sent.get_nowait()['body']
+        return start['status'], dict(start['headers']), body
+
+    def request(self, *args, **kwargs):
+        return self.loop.run_until_complete(self.response(*args, **kwargs))
+
+    def hint(self, player_id, player_index):
+        return self.response('/api/v1/games/1/action', method='PUT',
+                             headers=hint_headers(player_id), body=hint_body(player_index).encode('utf-8'))
+
+    def test_routes(self):
+        """Requests that don't hold a connection get what the Flask app would send"""
+        status, headers, body = self.request('/api/v1/games/1', headers={'id': 'id1'})
+        expected = self.app.test_client().get('/api/v1/games/1', headers={'id': 'id1'})
+        self.assertEqual(status, 200)
+        self.assertEqual(body, expected.data)
+        self.assertEqual(headers[b'etag'].decode('latin-1'), expected.headers['ETag'])
+
+        self.assertEqual(self.loop.run_until_complete(self.hint('id1', 1))[0], 200)
+        self.assertEqual(self.request('/api/v1/games/1', headers={'id': 'id3'})[0], 403)
+        self.assertEqual(self.request('/api/v1/games/2/events', headers={'id': 'id1'})[0], 404)
+        self.assertEqual(self.request('/api/v1/games/1/events', headers={'id': 'id3'})[0], 403)
+
+    def test_stream(self):
+        """A stream starts with the game, gets each change, and leaves the hub when the client goes away"""
+        async def stream():
+            sent, disconnected, task = self.open('/api/v1/games/1/events', headers={'id': 'id2'})
+            start = await asyncio.wait_for(sent.get(), 5)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+
+            first_id, json_game = parse_event((await asyncio.wait_for(sent.get(), 5))['body'])
+            self.assertEqual(json_game['hands'][1][0]['rank'], 1)
+            self.assertEqual(event_hub(self.app).subscribers(1), 1)
+
+            self.assertEqual((await self.hint('id1', 1))[0], 200)
+            while True:
+                body = (await asyncio.wait_for(sent.get(), 5))['body']
+                if not body.startswith(b':'):
+                    break
+            event_id, json_game = parse_event(body)
+            self.assertNotEqual(event_id, first_id)
+            self.assertTrue(json_game['hands'][0][0]['knownRank'])
+
+            disconnected.set()
+            await asyncio.wait_for(task, 5)
+            self.assertEqual(event_hub(self.app).subscribers(1), 0)
+
+        self.loop.run_until_complete(stream())
+
+    def test_long_poll(self):
+        """Waiting for a game returns as soon as it changes, or says nothing changed when the wait is up"""
+        etag = self.request('/api/v1/games/1', headers={'id': 'id1'})[1][b'etag'].decode('latin-1')
+        status, headers, _ = self.request('/api/v1/games/1', query=b'wait=0.05',
+                                          headers={'id': 'id1', 'If-None-Match': etag})
+        self.assertEqual(status, 304)
+        self.assertEqual(headers[b'etag'].decode('latin-1'), etag)
+
+        async def poll():
+            waiting = asyncio.ensure_future(self.response('/api/v1/games/1', query=b'wait=10',
+                                                          headers={'id': 'id1', 'If-None-Match': etag}))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiting.done())
+            await self.hint('id1', 1)
+            return await asyncio.wait_for(waiting, 5)
+
+        status, headers, body = self.loop.run_until_complete(poll())
+        self.assertEqual(status, 200)
+        self.assertNotEqual(headers[b'etag'].decode('latin-1'), etag)
+        self.assertTrue(json.loads(body.decode('utf-8'))['hands'][1][0]['knownRank'])
+        self.assertEqual(event_hub(self.app).subscribers(1), 0)
+
+    def test_bad_wait(self):
+        """A wait that isn't a finite number of seconds is refused as the Flask view would, and a long one is cut
+        short"""
+        for wait in [b'nan', b'inf', b'abc', b'']:
+            status, _, body = self.request('/api/v1/games/1', query=b'wait=' + wait, headers={'id': 'id1'})
+            self.assertEqual(status, 400)
+            self.assertEqual(json.loads(body.decode('utf-8')), {'error': 'wait must be a number of seconds'})
+
+        self.app.config['LONG_POLL_MAX'] = 0.05
+        etag = self.request('/api/v1/games/1', headers={'id': 'id1'})[1][b'etag'].decode('latin-1')
+        status = self.loop.run_until_complete(asyncio.wait_for(
+            self.response('/api/v1/games/1', query=b'wait=1e9', headers={'id': 'id1', 'If-None-Match': etag}), 5))[0]
+        self.assertEqual(status, 304)
@@ -0,0 +1,96 @@
+import random
+import unittest
+
+from hanabi.exceptions import InvalidMove
+from hanabi.models import GameState, Move, MoveType
+
+from helpers import random_move_json
+
+try:
+    import numpy as np
+    from hanabi.batch import BatchGames, deck_cards
+except ImportError:
+    np = None
+
+
+def snapshot(state):
+    return {
+        'deck': list(state.deck),
+        'hands': [list(hand) for hand in state.hands],
+        'discard': [sorted(ranks) for ranks in state.discard],
+        'in_play': list(state.in_play),
+        'reachable': list(state.reachable),
+        'numbers': (state.hints, state.misfires, state.score, state.final_score, state.last_turn, state.last_player,
+                    state.turn)
+    }
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class BatchGamesTestCase(unittest.TestCase):
+    def test_new(self):
+        """New batches are dealt like GameState.start"""
+        batch = BatchGames.new(50, 4, hard_mode=True, rng=np.random.default_rng(0))
+
+        for i in range(50):
+            state = batch.get_state(i)
+            self.assertEqual(len(state.deck), 39)
+            self.assertTrue(all(len(hand) == 4 for hand in state.hands))
+            cards = sorted(state.deck + [card for hand in state.hands for card in hand])
+            self.assertEqual(cards, sorted(map(int, deck_cards(hard_mode=True))))
+
+    def cross_check(self, num_players, **settings):
+        """Random moves give the same results in a batch as in separate GameStates"""
+        states = []
+        for seed in range(40):
+            random.seed(seed)
+            state = GameState(num_players=num_players, **settings)
+            state.start()
+            states.append(state)
+        batch = BatchGames.from_states(states)
+
+        for _ in range(150):
+            playing = batch.games[:batch.live]
+            move_type = np.zeros(len(playing), dtype=np.int8)
+            card_index = np.zeros(len(playing), dtype=np.int8)
+            hinted_player = np.zeros(len(playing), dtype=np.int8)
+            hint_colour = np.full(len(playing), -1, dtype=np.int8)
+            hint_rank = np.zeros(len(playing), dtype=np.int8)
+            expected = []
+
+            for slot, i in enumerate(playing):
+                state = states[i]
+                move = Move(random_move_json(state), state.turn, num_players)
+                move_type[slot] = move.move_type
+                if move.move_type == MoveType.HINT:
+                    hinted_player[slot] = move.hinted_player
+                    hint_colour[slot] = -1 if move.hint_colour is None else move.hint_colour
+                    hint_rank[slot] = move.hint_rank or 0
+                else:
+                    card_index[slot] = move.card_index
+
+                try:
+                    state.make_move(move)
+                    expected.append(True)
+                except (InvalidMove, IndexError):
+                    expected.append(False)
+
+            valid = batch.step(move_type, card_index, hinted_player, hint_colour, hint_rank)
+
+            self.assertListEqual(list(valid), expected)
+            for i, state in enumerate(states):
+                self.assertEqual(snapshot(batch.get_state(i)), snapshot(state))
+            self.assertListEqual(list(batch.max_score), [state.max_score for state in states])
+            self.assertListEqual(list(batch.in_progress), [state.final_score is None for state in states])
+
+        # Only finished games were moved out of play, and some were
+        self.assertLess(batch.live, len(states))
+        self.assertFalse(any(states[i].final_score is None for i in batch.games[batch.live:]))
+
+    def test_cross_check(self):
+        self.cross_check(2)
+
+    def test_cross_check_hard_perfect(self):
+        self.cross_check(3, hard_mode=True, perfect_mode=True)
+
+    def test_cross_check_chameleon(self):
+        self.cross_check(5, chameleon_mode=True)
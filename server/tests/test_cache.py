@@ -0,0 +1,184 @@
+import json
+import unittest
+
+from flask import url_for
+from sqlalchemy import event
+
+from hanabi import create_app, db
+from hanabi.cache import MAX_RENDERS, GameCache, cached_game, game_cache
+from hanabi.models import Card, Game
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_game(game_id, version=1, snapshot_seq=0):
+    return Game(id=game_id, version=version, snapshot_seq=snapshot_seq)
+
+
+class GameCacheTestCase(unittest.TestCase):
+    def test_lru(self):
+        """The least recently used game goes first"""
+        cache = GameCache(2, 10)
+        for game_id in [1, 2]:
+            cache.put(fake_game(game_id))
+        cache.get(1)
+        cache.put(fake_game(3))
+
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNotNone(cache.get(3))
+        self.assertDictEqual(cache.stats(), {'size': 2, 'hits': 3, 'misses': 1, 'evictions': 1, 'renders': 0})
+
+    def test_ttl(self):
+        clock = FakeClock()
+        cache = GameCache(2, 10, clock)
+        cache.put(fake_game(1))
+
+        clock.now = 9
+        self.assertIsNotNone(cache.get(1))
+        clock.now = 11
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(len(cache), 0)
+
+    def test_revision(self):
+        """An older copy of a game doesn't replace a newer one"""
+        cache = GameCache(2, 10)
+        cache.put(fake_game(1, snapshot_seq=5))
+        cache.put(fake_game(1, snapshot_seq=4))
+        self.assertEqual(cache.get(1).snapshot_seq, 5)
+
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+
+
+class CachedRoutesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['GAME_CACHE_SIZE'] = 16
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add(Game(players=['id1', 'id2'], started=True, deck=[5, 4, 3],
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get_game(self, player_id='id1'):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(url_for('api.get_specific_game', game_id=1), headers={'id': player_id})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.data.decode('utf-8')), statements
+
+    def test_polling(self):
+        """Polling an unchanged game doesn't query the database, and a move shows up straight away"""
+        # The first request warms the cache with this game
+        self.get_game()
+        json_game, statements = self.get_game()
+        self.assertListEqual(statements, [])
+        self.assertEqual(json_game['hints'], 8)
+
+        response = self.client.put(
+            url_for('api.make_move', game_id=1),
+            headers={'Content-Type': 'application/json', 'id': 'id1'},
+            data=json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1}))
+        self.assertEqual(response.status_code, 200)
+        db.session.commit()
+
+        json_game, statements = self.get_game()
+        self.assertNotEqual(statements, [])
+        self.assertEqual(json_game['hints'], 7)
+        self.assertEqual(game_cache(self.app).hits, 2)
+
+    def test_rendering(self):
+        """A cached game is rendered once for each seat, and again once it changes"""
+        cache = game_cache(self.app)
+        for _ in range(3):
+            json_game, _ = self.get_game()
+            self.assertEqual(json_game['hands'][1][0]['colour'], 5)
+        self.assertEqual(cache.renders, 1)
+
+        json_game, _ = self.get_game('id2')
+        self.assertEqual(json_game['hands'][1][0]['colour'], 0)
+        self.assertEqual(cache.renders, 2)
+
+        response = self.client.put(
+            url_for('api.make_move', game_id=1),
+            headers={'Content-Type': 'application/json', 'id': 'id1'},
+            data=json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1}))
+        self.assertEqual(response.status_code, 200)
+        db.session.commit()
+
+        json_game, _ = self.get_game()
+        self.assertEqual(json_game['hints'], 7)
+        self.assertEqual(cache.renders, 3)
+
+    def test_rendering_limit(self):
+        """Only so many renders are kept with a game, however many url roots it's asked for with"""
+        cache = game_cache(self.app)
+        self.get_game()
+        game = cached_game(self.app, 1)
+        for i in range(MAX_RENDERS * 2):
+            self.assertEqual(cache.rendered(game, (0, 'http://%d.example.com/' % i), lambda: b'{}'), b'{}')
+        self.assertEqual(cache.renders, MAX_RENDERS)
+
+    def test_batch(self):
+        """Games that aren't cached are loaded together, moves and all, and come out as they would one at a time"""
+        for i in range(3):
+            db.session.add(Game(players=['id1', 'id%d' % (i + 3)], started=True, deck=[5, 4, 3],
+                                hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        for game_id in [2, 3]:
+            response = self.client.put(
+                url_for('api.make_move', game_id=game_id),
+                headers={'Content-Type': 'application/json', 'id': 'id1'},
+                data=json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1}))
+            self.assertEqual(response.status_code, 200)
+        db.session.commit()
+        db.session.remove()
+        singles = [self.client.get(url_for('api.get_specific_game', game_id=game_id), headers={'id': 'id1'}).data
+                   for game_id in [1, 2, 3, 4]]
+
+        game_cache(self.app).invalidate(2)
+        game_cache(self.app).invalidate(3)
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.post(
+                url_for('api.get_many_games'), headers={'Content-Type': 'application/json'},
+                data=json.dumps([{'gameId': game_id, 'playerId': 'id1'} for game_id in [1, 2, 3, 4]]))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(statements), 2)
+        self.assertListEqual(json.loads(response.data.decode('utf-8')),
+                             [json.loads(single.decode('utf-8')) for single in singles])
+        self.assertEqual(json.loads(response.data.decode('utf-8'))[1]['hints'], 7)
+
+    def test_missing_game(self):
+        response = self.client.get(url_for('api.get_specific_game', game_id=2), headers={'id': 'id1'})
+        self.assertEqual(response.status_code, 404)
@@ -1,6 +1,9 @@
+import pickle
 import unittest
 
 from hanabi.models import Card, Colour, new_deck
+from hanabi.models import card as card_module
+from hanabi.models.codec import HandsPickler, pack_hand
 
 
 class CardModelTestCase(unittest.TestCase):
@@ -49,3 +52,51 @@ class NewDeckTestCase(unittest.TestCase):
         # One of each rainbow
         for rank in range(1, 5):
             self.assertEqual(len(list(filter(lambda x: x == 50 + rank, d))), 1)
+
+
+class PackedCardTestCase(unittest.TestCase):
+    def test_pack(self):
+        """Knowledge is packed into the same integer as the card"""
+        c = Card.pack(53, Colour.RED, True)
+
+        self.assertEqual(c.to_num(), 53)
+        self.assertEqual(c.colour, Colour.RAINBOW)
+        self.assertEqual(c.rank, 3)
+        self.assertEqual(c.known_colour, Colour.RED)
+        self.assertTrue(c.known_rank)
+        self.assertLess(c, 1 << 16)
+
+        self.assertEqual(Card.pack(12), Card(12))
+        self.assertDictEqual(Card(12).to_json(), {'colour': Colour.GREEN, 'rank': 2, 'knownColour': None,
+                                                  'knownRank': False})
+
+    def test_pickle(self):
+        """Packed cards pickle as plain integers"""
+        self.assertIs(type(pickle.loads(pickle.dumps(Card.pack(12, Colour.GREEN)))), int)
+
+    def test_unpickle_old_hands(self):
+        """Hands pickled before cards were packed can still be read"""
+        class OldCard:
+            def __init__(self, int_representation):
+                self.colour = Colour(int_representation // 10)
+                self.rank = int_representation % 10
+                self.known_colour = None
+                self.known_rank = False
+
+        old_card = OldCard(42)
+        old_card.known_colour = Colour.YELLOW
+
+        # Pickle it under the name Card used to have
+        OldCard.__qualname__ = 'Card'
+        OldCard.__module__ = card_module.__name__
+        packed_card_class = card_module.Card
+        card_module.Card = OldCard
+        try:
+            data = pickle.dumps([[old_card, OldCard(1)], []], protocol=2)
+        finally:
+            card_module.Card = packed_card_class
+
+        hands = HandsPickler.loads(data)
+
+        self.assertEqual(list(pack_hand(hands[0])), [Card.pack(42, Colour.YELLOW), Card(1)])
+        self.assertEqual(list(pack_hand(hands[1])), [])
@@ -0,0 +1,123 @@
+import pickle
+import unittest
+from array import array
+from datetime import datetime
+
+from sqlalchemy import Boolean, Column, Integer, MetaData, PickleType, SmallInteger, Table, select, type_coerce
+from sqlalchemy.types import LargeBinary
+
+from hanabi import create_app, db
+from hanabi.migrate import migrate_state, upgrade_schema
+from hanabi.models import Card, Colour, Game
+from hanabi.models.codec import DeckColumn, DiscardColumn, HandsColumn, InPlayColumn, PlayersColumn, is_legacy
+
+
+def round_trip(column_type, value):
+    return column_type.process_result_value(column_type.process_bind_param(value, None), None)
+
+
+class CodecTestCase(unittest.TestCase):
+    def test_deck(self):
+        self.assertListEqual(round_trip(DeckColumn(), [55, 1, 43]), [55, 1, 43])
+        self.assertListEqual(round_trip(DeckColumn(), []), [])
+
+    def test_hands(self):
+        hands = [array('H', [Card.pack(42, Colour.YELLOW, True), Card(1)]), array('H'), array('H', [55])]
+        self.assertListEqual(round_trip(HandsColumn(), hands), hands)
+        self.assertEqual(len(HandsColumn().process_bind_param(hands, None)), 1 + 3 + 2 * 3)
+
+    def test_discard(self):
+        """Discard piles come back sorted"""
+        discard = round_trip(DiscardColumn(), {Colour.BLUE: [3, 1, 1], Colour.RAINBOW: [5]})
+        self.assertListEqual(discard[Colour.BLUE], [1, 1, 3])
+        self.assertListEqual(discard[Colour.RAINBOW], [5])
+        self.assertListEqual(discard[Colour.RED], [])
+
+    def test_in_play(self):
+        in_play = round_trip(InPlayColumn(), {Colour.GREEN: 4})
+        self.assertEqual(in_play[Colour.GREEN], 4)
+        self.assertEqual(in_play[Colour.WHITE], 0)
+
+    def test_players(self):
+        """Ids from uuid4().hex take 17 bytes, anything else is stored as it is"""
+        players = ['0123456789abcdef0123456789abcdef', 'id2', 'ünïcode']
+        self.assertListEqual(round_trip(PlayersColumn(), players), players)
+        self.assertEqual(len(PlayersColumn().process_bind_param(players[:1], None)), 18)
+
+    def test_legacy(self):
+        """Pickles are still read"""
+        data = pickle.dumps({Colour.BLUE: [1]}, pickle.HIGHEST_PROTOCOL)
+        self.assertTrue(is_legacy(data))
+        self.assertDictEqual(DiscardColumn().process_result_value(data, None), {Colour.BLUE: [1]})
+
+
+class MigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_migrate_state(self):
+        """Pickled games are rewritten in the binary encoding and their players counted, and nothing else is touched"""
+        table = Game.__table__
+        legacy = {
+            'players': ['id1', 'id2'],
+            'deck': [1, 2, 3],
+            'hands': [[Card(11)], [Card(12)]],
+            'discard': {colour: [] for colour in Colour},
+            'in_play': dict.fromkeys(list(Colour), 0)
+        }
+        for _ in range(3):
+            db.session.execute(table.insert().values(player_count=None,
+                                                     **{name: type_coerce(pickle.dumps(value, 2), LargeBinary)
+                                                        for name, value in legacy.items()}))
+        db.session.add(Game(players=['id3']))
+        db.session.commit()
+
+        self.assertEqual(migrate_state(batch_size=2), 3)
+        self.assertEqual(migrate_state(batch_size=2), 0)
+
+        for data in db.session.execute(select([type_coerce(table.c.hands, LargeBinary)])):
+            self.assertFalse(is_legacy(bytes(data[0])))
+        game = Game.query.get(2)
+        self.assertListEqual(game.players, ['id1', 'id2'])
+        self.assertEqual(game.player_count, 2)
+        self.assertListEqual(game.deck, [1, 2, 3])
+        self.assertListEqual([list(hand) for hand in game.hands], [[11], [12]])
+
+    def test_upgrade_schema(self):
+        """A database from before the new columns and tables can be brought up to date and its games still read"""
+        db.drop_all()
+        old = Table('games', MetaData(), Column('id', Integer, primary_key=True),
+                    *[Column(name, Boolean) for name in ['hard_mode', 'perfect_mode', 'public', 'chameleon_mode',
+                                                         'last_turn', 'started']],
+                    *[Column(name, PickleType) for name in ['discard', 'deck', 'hands', 'in_play', 'players']],
+                    *[Column(name, SmallInteger) for name in ['final_score', 'hints', 'last_player', 'misfires',
+                                                              'score', 'turn']])
+        old.create(db.engine)
+        db.engine.execute(old.insert().values(
+            hard_mode=False, perfect_mode=False, public=True, chameleon_mode=False, last_turn=False, started=True,
+            discard={colour: [] for colour in Colour}, deck=[1, 2], hands=[[Card(11)], [Card(12)]],
+            in_play=dict.fromkeys(list(Colour), 0), players=['id1', 'id2'], hints=8, misfires=3, score=0, turn=1))
+
+        added = upgrade_schema()
+        self.assertIn('games.version', added)
+        self.assertIn('players', added)
+        self.assertListEqual(upgrade_schema(), [])
+        self.assertEqual(migrate_state(), 1)
+
+        game = Game.query.get(1)
+        self.assertEqual(game.version, 1)
+        self.assertEqual(game.player_count, 2)
+        self.assertEqual(game.snapshot_seq, 0)
+        self.assertEqual(game.updated, datetime(1970, 1, 1))
+        self.assertEqual(game.to_state().turn, 1)
+        game.hints = 7
+        db.session.commit()
+        self.assertEqual(game.version, 2)
@@ -0,0 +1,294 @@
+import json
+import threading
+import time
+import unittest
+
+from flask import url_for
+
+from hanabi import create_app, db
+from hanabi.events import EventHub, LobbyFeed, event_hub, lobby_feed
+from hanabi.models import Card, Game
+
+from helpers import hint
+
+
+def parse_event(chunk):
+    """The id and data of an event, or None for a keepalive"""
+    fields = dict(line.split(': ', 1) for line in chunk.decode('utf-8').strip().split('\n'))
+    if 'data' not in fields:
+        return None
+    return fields['id'], json.loads(fields['data'])
+
+
+class EventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['GAME_EVENTS_POLL'] = 0.01
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add(Game(players=['id1', 'id2'], started=True, deck=[5, 4, 3],
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)]]))
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stream(self, player_id, last_event_id=None):
+        headers = {'id': player_id}
+        if last_event_id is not None:
+            headers['Last-Event-ID'] = last_event_id
+        response = self.client.get(url_for('api.get_game_events', game_id=1), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        return iter(response.response)
+
+    def hint(self, player_id, player_index):
+        response = hint(self.client, 1, player_id, player_index)
+        self.assertEqual(response.status_code, 200)
+        db.session.commit()
+
+    def test_stream(self):
+        """A stream starts with the game and gets each change to it, as seen from the player's seat"""
+        stream = self.stream('id2')
+        event_id, json_game = parse_event(next(stream))
+        self.assertEqual(json_game['hints'], 8)
+        self.assertEqual(json_game['turn'], 1)
+
+        self.hint('id1', 1)
+        next_id, json_game = parse_event(next(stream))
+        self.assertNotEqual(next_id, event_id)
+        self.assertEqual(json_game['hints'], 7)
+        self.assertEqual(json_game['turn'], 0)
+
+    def test_resume(self):
+        """A client that reconnects only gets the game if it has missed something"""
+        event_id, _ = parse_event(next(self.stream('id1')))
+        self.assertIsNone(parse_event(next(self.stream('id1', event_id))))
+
+        self.hint('id1', 1)
+        next_id, json_game = parse_event(next(self.stream('id1', event_id)))
+        self.assertNotEqual(next_id, event_id)
+        self.assertEqual(json_game['hints'], 7)
+
+    def test_one_render_per_seat(self):
+        """Streams on the same seat share one render of each change"""
+        streams = [self.stream(player_id) for player_id in ['id1', 'id1', 'id1', 'id2']]
+        for stream in streams:
+            next(stream)
+
+        hub = event_hub(self.app)
+        self.assertEqual(hub.subscribers(1), 4)
+        renders = hub.renders
+        self.hint('id1', 1)
+        self.assertEqual(hub.renders - renders, 2)
+        for stream in streams:
+            self.assertEqual(parse_event(next(stream))[1]['hints'], 7)
+
+    def get_game(self, etag=None, wait=None):
+        headers = {'id': 'id1'}
+        if etag is not None:
+            headers['If-None-Match'] = etag
+        return self.client.get(url_for('api.get_specific_game', game_id=1, wait=wait), headers=headers)
+
+    def test_etag(self):
+        """A client that already has the game is told so, without the game being sent again"""
+        response = self.get_game()
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.get_game(etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+        self.hint('id1', 1)
+        response = self.get_game(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['hints'], 7)
+
+        # Each seat sees the game differently, so gets its own tag
+        response = self.client.get(url_for('api.get_specific_game', game_id=1),
+                                   headers={'id': 'id2', 'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_long_poll(self):
+        """Waiting for a game returns as soon as it changes, or says nothing changed when the wait is up"""
+        etag = self.get_game().headers['ETag']
+        start = time.monotonic()
+        response = self.get_game(etag, wait=0.1)
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        def hint_later():
+            with self.app.app_context():
+                self.hint('id1', 1)
+        timer = threading.Timer(0.05, hint_later)
+        timer.start()
+        response = self.get_game(etag, wait=10)
+        timer.join()
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual(json.loads(response.data.decode('utf-8'))['hints'], 7)
+        self.assertEqual(event_hub(self.app).subscribers(1), 0)
+
+    def test_bad_wait(self):
+        """A wait that isn't a finite number is refused, rather than getting past LONG_POLL_MAX"""
+        etag = self.get_game().headers['ETag']
+        for wait in ['nan', 'inf', '-inf', 'abc']:
+            self.assertEqual(self.get_game(etag, wait=wait).status_code, 400)
+        self.assertEqual(self.get_game(etag, wait=-5).status_code, 304)
+
+    def test_not_in_game(self):
+        response = self.client.get(url_for('api.get_game_events', game_id=1), headers={'id': 'id3'})
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(url_for('api.get_game_events', game_id=2), headers={'id': 'id1'})
+        self.assertEqual(response.status_code, 404)
+
+
+class EventHubTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.request_context = self.app.test_request_context()
+        self.request_context.push()
+        self.hub = EventHub(poll=10)
+
+    def tearDown(self):
+        self.request_context.pop()
+
+    @staticmethod
+    def game(version, snapshot_seq):
+        game = Game(id=1, players=['id1', 'id2'], version=version, snapshot_seq=snapshot_seq, deck=[], hands=[],
+                    discard={}, in_play={}, turn=0)
+        # Never saved, so there are no moves to replay
+        game._replayed = True
+        return game
+
+    def test_older_revisions(self):
+        """Publishing a copy of a game that's older than one already sent does nothing"""
+        subscriber = self.hub.subscribe(1, 0)
+        self.hub.publish(self.game(2, 3))
+        self.assertEqual(subscriber.get_nowait()[0], (2, 3))
+
+        for version, snapshot_seq in [(2, 3), (2, 2), (1, 5)]:
+            self.hub.publish(self.game(version, snapshot_seq))
+        self.assertTrue(subscriber.empty())
+        self.assertEqual(self.hub.renders, 2)
+        self.assertEqual(self.hub.current(1, 1)[0], (2, 3))
+
+        self.hub.unsubscribe(1, subscriber)
+        self.assertEqual(self.hub.subscribers(1), 0)
+
+
+def parse_lobby_event(chunk):
+    fields = dict(line.split(': ', 1) for line in chunk.decode('utf-8').strip().split('\n'))
+    return fields.get('event'), fields.get('data') and json.loads(fields['data'])
+
+
+class LobbyEventsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['GAME_EVENTS_POLL'] = 0.01
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add_all([Game(players=['id1'], public=True), Game(players=['id2'], public=False)])
+        db.session.commit()
+        db.session.remove()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def stream(self):
+        response = self.client.get(url_for('api.get_lobby_events'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        return iter(response.response)
+
+    def test_lobby_stream(self):
+        """The lobby stream starts with the open games and follows them as they're made, joined and started"""
+        stream = self.stream()
+        name, games = parse_lobby_event(next(stream))
+        self.assertEqual(name, 'snapshot')
+        self.assertListEqual([game['players'] for game in games], [1])
+
+        response = self.client.post(url_for('api.new_game'), headers={'Content-Type': 'application/json'},
+                                    data=json.dumps({'public': True, 'hardMode': True}))
+        admin_id = response.headers['id']
+        name, game = parse_lobby_event(next(stream))
+        self.assertEqual(name, 'add')
+        self.assertTrue(game['hardMode'])
+        self.assertEqual(game['url'], response.headers['Location'])
+
+        self.client.put(url_for('api.join_game', game_id=3))
+        db.session.commit()
+        self.assertEqual(parse_lobby_event(next(stream)), ('update', dict(game, players=2)))
+
+        self.client.put(url_for('api.start_game', game_id=3), headers={'id': admin_id})
+        db.session.commit()
+        self.assertEqual(parse_lobby_event(next(stream)), ('remove', {'url': game['url']}))
+
+        # Private games never show up
+        self.client.post(url_for('api.new_game'))
+        self.assertEqual(parse_lobby_event(next(stream)), (None, None))
+
+    def test_other_workers(self):
+        """Changes made behind the feed's back are found by reloading the lobby"""
+        stream = self.stream()
+        next(stream)
+
+        db.session.add(Game(players=['id3', 'id4'], public=True))
+        db.engine.execute(Game.__table__.update().where(Game.id == 1).values(started=True))
+        db.session.commit()
+
+        events = []
+        for _ in range(100):
+            event = parse_lobby_event(next(stream))
+            if event[0] is not None:
+                events.append(event)
+            if len(events) == 2:
+                break
+        self.assertEqual(events[0][0], 'remove')
+        self.assertEqual(events[1][0], 'add')
+        self.assertEqual(events[1][1]['players'], 2)
+
+    def test_encoded_once(self):
+        """Every stream gets the same encoding of each change"""
+        streams = [self.stream() for _ in range(5)]
+        snapshots = [next(stream) for stream in streams]
+        self.assertEqual(len(set(snapshots)), 1)
+
+        feed = lobby_feed(self.app)
+        encodes = feed.encodes
+        self.client.post(url_for('api.new_game'), headers={'Content-Type': 'application/json'},
+                         data=json.dumps({'public': True}))
+        self.assertEqual(len({next(stream) for stream in streams}), 1)
+        self.assertEqual(feed.encodes - encodes, 1)
+
+    def test_load_unlocked(self):
+        """The lobby loads without holding up publishers, and what they publish meanwhile isn't lost"""
+        feed = LobbyFeed(poll=60)
+        old = {'url': 'http://localhost/api/v1/games/1', 'players': 1}
+        new = {'url': 'http://localhost/api/v1/games/2', 'players': 1}
+
+        def load():
+            publisher = threading.Thread(target=lambda: (feed.publish(1, None), feed.publish(2, new)))
+            publisher.start()
+            publisher.join(5)
+            self.assertFalse(publisher.is_alive())
+            return {1: old}
+
+        subscriber, snapshot = feed.subscribe(load)
+        self.assertEqual(parse_lobby_event(snapshot.encode('utf-8')), ('snapshot', [new]))
+        feed.unsubscribe(subscriber)
@@ -1,8 +1,11 @@
 import unittest
+from random import Random
+
+from sqlalchemy import event
 
 from hanabi import create_app, db
 from hanabi.exceptions import CannotJoinGame, CannotStartGame
-from hanabi.models import Card, Game
+from hanabi.models import Card, Game, GameState, LoggedMove, Move
 
 
 class GameModelTestCase(unittest.TestCase):
@@ -25,13 +28,14 @@ class GameModelTestCase(unittest.TestCase):
         json_game = g.to_json(0)
 
         expected_keys = ['url', 'inPlay', 'started', 'discard', 'finalScore', 'turn', 'misfires', 'perfectMode', 'chameleonMode',
-                         'hints', 'hands', 'deckSize', 'hardMode', 'lastTurn', 'lastPlayer']
+                         'hints', 'hands', 'deckSize', 'hardMode', 'lastTurn', 'lastPlayer', 'maxScore']
         self.assertEqual(sorted(json_game.keys()), sorted(expected_keys))
         self.assertTrue('api/v1/games/' in json_game['url'])
         self.assertFalse(json_game['started'])
         self.assertEqual(json_game['turn'], 0)
         self.assertEqual(json_game['misfires'], 3)
         self.assertEqual(json_game['hints'], 8)
+        self.assertEqual(json_game['maxScore'], 30)
 
     def test_to_json_different_index(self):
         """The hands should be arranged such that the specified player is index 0"""
@@ -99,6 +103,19 @@ class GameModelTestCase(unittest.TestCase):
         db.session.flush()
 
         self.assertListEqual(g.players, ['id1', 'id2', new_id])
+        self.assertEqual(g.player_count, 3)
+
+    def test_add_player_saved(self):
+        """Adding a player changes the list in place, which still gets saved"""
+        g = Game(players=['id1'])
+        db.session.add(g)
+        db.session.commit()
+
+        new_id = g.add_player()
+        db.session.commit()
+        db.session.expire(g)
+
+        self.assertListEqual(g.players, ['id1', new_id])
 
     def test_add_player_game_started(self):
         """Can't add a player if the game is started"""
@@ -121,3 +138,66 @@ class GameModelTestCase(unittest.TestCase):
 
         db.session.flush()
         self.assertEqual(len(g.players), 5)
+
+    def test_move_log(self):
+        """Moves go in the log, and the snapshot is only rewritten every so often"""
+        self.app.config['SNAPSHOT_INTERVAL'] = 3
+        g = Game(players=['id1', 'id2'], started=True, deck=[1, 2, 3, 4], hands=[[Card(11)], [Card(12)]])
+        db.session.add(g)
+        db.session.commit()
+
+        for player in [0, 1]:
+            g.make_move(Move({'type': 'hint', 'colour': 'green', 'playerIndex': 1}, player, 2))
+            db.session.commit()
+
+        self.assertEqual(LoggedMove.query.filter_by(game_id=g.id).count(), 2)
+        snapshot = db.session.query(Game.hints, Game.snapshot_seq).filter_by(id=g.id).one()
+        self.assertEqual(tuple(snapshot), (8, 0))
+
+        # Loading the game replays the log on top of the snapshot
+        db.session.expire(g)
+        self.assertEqual(g.to_state().hints, 6)
+        self.assertEqual(g.hints, 6)
+
+        g.make_move(Move({'type': 'play', 'cardIndex': 0}, 0, 2))
+        db.session.commit()
+
+        snapshot = db.session.query(Game.hints, Game.score, Game.snapshot_seq).filter_by(id=g.id).one()
+        self.assertEqual(tuple(snapshot), (6, 1, 3))
+
+    def test_start_seed(self):
+        """The deal comes from the game's seed"""
+        g = Game(players=['id1', 'id2', 'id3'])
+        db.session.add(g)
+        db.session.commit()
+
+        g.start()
+        state = GameState(num_players=3)
+        state.start(Random(g.seed))
+
+        self.assertListEqual(g.deck, state.deck)
+        self.assertEqual(g.turn, state.turn)
+
+    def test_snapshot_changed_columns(self):
+        """Snapshots only write the columns that moves since the last one changed"""
+        self.app.config['SNAPSHOT_INTERVAL'] = 2
+        g = Game(players=['id1', 'id2'], started=True, deck=[1, 2, 3, 4], hands=[[Card(11)], [Card(12)]])
+        db.session.add(g)
+        db.session.commit()
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for player in [0, 1]:
+                g.make_move(Move({'type': 'hint', 'colour': 'green', 'playerIndex': 1}, player, 2))
+                db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        updates = [statement for statement in statements if statement.startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(updates[0].split(' WHERE')[0],
+                         'UPDATE games SET hands=?, hints=?, turn=?, updated=?, snapshot_seq=?, version=?')
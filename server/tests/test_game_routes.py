@@ -1,10 +1,11 @@
 import json
 import unittest
 
-from flask import url_for
+from flask import jsonify, url_for
+from sqlalchemy import event
 
 from hanabi import create_app, db
-from hanabi.models import Game, Card, Colour
+from hanabi.models import Game, Card, Colour, LoggedMove, Move
 
 
 class APITestCase(unittest.TestCase):
@@ -129,6 +130,119 @@ class APITestCase(unittest.TestCase):
         json_response = json.loads(response.data.decode('utf-8'))
         self.assertEqual(len(json_response), 1)
 
+    def test_lobby_pages(self):
+        """The lobby comes a page at a time, and can be filtered by mode"""
+        games = [Game(public=True, players=['id%d' % i] * (i % 5 + 1), hard_mode=i % 2 == 0) for i in range(7)]
+        db.session.add_all(games + [Game(public=True, started=True)])
+        db.session.commit()
+
+        pages = []
+        url = url_for('api.get_games', limit=3)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(json.loads(response.data.decode('utf-8')))
+            url = response.headers.get('Link', '')[1:-len('>; rel="next"')]
+
+        self.assertListEqual([len(page) for page in pages], [3, 3, 1])
+        games = [game for page in pages for game in page]
+        self.assertListEqual([game['url'].split('/')[-1] for game in games], [str(i) for i in range(1, 8)])
+        self.assertListEqual([game['players'] for game in games], [1, 2, 3, 4, 5, 1, 2])
+
+        response = self.client.get(url_for('api.get_games', limit=2, hardMode='true'))
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([game['url'].split('/')[-1] for game in json_response], ['1', '3'])
+        self.assertIn('hardMode=true', response.headers['Link'])
+
+    def test_get_many_games(self):
+        """Games asked for together come back in the order asked, with an error in place of any that can't be seen"""
+        db.session.add_all([Game(players=['id1', 'id2'], hands=[[Card(1)], [Card(2)]]), Game(players=['id3'])])
+        db.session.commit()
+
+        response = self.client.post(
+            url_for('api.get_many_games'), headers={'Content-Type': 'application/json'},
+            data=json.dumps([{'gameId': 1, 'playerId': 'id2'}, {'gameId': 2, 'playerId': 'id2'},
+                             {'gameId': 3, 'playerId': 'id2'}, {'gameId': 2, 'playerId': 'id3'}]))
+        self.assertEqual(response.status_code, 200)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response), 4)
+        self.assertEqual(json_response[0]['hands'][0][0]['rank'], 2)
+        self.assertDictEqual(json_response[1], {'gameId': 2, 'error': 'id missing or not in game'})
+        self.assertDictEqual(json_response[2], {'gameId': 3, 'error': 'game not found'})
+        self.assertEqual(json_response[3]['url'], url_for('api.get_specific_game', game_id=2, _external=True))
+        # Games and errors are laid out the same way
+        self.assertEqual(response.data.decode('utf-8'), json.dumps(json_response, sort_keys=True))
+
+        response = self.client.post(url_for('api.get_many_games'), headers={'Content-Type': 'application/json'},
+                                    data=json.dumps([{'gameId': '1', 'playerId': 'id1'}]))
+        self.assertEqual(json.loads(response.data.decode('utf-8'))[0]['hands'][1][0]['rank'], 2)
+
+        for body in [{'gameId': 1}, [{'id': 1}], [1], [{'gameId': 'one'}], [{'gameId': 2 ** 70}], [{'gameId': 1.5}],
+                     [{'gameId': True}], [{'gameId': '-1'}], [{'gameId': str(2 ** 70)}]]:
+            response = self.client.post(url_for('api.get_many_games'), headers={'Content-Type': 'application/json'},
+                                        data=json.dumps(body))
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post(url_for('api.get_many_games'), headers={'Content-Type': 'application/json'},
+                                    data='[{"gameId": 1e400}]')
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_games(self):
+        """Many games can be made at once, with players already seated and the same deal in each"""
+        response = self.client.post(
+            url_for('api.new_games'), headers={'Content-Type': 'application/json'},
+            data=json.dumps({'count': 3, 'hardMode': True, 'seed': 42, 'players': [['id1', 'id2'], ['id3', 'id4']]}))
+        self.assertEqual(response.status_code, 201)
+        json_response = json.loads(response.data.decode('utf-8'))
+        self.assertEqual(len(json_response), 3)
+        self.assertEqual(json_response[0]['id'], 'id1')
+        self.assertListEqual(json_response[1]['players'], ['id3', 'id4'])
+        self.assertEqual(json_response[2]['players'], [json_response[2]['id']])
+
+        games = Game.query.order_by(Game.id).all()
+        self.assertListEqual([entry['url'] for entry in json_response],
+                             [url_for('api.get_specific_game', game_id=game.id, _external=True) for game in games])
+        self.assertListEqual([game.player_count for game in games], [2, 2, 1])
+        self.assertTrue(all(game.hard_mode and not game.public for game in games))
+        self.assertListEqual([player.token for player in games[1].seats], ['id3', 'id4'])
+
+        # The admin can start them as usual, and they're all dealt the same
+        for game_id in [1, 2]:
+            response = self.client.put(url_for('api.start_game', game_id=game_id),
+                                       headers={'id': json_response[game_id - 1]['id']})
+            self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertListEqual(Game.query.get(1).deck, Game.query.get(2).deck)
+
+        for body in [{'count': 0}, {'count': 1001}, {'count': 1, 'players': [['a'], ['b']]},
+                     {'players': [['a', 'a']]}, {'players': [['a b']]}, {'count': 1, 'seed': 'x'}, [1],
+                     {'players': 5}, {'players': [5]}, {'players': [[{'x': 1}]]}, {'players': [[['a']]]}]:
+            response = self.client.post(url_for('api.new_games'), headers={'Content-Type': 'application/json'},
+                                        data=json.dumps(body))
+            self.assertEqual(response.status_code, 400)
+
+    def test_new_games_statements(self):
+        """However many games are made, there's one INSERT for the games, one SELECT for their ids and one INSERT for
+        their seats"""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0])
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.post(url_for('api.new_games'), headers={'Content-Type': 'application/json'},
+                                        data=json.dumps({'count': 20, 'players': [['id1', 'id2']]}))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertListEqual([statement for statement in statements if statement != 'SELECT'], ['INSERT', 'INSERT'])
+        self.assertEqual(statements.count('SELECT'), 1)
+        games = Game.query.order_by(Game.id).all()
+        self.assertListEqual([game['url'] for game in json.loads(response.data.decode('utf-8'))],
+                             [url_for('api.get_specific_game', game_id=game.id, _external=True) for game in games])
+        self.assertListEqual([[player.token for player in game.seats] for game in games],
+                             [game.players for game in games])
+
     def test_start_game(self):
         """Admin can start the game"""
         game = Game(players=['id1', 'id2'])
@@ -197,6 +311,101 @@ class APITestCase(unittest.TestCase):
                                                               [Card(3), Card(4), Card(1), Card(2)])))
         self.assertEqual(json_response['turn'], 0)
 
+    def test_get_game_layout(self):
+        """A game comes back laid out exactly as jsonify writes it, pretty or not"""
+        game = Game(players=['id1', 'id2'], started=True, deck=[5, 4], discard={Colour.BLUE: [1], Colour.RED: [2, 3]},
+                    hands=[[Card(1), Card(2)], []])
+        db.session.add(game)
+        db.session.commit()
+
+        for headers in [{}, {'X-Requested-With': 'XMLHttpRequest'}]:
+            for seat, player_id in enumerate(game.players):
+                headers['id'] = player_id
+                url = url_for('api.get_specific_game', game_id=game.id)
+                response = self.client.get(url, headers=headers)
+                with self.app.test_request_context(url, headers=headers):
+                    self.assertEqual(response.data, jsonify(game.to_json(seat)).get_data())
+
+    def test_join_changed_game(self):
+        """Joining a game that changed since it was read tries again with the new game"""
+        game = Game(players=['id1', 'id2', 'id3', 'id4'])
+        db.session.add(game)
+        db.session.commit()
+        game.players
+
+        # Someone else joins behind the session's back
+        db.engine.execute(Game.__table__.update().values(version=Game.version + 1))
+
+        response = self.client.put(url_for('api.join_game', game_id=1))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(Game.query.get(1).players), 5)
+
+    def test_conflicting_move(self):
+        """A move made without seeing an earlier one is refused"""
+        game = Game(players=['id1', 'id2'], started=True, hands=[[Card(1)], [Card(51)]])
+        db.session.add(game)
+        db.session.commit()
+        game.to_state()
+
+        # Another request for the same player logs a move first
+        code = Move({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}, 0, 2).encode()
+        db.engine.execute(LoggedMove.__table__.insert().values(game_id=1, seq=1, code=code))
+
+        response = self.client.put(
+            url_for('api.make_move', game_id=1),
+            headers={'Content-Type': 'application/json', 'id': 'id1'},
+            data=json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1}))
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_get_moves(self):
+        """The move history lists each move with whoever made it"""
+        game = Game(players=['id1', 'id2'], started=True, deck=[5, 4, 3],
+                    hands=[[Card(1), Card(2)], [Card(51), Card(42)]])
+        db.session.add(game)
+        db.session.commit()
+
+        moves = [('id1', {'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}),
+                 ('id2', {'type': 'discard', 'cardIndex': 1})]
+        for player_id, move in moves:
+            response = self.client.put(
+                url_for('api.make_move', game_id=1),
+                headers={'Content-Type': 'application/json', 'id': player_id},
+                data=json.dumps(move))
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url_for('api.get_moves', game_id=1), headers={'id': 'id1'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertListEqual(json.loads(response.data.decode('utf-8')), [
+            {'seq': 1, 'player': 0, 'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1},
+            {'seq': 2, 'player': 1, 'type': 'discard', 'cardIndex': 1, 'card': {'colour': 4, 'rank': 2}}])
+
+        response = self.client.get(url_for('api.get_moves', game_id=1), headers={'id': 'id3'})
+        self.assertEqual(response.status_code, 403)
+
+    def test_move_pages(self):
+        """The move history comes a page at a time, from just after the last move seen"""
+        game = Game(players=['id1', 'id2'], started=True, hints=2)
+        db.session.add(game)
+        db.session.commit()
+        db.session.add_all([LoggedMove(game_id=1, seq=seq, code=Move({'type': 'play', 'cardIndex': 0}, seq % 2, 2)
+                                       .encode(), card=seq) for seq in range(1, 6)])
+        db.session.commit()
+
+        pages = []
+        url = url_for('api.get_moves', game_id=1, after=1, limit=2)
+        while url:
+            response = self.client.get(url, headers={'id': 'id2'})
+            self.assertEqual(response.status_code, 200)
+            pages.append(json.loads(response.data.decode('utf-8')))
+            url = response.headers.get('Link', '')[1:-len('>; rel="next"')]
+
+        self.assertListEqual([[move['seq'] for move in page] for page in pages], [[2, 3], [4, 5]])
+        self.assertListEqual([move['player'] for move in pages[0]], [1, 0])
+        self.assertDictEqual(pages[1][0]['card'], {'colour': 0, 'rank': 4})
+
     def test_make_valid_moves(self):
         """Make some valid moves, see that they're valid"""
         game = Game(players=['id1', 'id2'], started=True, turn=0,
@@ -213,10 +422,10 @@ class APITestCase(unittest.TestCase):
             data=json.dumps({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}))
 
         self.assertEqual(response.status_code, 200)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertEqual(game.hands[1][0].known_colour, Colour.RAINBOW)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertEqual(Card(game.hands[1][0]).known_colour, Colour.RAINBOW)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.hints, 7)
         self.assertEqual(game.turn, 1)
 
@@ -227,10 +436,10 @@ class APITestCase(unittest.TestCase):
             data=json.dumps({'type': 'hint', 'rank': 1, 'playerIndex': 1}))
 
         self.assertEqual(response.status_code, 200)
-        self.assertTrue(game.hands[0][0].known_rank)
-        self.assertFalse(game.hands[0][1].known_rank)
-        self.assertIsNone(game.hands[0][0].known_colour)
-        self.assertIsNone(game.hands[0][1].known_colour)
+        self.assertTrue(Card(game.hands[0][0]).known_rank)
+        self.assertFalse(Card(game.hands[0][1]).known_rank)
+        self.assertIsNone(Card(game.hands[0][0]).known_colour)
+        self.assertIsNone(Card(game.hands[0][1]).known_colour)
         self.assertEqual(game.hints, 6)
         self.assertEqual(game.turn, 0)
 
@@ -244,7 +453,8 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(game.misfires, 3)
         self.assertEqual(game.in_play[Colour.BLUE], 1)
         self.assertEqual(len(game.deck), 4)
-        self.assertListEqual(list(map(lambda card: card.to_num(), game.hands[0])), [2, 1])  # Picked up another blue 1
+        # Picked up another blue 1
+        self.assertListEqual(list(map(lambda card: Card(card).to_num(), game.hands[0])), [2, 1])
         self.assertEqual(game.turn, 1)
 
         # Player 2 tries to play the two
@@ -258,7 +468,7 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(game.in_play[Colour.YELLOW], 0)
         self.assertListEqual(game.discard[Colour.YELLOW], [2])
         self.assertEqual(len(game.deck), 3)
-        self.assertListEqual(list(map(lambda card: card.to_num(), game.hands[1])), [51, 2])  # Picked up a blue 2
+        self.assertListEqual(list(map(lambda card: Card(card).to_num(), game.hands[1])), [51, 2])  # Picked up a blue 2
 
         # Player 1 discards the 1 they picked up
         response = self.client.put(
@@ -270,7 +480,7 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(game.hints, 7)
         self.assertListEqual(game.discard[Colour.BLUE], [1])
         self.assertEqual(len(game.deck), 2)
-        self.assertListEqual(list(map(lambda card: card.to_num(), game.hands[0])), [2, 3])  # Picked up a blue 3
+        self.assertListEqual(list(map(lambda card: Card(card).to_num(), game.hands[0])), [2, 3])  # Picked up a blue 3
 
     def test_hint_with_no_hints(self):
         """Try to hint when there are none"""
@@ -288,10 +498,10 @@ class APITestCase(unittest.TestCase):
             data=json.dumps({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}))
 
         self.assertEqual(response.status_code, 500)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertIsNone(game.hands[1][0].known_colour)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertIsNone(Card(game.hands[1][0]).known_colour)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.hints, 0)
         self.assertEqual(game.turn, 0)
 
@@ -311,8 +521,8 @@ class APITestCase(unittest.TestCase):
             data=json.dumps({'type': 'discard', 'cardIndex': 0}))
 
         self.assertEqual(response.status_code, 500)
-        self.assertEqual(game.hands[0][0].rank, 1)
-        self.assertEqual(game.hands[0][1].rank, 2)
+        self.assertEqual(Card(game.hands[0][0]).rank, 1)
+        self.assertEqual(Card(game.hands[0][1]).rank, 2)
         self.assertEqual(game.hints, 8)
         self.assertEqual(game.turn, 0)
 
@@ -333,10 +543,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 500)
         self.assertEqual(game.hints, 8)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertIsNone(game.hands[1][0].known_colour)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertIsNone(Card(game.hands[1][0]).known_colour)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 0)
 
         # Player 1 tries to hint about a card that isn't there
@@ -347,10 +557,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 500)
         self.assertEqual(game.hints, 8)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertIsNone(game.hands[1][0].known_colour)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertIsNone(Card(game.hands[1][0]).known_colour)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 0)
 
         # Player 1 tries to hint about nothing
@@ -380,10 +590,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 500)
         self.assertEqual(game.hints, 8)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertIsNone(game.hands[1][0].known_colour)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertIsNone(Card(game.hands[1][0]).known_colour)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 0)
 
     def test_play_with_no_index(self):
@@ -402,8 +612,8 @@ class APITestCase(unittest.TestCase):
             data=json.dumps({'type': 'play'}))
 
         self.assertEqual(response.status_code, 400)
-        self.assertEqual(game.hands[0][0].rank, 1)
-        self.assertEqual(game.hands[0][1].rank, 2)
+        self.assertEqual(Card(game.hands[0][0]).rank, 1)
+        self.assertEqual(Card(game.hands[0][1]).rank, 2)
         self.assertEqual(game.hints, 8)
         self.assertEqual(game.turn, 0)
 
@@ -438,10 +648,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 500)
         self.assertEqual(game.hints, 8)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertIsNone(game.hands[1][0].known_colour)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertIsNone(Card(game.hands[1][0]).known_colour)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 0)
 
         # Player one hints about blue
@@ -452,10 +662,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(game.hints, 7)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertEqual(game.hands[1][0].known_colour, Colour.BLUE)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertEqual(Card(game.hands[1][0]).known_colour, Colour.BLUE)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 1)
 
         game.turn = 0
@@ -469,10 +679,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(game.hints, 6)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertEqual(game.hands[1][0].known_colour, Colour.BLUE)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertEqual(Card(game.hands[1][0]).known_colour, Colour.BLUE)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 1)
 
         game.turn = 0
@@ -486,10 +696,10 @@ class APITestCase(unittest.TestCase):
 
         self.assertEqual(response.status_code, 200)
         self.assertEqual(game.hints, 5)
-        self.assertFalse(game.hands[1][0].known_rank)
-        self.assertFalse(game.hands[1][1].known_rank)
-        self.assertEqual(game.hands[1][0].known_colour, Colour.RAINBOW)
-        self.assertIsNone(game.hands[1][1].known_colour)
+        self.assertFalse(Card(game.hands[1][0]).known_rank)
+        self.assertFalse(Card(game.hands[1][1]).known_rank)
+        self.assertEqual(Card(game.hands[1][0]).known_colour, Colour.RAINBOW)
+        self.assertIsNone(Card(game.hands[1][1]).known_colour)
         self.assertEqual(game.turn, 1)
 
 
@@ -0,0 +1,194 @@
+import random
+import unittest
+
+from hanabi import create_app, db
+from hanabi.exceptions import CannotStartGame, InvalidMove
+from hanabi.models import Card, Colour, Game, GameState, Move
+from hanabi.models.state import max_score
+
+from helpers import random_move_json
+
+
+def game_snapshot(game):
+    return {
+        'deck': list(game.deck),
+        'hands': [list(hand) for hand in game.hands],
+        'discard': [sorted(game.discard.get(colour, [])) for colour in Colour],
+        'in_play': [game.in_play.get(colour, 0) for colour in Colour],
+        'numbers': (game.started, game.hints, game.misfires, game.score, game.final_score, game.last_turn,
+                    game.last_player, game.turn)
+    }
+
+
+def state_snapshot(state):
+    return {
+        'deck': list(state.deck),
+        'hands': [list(hand) for hand in state.hands],
+        'discard': [sorted(ranks) for ranks in state.discard],
+        'in_play': list(state.in_play),
+        'numbers': (state.started, state.hints, state.misfires, state.score, state.final_score, state.last_turn,
+                    state.last_player, state.turn)
+    }
+
+
+class GameStateTestCase(unittest.TestCase):
+    def test_start(self):
+        """Starting deals hands without touching a database"""
+        state = GameState(num_players=4)
+        state.start()
+
+        self.assertTrue(state.started)
+        self.assertTrue(all(map(lambda hand: len(hand) == 4, state.hands)))
+        self.assertEqual(len(state.deck), 44)
+
+    def test_start_with_one_player(self):
+        """Can't start a game with one player"""
+        state = GameState(num_players=1)
+
+        self.assertRaises(CannotStartGame, state.start)
+        self.assertFalse(state.started)
+
+    def test_hint(self):
+        """Hints update the hinted hand"""
+        state = GameState(num_players=2, started=True, hands=[[Card(1)], [Card(51), Card(42)]])
+        state.make_move(Move({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}, 0, 2))
+
+        self.assertEqual(Card(state.hands[1][0]).known_colour, Colour.RAINBOW)
+        self.assertIsNone(Card(state.hands[1][1]).known_colour)
+        self.assertEqual(state.hints, 7)
+        self.assertEqual(state.turn, 1)
+
+    def test_dirty(self):
+        """Moves record which fields they changed"""
+        state = GameState(num_players=2, started=True, hands=[[Card(1)], [Card(51), Card(42)]], deck=[3])
+        state.make_move(Move({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 1}, 0, 2))
+        self.assertSetEqual(state.dirty, {'hands', 'hints', 'turn'})
+
+        state.dirty.clear()
+        state.make_move(Move({'type': 'play', 'cardIndex': 1}, 1, 2))
+        self.assertSetEqual(state.dirty, {'hands', 'deck', 'discard', 'misfires', 'turn', 'last_turn', 'last_player'})
+
+    def test_invalid_move(self):
+        """Invalid moves raise and leave the state alone"""
+        state = GameState(num_players=2, started=True, hands=[[Card(1)], [Card(51)]])
+
+        self.assertRaises(InvalidMove, state.make_move, Move({'type': 'discard', 'cardIndex': 0}, 0, 2))
+        self.assertEqual(len(state.hands[0]), 1)
+        self.assertEqual(state.hints, 8)
+        self.assertEqual(state.turn, 0)
+
+    def test_misfire(self):
+        """Misplays go in the discard pile"""
+        state = GameState(num_players=2, started=True, hands=[[Card(42)], []], deck=[1])
+        state.make_move(Move({'type': 'play', 'cardIndex': 0}, 0, 2))
+
+        self.assertEqual(state.misfires, 2)
+        self.assertListEqual(state.discard[Colour.YELLOW], [2])
+        self.assertEqual(state.hands[0][0], 1)
+        self.assertTrue(state.last_turn)
+
+    def test_max_score(self):
+        """Losing every copy of a rank caps its colour one below it"""
+        state = GameState(num_players=2, started=True, hands=[[Card(12), Card(12)], [Card(1)]], deck=[1, 1],
+                          discard=[[], [], [], [], [], [1]], hints=5)
+        self.assertEqual(state.max_score, 30)
+
+        state.make_move(Move({'type': 'discard', 'cardIndex': 0}, 0, 2))
+        state.make_move(Move({'type': 'discard', 'cardIndex': 0}, 1, 2))
+        self.assertEqual(state.max_score, 30)
+
+        # Both green twos are gone, so green can only get to one
+        state.make_move(Move({'type': 'discard', 'cardIndex': 0}, 0, 2))
+        self.assertEqual(state.max_score, 26)
+        self.assertEqual(state.reachable[Colour.GREEN], 1)
+        self.assertIsNone(state.final_score)
+
+    def test_max_score_hard_mode(self):
+        """Hard mode only has one of each rainbow card"""
+        state = GameState(num_players=2, hard_mode=True, discard=[[], [], [], [], [], [3]], in_play=[0, 0, 0, 0, 0, 1])
+        self.assertEqual(state.max_score, 27)
+        self.assertEqual(max_score(state.in_play, state.discard, hard_mode=False), 30)
+
+    def test_perfect_mode_ends_when_unwinnable(self):
+        """Perfect mode games are lost as soon as 30 is out of reach, even by a card below the top of a pile"""
+        state = GameState(num_players=2, started=True, perfect_mode=True, hands=[[Card(3)], [Card(1)]],
+                          discard=[[3], [], [], [], [], []], hints=7)
+        state.make_move(Move({'type': 'discard', 'cardIndex': 0}, 0, 2))
+
+        self.assertEqual(state.max_score, 27)
+        self.assertEqual(state.final_score, 0)
+
+    def test_max_score_random_games(self):
+        """The running max score agrees with working it out from scratch"""
+        for seed in range(20):
+            random.seed(seed)
+            state = GameState(num_players=3, hard_mode=seed % 2 == 0)
+            state.start()
+
+            while state.final_score is None:
+                try:
+                    state.make_move(Move(random_move_json(state), state.turn, 3))
+                except (InvalidMove, IndexError):
+                    continue
+                self.assertEqual(state.max_score, max_score(state.in_play, state.discard, state.hard_mode))
+
+
+class DifferentialTestCase(unittest.TestCase):
+    """The database backed Game and the bare GameState should play identically"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def play_random_game(self, seed, num_players, **settings):
+        game = Game(players=['id%d' % i for i in range(num_players)], **settings)
+        db.session.add(game)
+        db.session.commit()
+        state = GameState(num_players=num_players, **settings)
+
+        random.seed(seed)
+        game.start()
+        state.start(random.Random(game.seed))
+        db.session.commit()
+
+        for _ in range(300):
+            if game.final_score is not None:
+                break
+
+            move_json = random_move_json(state)
+            mover = state.turn if random.random() < 0.95 else random.randrange(num_players)
+            move = Move(move_json, mover, num_players)
+
+            results = []
+            for target in (game, state):
+                try:
+                    target.make_move(move)
+                    results.append(None)
+                except (InvalidMove, IndexError) as e:
+                    results.append(type(e))
+
+            self.assertEqual(results[0], results[1])
+
+            # Make the game go through the database, not just the identity map. Replaying the move log brings the
+            # columns up to date
+            db.session.commit()
+            db.session.expire(game)
+
+            self.assertEqual(state_snapshot(game.to_state()), state_snapshot(state))
+            self.assertEqual(game_snapshot(game), state_snapshot(state))
+
+        return game
+
+    def test_random_games(self):
+        """Random games produce identical states through both paths"""
+        modes = [{}, {'hard_mode': True}, {'perfect_mode': True}, {'chameleon_mode': True},
+                 {'hard_mode': True, 'perfect_mode': True, 'chameleon_mode': True}]
+        for seed in range(20):
+            self.play_random_game(seed, seed % 4 + 2, **modes[seed % len(modes)])
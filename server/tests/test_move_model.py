@@ -67,3 +67,27 @@ class MoveModelTestCase(unittest.TestCase):
         self.assertEqual(move.move_type, MoveType.DISCARD)
         self.assertEqual(move.moving_player, 2)
         self.assertEqual(move.card_index, 3)
+
+    def test_bad_rank(self):
+        """Hinted ranks have to be ranks"""
+        move_to_create = {
+            'type': 'hint',
+            'rank': 6,
+            'playerIndex': 1
+        }
+
+        self.assertRaises(InvalidMove, lambda: Move(move_to_create, 0, 3))
+
+    def test_encode(self):
+        """Moves survive being packed for the move log"""
+        moves = [({'type': 'hint', 'rank': 5, 'playerIndex': 2}, 4),
+                 ({'type': 'hint', 'colour': 'blue', 'playerIndex': 1}, 0),
+                 ({'type': 'hint', 'colour': 'rainbow', 'playerIndex': 4}, 3),
+                 ({'type': 'play', 'cardIndex': 4}, 2),
+                 ({'type': 'discard', 'cardIndex': 0}, 1)]
+
+        for move_to_create, player in moves:
+            move = Move.decode(Move(move_to_create, player, 5).encode())
+
+            self.assertEqual(move.moving_player, player)
+            self.assertEqual(move.to_json(5), move_to_create)
@@ -0,0 +1,108 @@
+import json
+import unittest
+
+from flask import url_for
+
+from hanabi import create_app, db
+from hanabi.models import Card, Game
+from hanabi.patches import diff
+
+
+def apply_patch(document, patch):
+    """Apply the JSON patch operations diff makes"""
+    document = json.loads(json.dumps(document))
+    for operation in patch:
+        keys = operation['path'].split('/')[1:]
+        if not keys:
+            document = operation['value']
+            continue
+        parent = document
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+        key = keys[-1]
+        if key == '-':
+            parent.append(operation['value'])
+            continue
+        key = int(key) if isinstance(parent, list) else key
+        if operation['op'] == 'remove':
+            del parent[key]
+        else:
+            parent[key] = operation['value']
+    return document
+
+
+class PatchesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+        db.session.add(Game(players=['id1', 'id2', 'id3'], started=True, deck=[5, 4, 3, 2, 1, 15], hints=5,
+                            hands=[[Card(1), Card(2)], [Card(51), Card(42)], [Card(11), Card(12)]]))
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def get(self, player_id, **args):
+        response = self.client.get(url_for('api.get_specific_game', game_id=1, **args), headers={'id': player_id})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def move(self, player_id, move):
+        response = self.client.put(url_for('api.make_move', game_id=1),
+                                   headers={'Content-Type': 'application/json', 'id': player_id},
+                                   data=json.dumps(move))
+        self.assertEqual(response.status_code, 200)
+        db.session.commit()
+
+    def test_diff(self):
+        """Applying a diff to the old document gives the new one"""
+        old = {'a': [1, 2], 'b': {'c': None, 'd': [[1], [2]]}, 'e': 'x/y'}
+        new = {'a': [1, 2, 3], 'b': {'c': 1, 'd': [[1], [3, 4]]}, 'f': True}
+        self.assertEqual(apply_patch(old, diff(old, new)), new)
+        self.assertListEqual(diff(new, new), [])
+        self.assertIn({'op': 'add', 'path': '/a/-', 'value': 3}, diff(old, new))
+        self.assertIn({'op': 'remove', 'path': '/e'}, diff(old, new))
+
+        # A card played from the middle of a hand, and another drawn
+        self.assertListEqual(diff([1, 2, 3], [1, 3, 4]), [{'op': 'remove', 'path': '/1'},
+                                                         {'op': 'add', 'path': '/-', 'value': 4}])
+
+    def test_since(self):
+        """A client that sends the revision it has gets what's changed since, as seen from its seat"""
+        moves = {
+            'id1': [('id1', {'type': 'play', 'cardIndex': 0}), ('id2', {'type': 'hint', 'rank': 2, 'playerIndex': 1})],
+            'id2': [('id3', {'type': 'discard', 'cardIndex': 1}),
+                    ('id1', {'type': 'hint', 'rank': 1, 'playerIndex': 2})]
+        }
+        for player_id in ['id1', 'id2']:
+            old = self.get(player_id)
+            since = old.headers['ETag'].strip('"')
+            old_game = json.loads(old.data.decode('utf-8'))
+
+            for moving_player, move in moves[player_id]:
+                self.move(moving_player, move)
+            new_game = json.loads(self.get(player_id).data.decode('utf-8'))
+
+            response = self.get(player_id, since=since)
+            self.assertEqual(response.mimetype, 'application/json-patch+json')
+            self.assertEqual(response.headers['ETag'], self.get(player_id).headers['ETag'])
+            patch = json.loads(response.data.decode('utf-8'))
+            self.assertEqual(apply_patch(old_game, patch), new_game)
+            self.assertLess(len(response.data), len(old.data))
+
+            # Nothing has changed since the revision the client has now
+            response = self.get(player_id, since=response.headers['ETag'].strip('"'))
+            self.assertEqual(json.loads(response.data.decode('utf-8')), [])
+
+    def test_unknown_revision(self):
+        """A revision that isn't kept gets the whole game"""
+        for since in ['40.2', 'nonsense']:
+            response = self.get('id1', since=since)
+            self.assertEqual(response.mimetype, 'application/json')
+            self.assertIn('hands', json.loads(response.data.decode('utf-8')))
@@ -0,0 +1,95 @@
+import json
+import unittest
+
+from flask import url_for
+
+from hanabi import create_app, db
+from hanabi.auth import seat_token
+from hanabi.migrate import index_players
+from hanabi.models import Game, Player
+
+
+class PlayersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['SECRET_KEY'] = 'secret'
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def new_game(self, **headers):
+        headers['Content-Type'] = 'application/json'
+        response = self.client.post(url_for('api.new_game'), headers=headers, data=json.dumps({'nickname': 'Ann'}))
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_my_games(self):
+        """Players who keep their id from game to game can find all their games"""
+        player_id = self.new_game().headers['id']
+        self.new_game()
+        self.new_game(id=player_id)
+        response = self.client.put(url_for('api.join_game', game_id=2), headers={'id': player_id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['id'], player_id)
+
+        response = self.client.get(url_for('api.get_my_games'), headers={'id': player_id})
+        self.assertEqual(response.status_code, 200)
+        games = json.loads(response.data.decode('utf-8'))
+        self.assertListEqual([(game['url'].split('/')[-1], game['seat']) for game in games],
+                             [('1', 0), ('2', 1), ('3', 0)])
+        self.assertListEqual([game['nickname'] for game in games], ['Ann', None, 'Ann'])
+        self.assertFalse(games[0]['started'])
+
+        # Nobody can sit in a game twice
+        response = self.client.put(url_for('api.join_game', game_id=2), headers={'id': player_id})
+        self.assertEqual(response.status_code, 500)
+
+        response = self.client.put(url_for('api.join_game', game_id=2), headers={'id': 'not valid!'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_seat_token(self):
+        """A signed token stands in for the id, for its own game only"""
+        response = self.new_game()
+        token = response.headers['token']
+        self.new_game()
+
+        response = self.client.get(url_for('api.get_specific_game', game_id=1), headers={'token': token})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(url_for('api.get_specific_game', game_id=2), headers={'token': token})
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get(url_for('api.get_specific_game', game_id=1), headers={'token': token[:-1] + '_'})
+        self.assertEqual(response.status_code, 403)
+
+        # The admin's token can start the game
+        response = self.client.put(url_for('api.join_game', game_id=1))
+        joined_token = response.headers['token']
+        response = self.client.put(url_for('api.start_game', game_id=1), headers={'token': joined_token})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.put(url_for('api.start_game', game_id=1), headers={'token': token})
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_secret_key(self):
+        """Without a key to sign them with, there are no tokens"""
+        self.app.config['SECRET_KEY'] = None
+        self.assertIsNone(seat_token(self.app, 1, 0))
+        self.assertNotIn('token', self.new_game().headers)
+
+    def test_index_players(self):
+        """Games from before the players table get their seats indexed"""
+        db.session.add_all([Game(players=['id1', 'id2']), Game(players=[]), Game(players=['id1'])])
+        db.session.commit()
+        db.session.execute(Player.__table__.delete())
+        db.session.commit()
+
+        self.assertEqual(index_players(batch_size=2), 2)
+        self.assertEqual(index_players(batch_size=2), 0)
+        self.assertListEqual([(player.game_id, player.seat) for player in Player.query.filter_by(token='id1')],
+                             [(1, 0), (3, 0)])
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from hanabi import create_app, db
+from hanabi.models import Game, LoggedMove, Move, Player
+from hanabi.reaper import reap, read_archive
+
+
+class ReaperTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.archive_dir = tempfile.mkdtemp()
+        self.app.config['ARCHIVE_PATH'] = os.path.join(self.archive_dir, 'games.jsonl.gz')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.archive_dir)
+
+    def finished_game(self, updated):
+        game = Game(players=[], public=True)
+        game.add_player('id1', 'Ann')
+        game.add_player('id2')
+        db.session.add(game)
+        db.session.commit()
+        game.start()
+        game.make_move(Move({'type': 'play', 'cardIndex': 0}, game.turn, 2))
+        game.final_score = 5
+        db.session.commit()
+        Game.query.filter_by(id=game.id).update({'updated': updated}, synchronize_session=False)
+        db.session.commit()
+        return game.id
+
+    def test_reap(self):
+        """Old finished games are archived, old unstarted games are deleted, and everything else is left alone"""
+        now = datetime.utcnow()
+        old = now - timedelta(days=30)
+        archived = [self.finished_game(old) for _ in range(3)]
+        recent = self.finished_game(now)
+
+        abandoned = Game(players=['id3'], updated=old)
+        waiting = Game(players=['id4'])
+        in_progress = Game(players=['id5', 'id6'], started=True, updated=old)
+        db.session.add_all([abandoned, waiting, in_progress])
+        db.session.commit()
+        db.session.add(Player(game_id=abandoned.id, seat=0, token='id3'))
+        db.session.commit()
+        kept = [recent, waiting.id, in_progress.id]
+        archived_or_deleted = archived + [abandoned.id]
+
+        stats = reap(self.app, batch_size=2, now=now)
+        self.assertEqual(stats['archived'], 3)
+        self.assertEqual(stats['deleted'], 1)
+
+        self.assertListEqual([game_id for game_id, in db.session.query(Game.id).order_by(Game.id)], kept)
+        self.assertEqual(LoggedMove.query.filter(LoggedMove.game_id.in_(archived)).count(), 0)
+        self.assertEqual(Player.query.filter(Player.game_id.in_(archived_or_deleted)).count(), 0)
+
+        records = list(read_archive(self.app.config['ARCHIVE_PATH']))
+        self.assertListEqual([record['id'] for record in records], archived)
+        self.assertListEqual(records[0]['players'], ['id1', 'id2'])
+        self.assertListEqual(records[0]['nicknames'], ['Ann', None])
+        self.assertEqual(records[0]['finalScore'], 5)
+        self.assertEqual(len(records[0]['moves']), 1)
+        self.assertIsNotNone(records[0]['seed'])
+
+        # Reaping again finds nothing more to do, and adds to the archive rather than replacing it
+        self.finished_game(old)
+        stats = reap(self.app, now=now)
+        self.assertEqual((stats['archived'], stats['deleted']), (1, 0))
+        self.assertEqual(len(list(read_archive(self.app.config['ARCHIVE_PATH']))), 4)
@@ -0,0 +1,122 @@
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from hanabi import create_app, db
+from hanabi.models import Game, GameState, LoggedMove, Move
+from hanabi.reaper import append_archive
+from hanabi.replay import ReplayWriter, analyze, export_replays, read_replays, replay_blocks
+from hanabi.simulation import CautiousPolicy
+
+
+def bot_game(seed, num_players=3, **modes):
+    """The move codes of a bot game dealt from a seed, and the state it ends in"""
+    state = GameState(num_players=num_players, **modes)
+    state.start(random.Random(seed))
+    bot = CautiousPolicy(random.Random(seed))
+    codes = []
+    while state.final_score is None:
+        move_json = bot.choose_move(state)
+        if move_json is None:
+            break
+        move = Move(move_json, state.turn, num_players)
+        state.make_move(move)
+        codes.append(move.encode())
+    return codes, state
+
+
+class ReplayTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'games.replay')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_games(self, count, block_games):
+        games = []
+        with open(self.path, 'wb') as f:
+            writer = ReplayWriter(f, block_games)
+            for seed in range(count):
+                codes, state = bot_game(seed, 2 + seed % 4, hard_mode=seed % 2 == 0)
+                games.append((seed + 1, seed, state.hard_mode, False, False, state.num_players, state.final_score or 0,
+                              3 - state.misfires, codes))
+                writer.write(*games[-1])
+            writer.close()
+        return games
+
+    def test_round_trip(self):
+        """Games come back as they were written, however the file is split into blocks"""
+        games = self.write_games(10, block_games=3)
+        replays = list(read_replays(self.path))
+        self.assertListEqual([replay[:8] + (list(replay.codes),) for replay in replays], games)
+
+        offsets = list(replay_blocks(self.path))
+        self.assertEqual(len(offsets), 4)
+        parts = [list(read_replays(self.path, offsets[0], offsets[2])), list(read_replays(self.path, offsets[2]))]
+        self.assertListEqual([replay.id for part in parts for replay in part], list(range(1, 11)))
+
+    def test_analyze(self):
+        """Stats are totalled across files and processes"""
+        games = self.write_games(12, block_games=2)
+        shutil.copy(self.path, self.path + '2')
+
+        summary = analyze([self.path, self.path + '2'], processes=2, blocks_per_task=2)
+        self.assertEqual(summary['games'], 24)
+        self.assertEqual(len(summary['modes']), 4)
+        self.assertEqual(sum(sum(mode['scores']) for mode in summary['modes']), 24)
+
+        mode = summary['modes'][0]
+        expected = [game for game in games if not game[2] and game[5] == 3]
+        self.assertEqual((mode['hardMode'], mode['players'], mode['games']), (False, 3, 2 * len(expected)))
+        self.assertAlmostEqual(mode['averageScore'], sum(game[6] for game in expected) / len(expected))
+        self.assertAlmostEqual(mode['averageHints'],
+                               sum(sum(1 for code in game[8] if code & 3 == 0) for game in expected) / len(expected))
+
+
+class ExportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.directory = tempfile.mkdtemp()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_export(self):
+        """Finished games are exported from the database and archives, once each"""
+        codes, state = bot_game(7, 2)
+        game = Game(players=['id1', 'id2'], seed=7, started=True, final_score=state.final_score,
+                    misfires=state.misfires)
+        db.session.add_all([game, Game(players=['id3'])])
+        db.session.commit()
+        db.session.add_all([LoggedMove(game_id=game.id, seq=seq, code=code) for seq, code in enumerate(codes, 1)])
+        db.session.commit()
+
+        archive = os.path.join(self.directory, 'games.jsonl.gz')
+        archived = {'id': 10, 'seed': 7, 'hardMode': False, 'perfectMode': False, 'chameleonMode': False,
+                    'players': ['id1', 'id2'], 'finalScore': state.final_score, 'misfires': 3 - state.misfires,
+                    'moves': codes}
+        append_archive(archive, [archived, dict(archived, id=game.id)])
+
+        output = io.BytesIO()
+        self.assertEqual(export_replays(ReplayWriter(output), [archive]), 2)
+
+        path = os.path.join(self.directory, 'games.replay')
+        with open(path, 'wb') as f:
+            f.write(output.getvalue())
+        replays = list(read_replays(path))
+        self.assertListEqual([replay.id for replay in replays], [game.id, 10])
+        for replay in replays:
+            self.assertEqual(replay.seed, 7)
+            self.assertEqual(replay.num_players, 2)
+            self.assertEqual(replay.misfires, 3 - state.misfires)
+            self.assertListEqual(list(replay.codes), codes)
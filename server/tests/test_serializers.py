@@ -0,0 +1,73 @@
+import random
+import unittest
+from uuid import uuid4
+
+from flask import json, jsonify, url_for
+
+from hanabi import create_app
+from hanabi.models import Game, GameState, Move
+from hanabi.serializers import CARD_JSON, _url_prefix, dumps, game_json, game_response, game_url
+from hanabi.simulation import RandomPolicy
+
+STATE_COLUMNS = ['started', 'deck', 'hands', 'discard', 'in_play', 'hints', 'misfires', 'score', 'final_score',
+                 'last_turn', 'last_player', 'turn']
+
+
+def sample_game(seed, num_players, moves, **settings):
+    """A game some random moves in, that isn't in the database"""
+    rng = random.Random(seed)
+    state = GameState(num_players=num_players, **settings)
+    state.start(rng)
+    policy = RandomPolicy(rng)
+    for _ in range(moves):
+        if state.final_score is not None:
+            break
+        state.make_move(Move(policy.choose_move(state), state.turn, num_players))
+
+    game = Game(id=seed + 1, players=[uuid4().hex for _ in range(num_players)], **settings)
+    for column, value in game.state_values(state, STATE_COLUMNS).items():
+        setattr(game, column, value)
+    game._replayed = True
+    return game
+
+
+class SerializersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.request_context = self.app.test_request_context(base_url='http://example.com/')
+        self.request_context.push()
+
+    def tearDown(self):
+        self.request_context.pop()
+
+    def test_cards(self):
+        """Every card with every hint about it is written up front"""
+        for cards in CARD_JSON.values():
+            self.assertEqual(len(cards), 6 * 5 * 7 * 2)
+
+    def test_game_json(self):
+        """Games come out exactly as flask would write them, from any seat"""
+        settings = [{}, {'chameleon_mode': True}, {'hard_mode': True, 'perfect_mode': True}]
+        for seed in range(30):
+            game = sample_game(seed, seed % 4 + 2, seed * 3, **settings[seed % 3])
+            for seat in range(len(game.players)):
+                self.assertEqual(game_json(game, seat), json.dumps(game.to_json(seat)))
+                self.assertEqual(game_response(game, seat), jsonify(game.to_json(seat)).get_data(as_text=True))
+
+                with self.app.test_request_context(headers={'X-Requested-With': 'XMLHttpRequest'}):
+                    self.assertEqual(game_response(game, seat), jsonify(game.to_json(seat)).get_data(as_text=True))
+
+    def test_game_url(self):
+        """Game urls follow the url root of the request, and only the most recent roots are kept"""
+        for i in range(200):
+            with self.app.test_request_context(base_url='http://%d.example.com/' % i):
+                self.assertEqual(game_url(5), url_for('api.get_specific_game', game_id=5, _external=True))
+        self.assertLessEqual(_url_prefix.cache_info().currsize, 64)
+
+    def test_dumps(self):
+        """Other payloads come out as jsonify would write them, pretty or not"""
+        data = [{'url': 'http://example.com/api/v1/games/1', 'players': 2, 'hardMode': False, 'public': None}, {}]
+        self.assertEqual(dumps(data), jsonify(data).get_data(as_text=True))
+
+        with self.app.test_request_context(headers={'X-Requested-With': 'XMLHttpRequest'}):
+            self.assertEqual(dumps(data), jsonify(data).get_data(as_text=True))
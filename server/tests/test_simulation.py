@@ -0,0 +1,42 @@
+import copy
+import io
+import json
+import random
+import unittest
+
+from hanabi.models import GameState, Move
+from hanabi.simulation import legal_moves, play_game, simulate
+
+
+class SimulationTestCase(unittest.TestCase):
+    def test_legal_moves_are_valid(self):
+        """Every move legal_moves offers can be made"""
+        for seed, settings in enumerate([{}, {'chameleon_mode': True}, {'hard_mode': True, 'perfect_mode': True}]):
+            random.seed(seed)
+            state = GameState(num_players=3, hints=5, **settings)
+            state.start()
+
+            moves = legal_moves(state)
+            self.assertTrue(moves)
+            for move_json in moves:
+                copy.deepcopy(state).make_move(Move(move_json, state.turn, 3))
+
+    def test_play_game(self):
+        """Games are played to the end and the same seed plays the same game"""
+        result = play_game(7, num_players=4, policy='random', chameleon_mode=True)
+
+        self.assertIsNotNone(result['finalScore'])
+        self.assertTrue(result['chameleonMode'])
+        self.assertEqual(result['players'], 4)
+        self.assertDictEqual(result, play_game(7, num_players=4, policy='random', chameleon_mode=True))
+
+    def test_simulate(self):
+        """Every game gets a line in the output"""
+        output = io.StringIO()
+        summary = simulate(16, output, num_players=2, all_modes=True, processes=2)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 16)
+        self.assertEqual(sorted(json.loads(line)['seed'] for line in lines), list(range(16)))
+        self.assertEqual(len(summary['modes']), 8)
+        self.assertEqual(sum(mode['games'] for mode in summary['modes']), 16)